@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0015_alert_dedup"
+down_revision = "0014_map_postgis"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Covers the webhook dedup lookup (nms_ref, category, opened_at >= cutoff)
+    op.create_index("idx_incidents_nms_ref_cat_opened", "incidents", ["nms_ref", "category", "opened_at"])
+    op.add_column("incidents", sa.Column("flap_count", sa.Integer(), server_default="0", nullable=False))
+
+
+def downgrade():
+    op.drop_column("incidents", "flap_count")
+    op.drop_index("idx_incidents_nms_ref_cat_opened", table_name="incidents")
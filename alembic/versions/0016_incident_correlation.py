@@ -0,0 +1,29 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0016_incident_correlation"
+down_revision = "0015_alert_dedup"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "incidents",
+        sa.Column(
+            "parent_incident_id",
+            sa.dialects.postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("incidents.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+    )
+    op.create_index("idx_incidents_parent", "incidents", ["parent_incident_id"])
+    # Correlation looks up recent problem incidents of the ONTs behind an element
+    op.create_index("idx_incidents_device_opened", "incidents", ["device_id", "opened_at"])
+
+
+def downgrade():
+    op.drop_index("idx_incidents_device_opened", table_name="incidents")
+    op.drop_index("idx_incidents_parent", table_name="incidents")
+    op.drop_column("incidents", "parent_incident_id")
@@ -0,0 +1,95 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0017_geo_lods"
+down_revision = "0016_incident_correlation"
+branch_labels = None
+depends_on = None
+
+
+# Keep in sync with app.services.geo_lod.LOD_TOLERANCES (degrees, coarsest first)
+DEFAULT_TOLERANCES = "array[0.005, 0.002, 0.0008, 0.0003, 0.0001]::float8[]"
+
+
+def upgrade():
+    # Dataset version per layer, bumped by any write to the source table; lod_version is the
+    # version the simplified geometries were built from
+    op.create_table(
+        "geo_dataset_versions",
+        sa.Column("layer", sa.String(), primary_key=True),
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+        sa.Column("lod_version", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.execute("insert into geo_dataset_versions (layer) values ('wards'), ('suburbs')")
+
+    op.execute(
+        """
+        create or replace function bump_geo_dataset_version() returns trigger language plpgsql as $$
+        begin
+          update geo_dataset_versions set version = version + 1, updated_at = now() where layer = TG_ARGV[0];
+          return null;
+        end $$
+        """
+    )
+    for layer in ("wards", "suburbs"):
+        op.execute(
+            f"""
+            create trigger trg_geo_{layer}_version
+            after insert or update or delete or truncate on geo_{layer}
+            for each statement execute function bump_geo_dataset_version('{layer}')
+            """
+        )
+
+    op.create_table(
+        "geo_simplified",
+        sa.Column("layer", sa.String(), primary_key=True),
+        sa.Column("level", sa.SmallInteger(), primary_key=True),
+        sa.Column("feature_id", sa.dialects.postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("geom", sa.types.UserDefinedType(), nullable=False),
+    )
+    op.execute("ALTER TABLE geo_simplified ALTER COLUMN geom TYPE geometry(MultiPolygon, 4326)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_geo_simplified_geom ON geo_simplified USING GIST(geom)")
+
+    # Callable from the API, the scheduler and scripts/import_sa_geographies.sh
+    op.execute(
+        f"""
+        create or replace function rebuild_geo_lods(p_layer text, p_tolerances float8[] default {DEFAULT_TOLERANCES})
+        returns integer language plpgsql as $$
+        declare
+          v bigint;
+          n integer;
+        begin
+          select version into v from geo_dataset_versions where layer = p_layer for update;
+          if not found then
+            raise exception 'unknown geo layer %', p_layer;
+          end if;
+          delete from geo_simplified where layer = p_layer;
+          execute format(
+            'insert into geo_simplified (layer, level, feature_id, geom)
+             select %L, s.level, s.id, s.geom
+             from (
+               select l.level - 1 as level, t.id,
+                      ST_Multi(ST_CollectionExtract(ST_SimplifyPreserveTopology(t.geom, l.tol), 3)) as geom
+               from %I t cross join unnest($1) with ordinality as l(tol, level)
+             ) s
+             where not ST_IsEmpty(s.geom)',
+            p_layer, 'geo_' || p_layer
+          ) using p_tolerances;
+          get diagnostics n = row_count;
+          update geo_dataset_versions set lod_version = v where layer = p_layer;
+          return n;
+        end $$
+        """
+    )
+
+
+def downgrade():
+    op.execute("drop function if exists rebuild_geo_lods(text, float8[])")
+    op.execute("DROP INDEX IF EXISTS idx_geo_simplified_geom")
+    op.drop_table("geo_simplified")
+    for layer in ("wards", "suburbs"):
+        op.execute(f"drop trigger if exists trg_geo_{layer}_version on geo_{layer}")
+    op.execute("drop function if exists bump_geo_dataset_version()")
+    op.drop_table("geo_dataset_versions")
@@ -0,0 +1,19 @@
+from alembic import op
+
+
+revision = "0018_map_keyset"
+down_revision = "0017_geo_lods"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset paging of /map/incidents walks (coalesce(opened_at, epoch), id) newest first
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_opened_keyset ON incidents "
+        "((coalesce(opened_at, 'epoch'::timestamptz)) DESC, id DESC) WHERE geom IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_incidents_opened_keyset")
@@ -0,0 +1,61 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0019_pon_map_versions"
+down_revision = "0018_map_keyset"
+branch_labels = None
+depends_on = None
+
+
+ASSET_TABLES = ("splice_closures", "poles", "cable_register")
+
+
+def upgrade():
+    # Change counter per PON for the asset map layer (ETag + cache key)
+    op.create_table(
+        "pon_map_versions",
+        sa.Column("pon_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("pons.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    # Statement-level with transition tables: a 100k-row import bumps each PON once
+    op.execute(
+        """
+        create or replace function bump_pon_map_version() returns trigger language plpgsql as $$
+        begin
+          if TG_OP in ('INSERT', 'UPDATE') then
+            insert into pon_map_versions (pon_id)
+            select distinct pon_id from new_rows where pon_id is not null
+            on conflict (pon_id) do update set version = pon_map_versions.version + 1, updated_at = now();
+          end if;
+          if TG_OP in ('UPDATE', 'DELETE') then
+            insert into pon_map_versions (pon_id)
+            select distinct pon_id from old_rows where pon_id is not null
+            on conflict (pon_id) do update set version = pon_map_versions.version + 1, updated_at = now();
+          end if;
+          return null;
+        end $$
+        """
+    )
+    for table in ASSET_TABLES:
+        op.execute(
+            f"create trigger trg_{table}_map_ins after insert on {table} "
+            f"referencing new table as new_rows for each statement execute function bump_pon_map_version()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_map_upd after update on {table} "
+            f"referencing old table as old_rows new table as new_rows for each statement execute function bump_pon_map_version()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_map_del after delete on {table} "
+            f"referencing old table as old_rows for each statement execute function bump_pon_map_version()"
+        )
+
+
+def downgrade():
+    for table in ASSET_TABLES:
+        for suffix in ("ins", "upd", "del"):
+            op.execute(f"drop trigger if exists trg_{table}_map_{suffix} on {table}")
+    op.execute("drop function if exists bump_pon_map_version()")
+    op.drop_table("pon_map_versions")
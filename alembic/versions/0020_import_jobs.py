@@ -0,0 +1,50 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0020_import_jobs"
+down_revision = "0019_pon_map_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.dialects.postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("layer", sa.String(), nullable=False),
+        sa.Column("pon_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("pons.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("filename", sa.String(), nullable=True),
+        sa.Column("s3_key", sa.String(), nullable=False),
+        sa.Column("bytes_total", sa.BigInteger(), nullable=True),
+        sa.Column("status", sa.String(), server_default="Queued", nullable=False),
+        # Features consumed from the file and committed; a resumed run skips this many
+        sa.Column("checkpoint", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("bytes_done", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("features_loaded", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("features_rejected", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("rejects_key", sa.String(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        # Rotated on every claim; a worker that lost its job to a reclaim stops at its next commit
+        sa.Column("lease", sa.dialects.postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("idx_import_jobs_status", "import_jobs", ["status", "created_at"])
+
+    op.create_table(
+        "import_job_rejects",
+        sa.Column("job_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("import_jobs.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("feature_index", sa.BigInteger(), primary_key=True),
+        sa.Column("error", sa.Text(), nullable=False),
+        sa.Column("feature", sa.dialects.postgresql.JSONB(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("import_job_rejects")
+    op.drop_index("idx_import_jobs_status", table_name="import_jobs")
+    op.drop_table("import_jobs")
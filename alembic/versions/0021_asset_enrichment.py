@@ -0,0 +1,27 @@
+from alembic import op
+
+
+revision = "0021_asset_enrichment"
+down_revision = "0020_import_jobs"
+branch_labels = None
+depends_on = None
+
+
+ASSET_TABLES = ("splice_closures", "poles", "cable_register")
+
+
+def upgrade():
+    # Filled by the import pipeline's spatial join so map and report queries need no ward lookup
+    for table in ASSET_TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS ward_id uuid REFERENCES geo_wards(id) ON DELETE SET NULL")
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS suburb_id uuid REFERENCES geo_suburbs(id) ON DELETE SET NULL")
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS within_pon boolean")
+        op.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ward ON {table} (ward_id)")
+
+
+def downgrade():
+    for table in ASSET_TABLES:
+        op.execute(f"DROP INDEX IF EXISTS idx_{table}_ward")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS within_pon")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS suburb_id")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS ward_id")
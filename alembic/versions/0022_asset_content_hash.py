@@ -0,0 +1,25 @@
+from alembic import op
+
+
+revision = "0022_asset_content_hash"
+down_revision = "0021_asset_enrichment"
+branch_labels = None
+depends_on = None
+
+
+ASSET_TABLES = ("splice_closures", "poles", "cable_register")
+
+
+def upgrade():
+    # md5 of the imported geometry + attributes; diff imports skip rows whose hash is unchanged
+    for table in ASSET_TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_hash text")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_poles_pon_code ON poles (pon_id, code)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_cable_register_pon_code ON cable_register (pon_id, cable_code)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_cable_register_pon_code")
+    op.execute("DROP INDEX IF EXISTS idx_poles_pon_code")
+    for table in ASSET_TABLES:
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS content_hash")
@@ -0,0 +1,27 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0023_otdr_sor"
+down_revision = "0022_asset_content_hash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Values decoded from the .sor file server-side
+    op.add_column("otdr_results", sa.Column("s3_key", sa.String(), nullable=True))
+    op.add_column("otdr_results", sa.Column("orl_db", sa.Numeric(5, 2), nullable=True))
+    op.add_column("otdr_results", sa.Column("fiber_length_m", sa.Numeric(10, 2), nullable=True))
+    op.add_column("otdr_results", sa.Column("pulse_width_ns", sa.Integer(), nullable=True))
+    op.add_column("otdr_events", sa.Column("event_no", sa.Integer(), nullable=True))
+    op.add_column("otdr_events", sa.Column("loss_db", sa.Numeric(6, 3), nullable=True))
+    op.add_column("otdr_events", sa.Column("reflectance_db", sa.Numeric(6, 2), nullable=True))
+    op.add_column("otdr_events", sa.Column("event_code", sa.String(), nullable=True))
+
+
+def downgrade():
+    for col in ("event_code", "reflectance_db", "loss_db", "event_no"):
+        op.drop_column("otdr_events", col)
+    for col in ("pulse_width_ns", "fiber_length_m", "orl_db", "s3_key"):
+        op.drop_column("otdr_results", col)
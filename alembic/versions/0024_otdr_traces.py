@@ -0,0 +1,23 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0024_otdr_traces"
+down_revision = "0023_otdr_sor"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored trace samples and preview levels (app.services.otdr_trace), keyed by S3 prefix
+    op.add_column("otdr_results", sa.Column("trace_key", sa.String(), nullable=True))
+    op.add_column("otdr_results", sa.Column("trace_points", sa.Integer(), nullable=True))
+    op.add_column("otdr_results", sa.Column("trace_levels", sa.Integer(), nullable=True))
+    op.add_column("otdr_results", sa.Column("trace_resolution_m", sa.Float(), nullable=True))
+    op.add_column("otdr_results", sa.Column("trace_scale", sa.Float(), nullable=True))
+    op.add_column("otdr_results", sa.Column("trace_bytes", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for col in ("trace_bytes", "trace_scale", "trace_resolution_m", "trace_levels", "trace_points", "trace_key"):
+        op.drop_column("otdr_results", col)
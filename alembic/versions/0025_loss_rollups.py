@@ -0,0 +1,133 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0025_loss_rollups"
+down_revision = "0024_otdr_traces"
+branch_labels = None
+depends_on = None
+
+
+# One fact row per (dimension, metric) of each result; {rows} is the source table or a
+# transition table. Budget comparisons use the plan's max_loss_db, not the client's `passed`.
+FACTS = {
+    "otdr_results": """
+        select d.dim, d.dim_id, 'otdr'::text as source, m.metric, m.value::float8 as value, r.passed,
+               coalesce(r.total_loss_db <= tp.max_loss_db, false) as within_budget
+        from {rows} r
+        left join test_plans tp on tp.id = r.test_plan_id
+        cross join lateral (values ('pon', tp.pon_id), ('smme', r.smme_id), ('tech', r.tech_id)) d(dim, dim_id)
+        cross join lateral (values ('total_loss', r.total_loss_db), ('splice_loss', r.max_splice_loss_db)) m(metric, value)
+        where d.dim_id is not null and m.value is not null
+    """,
+    "lspm_results": """
+        select d.dim, d.dim_id, 'lspm'::text as source, 'total_loss'::text as metric, r.measured_loss_db::float8 as value, r.passed,
+               coalesce(r.measured_loss_db <= tp.max_loss_db, false) as within_budget
+        from {rows} r
+        left join test_plans tp on tp.id = r.test_plan_id
+        cross join lateral (values ('pon', tp.pon_id), ('smme', r.smme_id), ('tech', r.tech_id)) d(dim, dim_id)
+        where d.dim_id is not null and r.measured_loss_db is not null
+    """,
+    "splices": """
+        select d.dim, d.dim_id, 'splice'::text as source, 'splice_loss'::text as metric, s.loss_db::float8 as value, s.passed,
+               s.passed as within_budget
+        from {rows} s
+        left join splice_trays st on st.id = s.tray_id
+        left join splice_closures c on c.id = st.closure_id
+        cross join lateral (values ('pon', c.pon_id), ('tech', s.tech_id)) d(dim, dim_id)
+        where d.dim_id is not null and s.loss_db is not null
+    """,
+}
+
+# Histogram bucket width per metric (dB); must match app.services.loss_rollups.BUCKET_DB
+BUCKET = "floor(value / case metric when 'splice_loss' then 0.01 else 0.1 end)::int"
+
+
+def _upsert(facts: str, sign: str) -> str:
+    return f"""
+        insert into test_loss_rollups as t (dim, source, metric, dim_id, bucket, n, passed, within_budget, sum_db, sum_sq_db)
+        select dim, source, metric, dim_id, {BUCKET}, {sign}count(*), {sign}count(*) filter (where passed),
+               {sign}count(*) filter (where within_budget), {sign}sum(value), {sign}sum(value * value)
+        from ({facts}) f
+        group by 1, 2, 3, 4, 5
+        on conflict (dim, source, metric, dim_id, bucket) do update
+        set n = t.n + excluded.n, passed = t.passed + excluded.passed, within_budget = t.within_budget + excluded.within_budget,
+            sum_db = t.sum_db + excluded.sum_db, sum_sq_db = t.sum_sq_db + excluded.sum_sq_db, updated_at = now()
+    """
+
+
+def upgrade():
+    for table in ("otdr_results", "lspm_results"):
+        op.add_column(table, sa.Column("smme_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("smmes.id", ondelete="SET NULL"), nullable=True))
+        op.add_column(table, sa.Column("tech_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True))
+
+    # Loss histograms per PON / SMME / technician, maintained by the triggers below
+    op.create_table(
+        "test_loss_rollups",
+        sa.Column("dim", sa.String(), nullable=False),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("metric", sa.String(), nullable=False),
+        sa.Column("dim_id", sa.dialects.postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("bucket", sa.Integer(), nullable=False),
+        sa.Column("n", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("passed", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("within_budget", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("sum_db", sa.Float(), server_default="0", nullable=False),
+        sa.Column("sum_sq_db", sa.Float(), server_default="0", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("dim", "source", "metric", "dim_id", "bucket"),
+    )
+
+    for table, facts in FACTS.items():
+        # Statement-level with transition tables: a bulk insert folds into one upsert per bucket
+        op.execute(
+            f"""
+            create or replace function rollup_{table}() returns trigger language plpgsql as $$
+            begin
+              if TG_OP in ('INSERT', 'UPDATE') then
+                {_upsert(facts.format(rows="new_rows"), "")};
+              end if;
+              if TG_OP in ('UPDATE', 'DELETE') then
+                {_upsert(facts.format(rows="old_rows"), "-")};
+              end if;
+              return null;
+            end $$
+            """
+        )
+        op.execute(
+            f"create trigger trg_{table}_rollup_ins after insert on {table} "
+            f"referencing new table as new_rows for each statement execute function rollup_{table}()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_rollup_upd after update on {table} "
+            f"referencing old table as old_rows new table as new_rows for each statement execute function rollup_{table}()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_rollup_del after delete on {table} "
+            f"referencing old table as old_rows for each statement execute function rollup_{table}()"
+        )
+
+    # Full recount: backfill here, and the nightly reconciliation (cascaded plan deletes
+    # reach the triggers after the plan row is gone, so their PON buckets would drift)
+    all_facts = " union all ".join(f.format(rows=t) for t, f in FACTS.items())
+    op.execute(
+        f"""
+        create or replace function rebuild_test_loss_rollups() returns void language sql as $$
+          delete from test_loss_rollups;
+          {_upsert(all_facts, "")};
+        $$
+        """
+    )
+    op.execute("select rebuild_test_loss_rollups()")
+
+
+def downgrade():
+    op.execute("drop function if exists rebuild_test_loss_rollups()")
+    for table in FACTS:
+        for suffix in ("ins", "upd", "del"):
+            op.execute(f"drop trigger if exists trg_{table}_rollup_{suffix} on {table}")
+        op.execute(f"drop function if exists rollup_{table}()")
+    op.drop_table("test_loss_rollups")
+    for table in ("lspm_results", "otdr_results"):
+        op.drop_column(table, "tech_id")
+        op.drop_column(table, "smme_id")
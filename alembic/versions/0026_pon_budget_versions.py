@@ -0,0 +1,74 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0026_pon_budget_versions"
+down_revision = "0025_loss_rollups"
+branch_labels = None
+depends_on = None
+
+
+# PONs touched by the changed rows of each input of the loss budget; {rows} is a transition table
+PON_OF = {
+    "splices": "select c.pon_id from {rows} s join splice_trays st on st.id = s.tray_id join splice_closures c on c.id = st.closure_id",
+    "splice_trays": "select c.pon_id from {rows} st join splice_closures c on c.id = st.closure_id",
+    "splice_closures": "select pon_id from {rows}",
+    "splitters": "select pon_id from {rows}",
+    "cable_register": "select pon_id from {rows}",
+    "topo_nodes": "select pon_id from {rows}",
+    "topo_edges": "select n.pon_id from {rows} e join topo_nodes n on n.id = e.a_id",
+    "test_plans": "select pon_id from {rows}",
+}
+
+
+def _bump(rows_sql: str) -> str:
+    return f"""
+        insert into pon_budget_versions (pon_id)
+        select distinct pon_id from ({rows_sql}) p where pon_id is not null
+        on conflict (pon_id) do update set version = pon_budget_versions.version + 1, updated_at = now()
+    """
+
+
+def upgrade():
+    # Change counter per PON for the cached loss budget (app.services.loss_budget)
+    op.create_table(
+        "pon_budget_versions",
+        sa.Column("pon_id", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("pons.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    for table, pon_sql in PON_OF.items():
+        op.execute(
+            f"""
+            create or replace function bump_budget_{table}() returns trigger language plpgsql as $$
+            begin
+              if TG_OP in ('INSERT', 'UPDATE') then
+                {_bump(pon_sql.format(rows="new_rows"))};
+              end if;
+              if TG_OP in ('UPDATE', 'DELETE') then
+                {_bump(pon_sql.format(rows="old_rows"))};
+              end if;
+              return null;
+            end $$
+            """
+        )
+        op.execute(
+            f"create trigger trg_{table}_budget_ins after insert on {table} "
+            f"referencing new table as new_rows for each statement execute function bump_budget_{table}()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_budget_upd after update on {table} "
+            f"referencing old table as old_rows new table as new_rows for each statement execute function bump_budget_{table}()"
+        )
+        op.execute(
+            f"create trigger trg_{table}_budget_del after delete on {table} "
+            f"referencing old table as old_rows for each statement execute function bump_budget_{table}()"
+        )
+
+
+def downgrade():
+    for table in PON_OF:
+        for suffix in ("ins", "upd", "del"):
+            op.execute(f"drop trigger if exists trg_{table}_budget_{suffix} on {table}")
+        op.execute(f"drop function if exists bump_budget_{table}()")
+    op.drop_table("pon_budget_versions")
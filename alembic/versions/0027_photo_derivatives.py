@@ -0,0 +1,24 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0027_photo_derivatives"
+down_revision = "0026_pon_budget_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Source object and generated thumbnail/preview (app.services.photo_derivatives)
+    op.add_column("photos", sa.Column("s3_key", sa.String(), nullable=True))
+    op.add_column("photos", sa.Column("thumb_url", sa.String(), nullable=True))
+    op.add_column("photos", sa.Column("preview_url", sa.String(), nullable=True))
+    op.add_column("photos", sa.Column("derivatives_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("photos", sa.Column("derivatives_error", sa.String(), nullable=True))
+    op.execute("create index idx_photos_derivatives_pending on photos (id) where s3_key is not null and derivatives_at is null")
+
+
+def downgrade():
+    op.execute("drop index if exists idx_photos_derivatives_pending")
+    for col in ("derivatives_error", "derivatives_at", "preview_url", "thumb_url", "s3_key"):
+        op.drop_column("photos", col)
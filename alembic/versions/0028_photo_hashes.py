@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0028_photo_hashes"
+down_revision = "0027_photo_derivatives"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # dHash with its four 16-bit chunks indexed for multi-index Hamming search (app.services.photo_hash)
+    op.add_column("photos", sa.Column("phash", sa.BigInteger(), nullable=True))
+    for j in range(4):
+        op.add_column("photos", sa.Column(f"phash_h{j}", sa.Integer(), nullable=True))
+        op.execute(f"create index idx_photos_phash_h{j} on photos (phash_h{j}) where phash is not null")
+    op.add_column(
+        "photos",
+        sa.Column("duplicate_of", sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey("photos.id", ondelete="SET NULL"), nullable=True),
+    )
+    op.add_column("photos", sa.Column("duplicate_distance", sa.SmallInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("photos", "duplicate_distance")
+    op.drop_column("photos", "duplicate_of")
+    for j in range(4):
+        op.execute(f"drop index if exists idx_photos_phash_h{j}")
+        op.drop_column("photos", f"phash_h{j}")
+    op.drop_column("photos", "phash")
@@ -0,0 +1,51 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0029_pon_geofence_dirty"
+down_revision = "0028_photo_hashes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Dirty tracking for nightly photo revalidation (app.services.photo_geofence): a geofence edit
+    # stamps geofence_changed_at, the job stamps geofence_checked_at once the PON's photos are redone
+    op.add_column("pons", sa.Column("geofence_changed_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("pons", sa.Column("geofence_checked_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute(
+        """
+        create or replace function stamp_pon_geofence() returns trigger language plpgsql as $$
+        begin
+          new.geofence_changed_at := now();
+          return new;
+        end $$
+        """
+    )
+    op.execute(
+        """
+        create trigger trg_pons_geofence_changed before update of center_lat, center_lng, geofence_radius_m, geofence_geom on pons
+        for each row
+        when (old.center_lat is distinct from new.center_lat
+              or old.center_lng is distinct from new.center_lng
+              or old.geofence_radius_m is distinct from new.geofence_radius_m
+              or old.geofence_geom is distinct from new.geofence_geom)
+        execute function stamp_pon_geofence()
+        """
+    )
+    op.execute(
+        "create index idx_pons_geofence_dirty on pons (geofence_changed_at) "
+        "where geofence_changed_at is not null and (geofence_checked_at is null or geofence_checked_at < geofence_changed_at)"
+    )
+    op.create_index("idx_photos_pon_id", "photos", ["pon_id"])
+    # The old job never recomputed anything: reconcile every PON with photos once
+    op.execute("update pons set geofence_changed_at = now() where id in (select distinct pon_id from photos where pon_id is not null)")
+
+
+def downgrade():
+    op.drop_index("idx_photos_pon_id", table_name="photos")
+    op.execute("drop index if exists idx_pons_geofence_dirty")
+    op.execute("drop trigger if exists trg_pons_geofence_changed on pons")
+    op.execute("drop function if exists stamp_pon_geofence()")
+    op.drop_column("pons", "geofence_checked_at")
+    op.drop_column("pons", "geofence_changed_at")
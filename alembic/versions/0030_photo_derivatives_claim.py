@@ -0,0 +1,17 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0030_photo_derivatives_claim"
+down_revision = "0029_pon_geofence_dirty"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Set when a worker (scheduler job or registration background task) takes a photo for rendering
+    op.add_column("photos", sa.Column("derivatives_claimed_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("photos", "derivatives_claimed_at")
@@ -0,0 +1,27 @@
+from alembic import op
+
+
+revision = "0031_loss_rollups_rebuild_lock"
+down_revision = "0030_photo_derivatives_claim"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The recount runs under an exclusive lock: result writes wait for it at their rollup
+    # trigger, so a write is either counted by the recount or applied on top of it, never both
+    # (statements of a SQL function each take a fresh snapshot, after the lock is granted)
+    op.execute("alter function rebuild_test_loss_rollups() rename to rebuild_test_loss_rollups_unlocked")
+    op.execute(
+        """
+        create function rebuild_test_loss_rollups() returns void language sql as $$
+          lock table test_loss_rollups in exclusive mode;
+          select rebuild_test_loss_rollups_unlocked();
+        $$
+        """
+    )
+
+
+def downgrade():
+    op.execute("drop function if exists rebuild_test_loss_rollups()")
+    op.execute("alter function rebuild_test_loss_rollups_unlocked() rename to rebuild_test_loss_rollups")
@@ -0,0 +1,16 @@
+from alembic import op
+
+
+revision = "0032_photo_derivatives_retry"
+down_revision = "0031_loss_rollups_rebuild_lock"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Failed renders no longer count as done: put those recorded so far back in the pending queue
+    op.execute("update photos set derivatives_at = null where derivatives_error is not null")
+
+
+def downgrade():
+    op.execute("update photos set derivatives_at = now() where derivatives_error is not null and derivatives_at is null")
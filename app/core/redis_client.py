@@ -1,19 +1,38 @@
 import os
-import redis.asyncio as redis
+import redis
+import redis.asyncio as aioredis
 
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
-_redis: redis.Redis | None = None
+_redis: aioredis.Redis | None = None
+_redis_sync: redis.Redis | None = None
+_redis_binary: redis.Redis | None = None
 
 
-async def get_redis() -> redis.Redis:
+async def get_redis() -> aioredis.Redis:
     global _redis
     if _redis is None:
-        _redis = redis.from_url(REDIS_URL, decode_responses=True)
+        _redis = aioredis.from_url(REDIS_URL, decode_responses=True)
     return _redis
 
 
+def get_redis_sync() -> redis.Redis:
+    # For scheduler jobs and sync handlers running in the threadpool
+    global _redis_sync
+    if _redis_sync is None:
+        _redis_sync = redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_sync
+
+
+def get_redis_binary() -> redis.Redis:
+    # Sync client returning raw bytes, for cached binary payloads (vector tiles)
+    global _redis_binary
+    if _redis_binary is None:
+        _redis_binary = redis.from_url(REDIS_URL, decode_responses=False)
+    return _redis_binary
+
+
 async def ping_redis() -> bool:
     r = await get_redis()
     try:
@@ -21,4 +40,3 @@ async def ping_redis() -> bool:
         return bool(pong)
     except Exception:
         return False
-
@@ -24,6 +24,7 @@ from app.routers import splices as splices_router
 from app.routers import tests_plans as plans_router
 from app.routers import tests_otdr as otdr_router
 from app.routers import tests_lspm as lspm_router
+from app.routers import test_analytics as analytics_router
 from app.routers import work_queue as workq_router
 from app.routers import topology as topo_router
 from app.routers import maintenance as maint_router
@@ -35,6 +36,7 @@ from app.routers import users_location as users_loc_router
 from app.routers import photos_register_geofence as photos_geo_router
 from app.routers import invoices as invoices_router
 from app.scheduler import init_jobs
+from app.services.ingest_queue import start_inprocess_workers, stop_inprocess_workers
 from app.core.health import router as health_router
 from app.core.limiter import env_ip_limiter
 from app.core.deps import get_db_session
@@ -76,6 +78,7 @@ app.include_router(splices_router.router)
 app.include_router(plans_router.router)
 app.include_router(otdr_router.router)
 app.include_router(lspm_router.router)
+app.include_router(analytics_router.router)
 app.include_router(
     nms_router.router,
     dependencies=[Depends(env_ip_limiter())],
@@ -115,6 +118,17 @@ async def _log_jobs():
                 time.sleep(2)
 
 
+@app.on_event("startup")
+async def _start_ingest_workers():
+    # No-op unless WEBHOOK_INGEST_MODE=queue and INGEST_WORKER_INPROCESS is enabled
+    start_inprocess_workers()
+
+
+@app.on_event("shutdown")
+async def _stop_ingest_workers():
+    await stop_inprocess_workers()
+
+
 @app.middleware("http")
 async def add_org_to_state(request: Request, call_next):
     # Read org id from header to support per-org rate limiting
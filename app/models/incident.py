@@ -25,6 +25,8 @@ class Incident(Base):
     assigned_org_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id", ondelete="SET NULL"), nullable=True)
     severity_sla_minutes = Column(Integer, nullable=True)
     due_at = Column(DateTime(timezone=True), nullable=True)
+    flap_count = Column(Integer, nullable=False, default=0, server_default="0")
+    parent_incident_id = Column(UUID(as_uuid=True), ForeignKey("incidents.id", ondelete="SET NULL"), nullable=True)
 
 
 class MaintWindow(Base):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Numeric, ForeignKey
+from sqlalchemy import Column, String, DateTime, Boolean, Numeric, ForeignKey, BigInteger, Integer, SmallInteger
 from sqlalchemy.dialects.postgresql import UUID
 from app.core.deps import Base
 
@@ -15,4 +15,17 @@ class Photo(Base):
     exif_ok = Column(Boolean, nullable=False, default=False, server_default="false")
     within_geofence = Column(Boolean, nullable=False, default=False, server_default="false")
     asset_code = Column(String, nullable=True)
+    s3_key = Column(String, nullable=True)
+    thumb_url = Column(String, nullable=True)
+    preview_url = Column(String, nullable=True)
+    derivatives_at = Column(DateTime(timezone=True), nullable=True)
+    derivatives_error = Column(String, nullable=True)
+    derivatives_claimed_at = Column(DateTime(timezone=True), nullable=True)
+    phash = Column(BigInteger, nullable=True)
+    phash_h0 = Column(Integer, nullable=True)
+    phash_h1 = Column(Integer, nullable=True)
+    phash_h2 = Column(Integer, nullable=True)
+    phash_h3 = Column(Integer, nullable=True)
+    duplicate_of = Column(UUID(as_uuid=True), ForeignKey("photos.id", ondelete="SET NULL"), nullable=True)
+    duplicate_distance = Column(SmallInteger, nullable=True)
 
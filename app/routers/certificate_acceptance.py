@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Optional, List
@@ -27,12 +28,15 @@ class CertificateAcceptanceIn(BaseModel):
 
 @router.post("", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE"))])
 def create_certificate_acceptance(payload: CertificateAcceptanceIn, db: Session = Depends(get_db)):
-    # Guard: require at least one validated photo (EXIF and geofence OK) for the PON
+    # Guard: require at least one validated photo (EXIF and geofence OK, hashed and not a duplicate) for the PON;
+    # photos recorded before s3_key was cannot be hashed and skip the duplicate check
     has_valid_photo = (
         db.query(Photo)
         .filter(Photo.pon_id == UUID(payload.pon_id))
         .filter(Photo.exif_ok == True)
         .filter(Photo.within_geofence == True)
+        .filter(or_(Photo.phash.isnot(None), Photo.s3_key.is_(None)))
+        .filter(Photo.duplicate_of.is_(None))
         .first()
         is not None
     )
@@ -6,6 +6,7 @@ from uuid import UUID, uuid4
 from pydantic import BaseModel, Field
 from app.core.deps import get_db, require_roles
 from app.core.limiter import env_org_limiter
+from app.services.map_tiles import bump_layers
 
 
 router = APIRouter(prefix="/closures", tags=["closures"])
@@ -44,6 +45,7 @@ def create_closure(payload: ClosureIn, db: Session = Depends(get_db)):
         },
     )
     db.commit()
+    bump_layers("closures")
     return {"ok": True, "id": cid}
 
 
@@ -88,5 +90,6 @@ def update_closure(closure_id: str, payload: ClosurePatch, db: Session = Depends
         raise HTTPException(400, "No fields to update")
     db.execute(text(f"update splice_closures set {', '.join(sets)} where id = :id"), params)
     db.commit()
+    bump_layers("closures")
     return {"ok": True}
 
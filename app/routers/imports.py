@@ -1,74 +1,113 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from typing import Optional
-import json
+from uuid import UUID
 
-from app.core.deps import get_db, require_roles
+from app.core.deps import get_db, get_db_session, require_roles
+from app.services import geo_lod, import_jobs, s3
+from app.services.geojson_import import IMPORT_LAYERS
+from app.services.import_pipeline import load_stream
+from app.services.map_tiles import LAYERS as TILE_LAYERS, bump_layers
 
 
 router = APIRouter(prefix="/imports", tags=["imports"])
 
 
 @router.post("/geojson", dependencies=[Depends(require_roles("ADMIN", "PM"))])
-async def import_geojson(
+def import_geojson(
+    background: BackgroundTasks,
     layer: str = Form(..., description="one of: wards, suburbs, poles, closures, cables"),
     pon_id: Optional[str] = Form(None),
+    mode: str = Form("append", description="append, or diff: apply only inserts/changes/deletes by asset code"),
+    delete_missing: bool = Form(False, description="diff mode: also delete Planned assets missing from the file"),
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
-    try:
-        data = json.loads((await file.read()).decode("utf-8"))
-    except Exception:
-        raise HTTPException(400, "Invalid JSON")
-
-    if data.get("type") != "FeatureCollection":
-        raise HTTPException(400, "Expected GeoJSON FeatureCollection")
-
-    count = 0
-    if layer == "wards":
-        for f in data.get("features", []):
-            name = f.get("properties", {}).get("name") or f.get("properties", {}).get("WARD_NAME")
-            code = f.get("properties", {}).get("code") or f.get("properties", {}).get("WARD_NO")
-            geom = json.dumps(f.get("geometry"))
-            db.execute(text("insert into geo_wards (id, name, code, geom) values (gen_random_uuid(), :n, :c, ST_SetSRID(ST_GeomFromGeoJSON(:g), 4326))"), {"n": name, "c": code, "g": geom})
-            count += 1
-    elif layer == "suburbs":
-        for f in data.get("features", []):
-            name = f.get("properties", {}).get("name") or f.get("properties", {}).get("SUB_PLACE")
-            ward_id = f.get("properties", {}).get("ward_id")
-            geom = json.dumps(f.get("geometry"))
-            db.execute(text("insert into geo_suburbs (id, name, ward_id, geom) values (gen_random_uuid(), :n, :w, ST_SetSRID(ST_GeomFromGeoJSON(:g), 4326))"), {"n": name, "w": ward_id, "g": geom})
-            count += 1
-    elif layer == "closures":
-        if not pon_id:
-            raise HTTPException(400, "pon_id required for closures import")
-        for f in data.get("features", []):
-            code = f.get("properties", {}).get("code")
-            geom = json.dumps(f.get("geometry"))
-            db.execute(text("insert into splice_closures (id, pon_id, code, geom, status) values (gen_random_uuid(), :p, :c, ST_SetSRID(ST_GeomFromGeoJSON(:g), 4326), 'Planned') on conflict (code) do update set geom = excluded.geom"), {"p": pon_id, "c": code, "g": geom})
-            count += 1
-    elif layer == "poles":
-        if not pon_id:
-            raise HTTPException(400, "pon_id required for poles import")
-        for f in data.get("features", []):
-            code = f.get("properties", {}).get("code")
-            geom = json.dumps(f.get("geometry"))
-            db.execute(text("insert into poles (id, pon_id, code, geom, status) values (gen_random_uuid(), :p, :c, ST_SetSRID(ST_GeomFromGeoJSON(:g), 4326), 'Planned')"), {"p": pon_id, "c": code, "g": geom})
-            count += 1
-    elif layer == "cables":
-        if not pon_id:
-            raise HTTPException(400, "pon_id required for cables import")
-        for f in data.get("features", []):
-            code = f.get("properties", {}).get("cable_code") or f.get("properties", {}).get("code")
-            cable_type = f.get("properties", {}).get("type") or "trench"
-            chainage = f.get("properties", {}).get("chainage_m")
-            geom = json.dumps(f.get("geometry"))
-            db.execute(text("insert into cable_register (id, pon_id, cable_code, type, chainage_m, geom) values (gen_random_uuid(), :p, :c, :t, :m, ST_SetSRID(ST_GeomFromGeoJSON(:g), 4326)) on conflict do nothing"), {"p": pon_id, "c": code, "t": cable_type, "m": chainage, "g": geom})
-            count += 1
-    else:
+    spec = IMPORT_LAYERS.get(layer)
+    if spec is None:
         raise HTTPException(400, "Unsupported layer")
+    if spec.needs_pon and not pon_id:
+        raise HTTPException(400, f"pon_id required for {layer} import")
+    if mode not in ("append", "diff"):
+        raise HTTPException(400, "mode must be append or diff")
+    if mode == "diff" and spec.diff is None:
+        raise HTTPException(400, f"diff mode not supported for {layer}")
+
+    # Features are parsed off the spooled upload, validated on the worker pool and COPYed into staging
+    try:
+        result = load_stream(db, layer, file.file, pon_id, diff=mode == "diff", delete_missing=delete_missing)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(400, f"Invalid GeoJSON: {e}")
 
     db.commit()
-    return {"ok": True, "imported": count}
+    changes = result.get("changes")
+    if layer in TILE_LAYERS and (changes is None or any(changes[k] for k in ("inserted", "updated", "deleted"))):
+        bump_layers(layer)
+    if layer in geo_lod.GEO_LAYERS:
+        background.add_task(_rebuild_lods, layer)
+    rejected = result["rejected"]
+    out = {
+        "ok": True,
+        "imported": result["loaded"],
+        "repaired": result["repaired"],
+        "rejected": len(rejected),
+        "rejects": [{"index": i, "reason": r} for i, r in rejected[:100]],
+    }
+    if changes is not None:
+        out["changes"] = changes
+    return out
+
+
+@router.post("/jobs", status_code=202, dependencies=[Depends(require_roles("ADMIN", "PM"))])
+def create_import_job(
+    background: BackgroundTasks,
+    layer: str = Form(..., description="one of: wards, suburbs, poles, closures, cables"),
+    pon_id: Optional[str] = Form(None),
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    spec = IMPORT_LAYERS.get(layer)
+    if spec is None:
+        raise HTTPException(400, "Unsupported layer")
+    if spec.needs_pon and not pon_id:
+        raise HTTPException(400, f"pon_id required for {layer} import")
+    job = import_jobs.create_job(db, layer, pon_id, file.file, file.filename)
+    # Start right away instead of waiting for the scheduler tick
+    background.add_task(import_jobs.run_pending, 1)
+    return job
+
+
+def _job_or_404(db: Session, job_id: str):
+    try:
+        UUID(job_id)
+    except ValueError:
+        raise HTTPException(404, "Import job not found")
+    job = import_jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(404, "Import job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_roles("ADMIN", "PM"))])
+def get_import_job(job_id: str, db: Session = Depends(get_db)):
+    return _job_or_404(db, job_id)
+
+
+@router.get("/jobs/{job_id}/rejects", dependencies=[Depends(require_roles("ADMIN", "PM"))])
+def get_import_job_rejects(job_id: str, db: Session = Depends(get_db)):
+    job = _job_or_404(db, job_id)
+    if not job["rejects_key"]:
+        raise HTTPException(404, "No rejects for this job")
+    body = s3.open_object(job["rejects_key"])
+    return StreamingResponse(
+        body.iter_chunks(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{job_id}-rejects.ndjson"'},
+    )
+
 
+def _rebuild_lods(layer: str) -> None:
+    with get_db_session() as db:
+        geo_lod.rebuild(db, layer)
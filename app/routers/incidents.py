@@ -13,12 +13,19 @@ router = APIRouter(prefix="/incidents", tags=["incidents"])
 
 
 @router.get("", response_model=List[IncidentOut])
-def list_incidents(db: Session = Depends(get_db), status: Optional[str] = Query(None), device_id: Optional[str] = Query(None)):
+def list_incidents(
+    db: Session = Depends(get_db),
+    status: Optional[str] = Query(None),
+    device_id: Optional[str] = Query(None),
+    parent_id: Optional[str] = Query(None),
+):
     q = db.query(Incident)
     if status:
         q = q.filter(Incident.status == status)
     if device_id:
         q = q.filter(Incident.device_id == UUID(device_id))
+    if parent_id:
+        q = q.filter(Incident.parent_incident_id == UUID(parent_id))
     return q.order_by(Incident.opened_at.desc()).all()
 
 
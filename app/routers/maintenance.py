@@ -6,6 +6,7 @@ from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.core.deps import get_db, require_roles
+from app.services.maint_index import maint_index
 
 
 router = APIRouter(prefix="/maint-windows", tags=["maintenance"])
@@ -41,5 +42,12 @@ def create_window(payload: MaintIn, db: Session = Depends(get_db)):
         },
     )
     db.commit()
+    # Alert suppression reads an in-process index; other workers pick this up on TTL
+    maint_index.invalidate()
     return {"ok": True, "id": wid}
 
+
+@router.get("/index-stats", dependencies=[Depends(require_roles("ADMIN", "NOC"))])
+def index_stats():
+    return maint_index.stats()
+
@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, Query
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Any, Dict, List, Optional
 
 from app.core.deps import get_db, require_roles
+from app.services import geo_lod, pon_map
+from app.services.geojson_stream import decode_cursor, feature_sql, stream_feature_collection
+from app.services.map_cluster import ASSET_TYPES, INCIDENT_SEVERITIES, cell_size, cluster_features
+from app.services.map_tiles import LAYERS, MVT_MAX_ZOOM, get_tile
 
 
 router = APIRouter(prefix="/map", tags=["map"])
 
+MAP_MAX_PAGE = int(os.getenv("MAP_MAX_PAGE", "50000"))
+
 
 @router.get("/tiles")
 def get_style_json(token: Optional[str] = Query(None)) -> Dict[str, Any]:
@@ -32,120 +42,138 @@ def get_style_json(token: Optional[str] = Query(None)) -> Dict[str, Any]:
     return style
 
 
+@router.get("/tiles/{layer}/{z}/{x}/{y}.mvt", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
+def vector_tile(layer: str, z: int, x: int, y: int, request: Request, db: Session = Depends(get_db)) -> Response:
+    if layer not in LAYERS:
+        raise HTTPException(404, "Unknown layer")
+    if not (0 <= z <= MVT_MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(400, "Tile out of range")
+    tile, etag = get_tile(db, layer, z, x, y)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={min(LAYERS[layer].ttl_sec, 300)}"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    if not tile:
+        return Response(status_code=204, headers=headers)
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+
+def _geo_layer(layer: str, request: Request, db: Session, zoom: Optional[float], tolerance: Optional[float], bbox: Optional[str]) -> Response:
+    level = geo_lod.level_for(zoom=zoom, tolerance=tolerance)
+    if bbox:
+        try:
+            box = [float(v) for v in bbox.split(",")]
+        except ValueError:
+            raise HTTPException(400, "Invalid bbox")
+        if len(box) != 4:
+            raise HTTPException(400, "Invalid bbox")
+        version, lod_version = geo_lod.dataset_version(db, layer)
+        payload = geo_lod.feature_collection(db, layer, level, box, lods_ready=lod_version == version)
+        return Response(content=payload, media_type="application/json")
+    payload, etag = geo_lod.get_feature_collection(db, layer, level)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
 @router.get("/wards", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
-def wards_geojson(db: Session = Depends(get_db)) -> Dict[str, Any]:
-    rows = (
-        db.execute(text("select id, name, code, ST_AsGeoJSON(geom)::json as geom from geo_wards limit 2000"))
-        .mappings()
-        .all()
-    )
-    return {
-        "type": "FeatureCollection",
-        "features": [
-            {"type": "Feature", "id": str(r["id"]), "properties": {"name": r["name"], "code": r["code"]}, "geometry": r["geom"]}
-            for r in rows
-        ],
-    }
+def wards_geojson(
+    request: Request,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="map zoom; picks a simplified level of detail"),
+    tolerance: Optional[float] = Query(None, gt=0, description="max simplification error in degrees"),
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon,lat (WGS84)"),
+    db: Session = Depends(get_db),
+) -> Response:
+    return _geo_layer("wards", request, db, zoom, tolerance, bbox)
+
+
+@router.get("/suburbs", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
+def suburbs_geojson(
+    request: Request,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="map zoom; picks a simplified level of detail"),
+    tolerance: Optional[float] = Query(None, gt=0, description="max simplification error in degrees"),
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon,lat (WGS84)"),
+    db: Session = Depends(get_db),
+) -> Response:
+    return _geo_layer("suburbs", request, db, zoom, tolerance, bbox)
 
 
 @router.get("/pon/{pon_id}/assets", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
-def pon_assets_geojson(pon_id: str, db: Session = Depends(get_db)) -> Dict[str, Any]:
-    # Closures
-    closures = (
-        db.execute(
-            text(
-                "select id, code, status, ST_AsGeoJSON(geom)::json as geom from splice_closures where pon_id = :p"
-            ),
-            {"p": pon_id},
-        )
-        .mappings()
-        .all()
-    )
-
-    # Poles
-    poles = (
-        db.execute(
-            text("select id, code, status, ST_AsGeoJSON(geom)::json as geom from poles where pon_id = :p"),
-            {"p": pon_id},
-        )
-        .mappings()
-        .all()
-    )
-
-    # Cables
-    cables = (
-        db.execute(
-            text(
-                "select id, cable_code, type, chainage_m, ST_AsGeoJSON(geom)::json as geom from cable_register where pon_id = :p and geom is not null"
-            ),
-            {"p": pon_id},
-        )
-        .mappings()
-        .all()
-    )
-
-    feats: List[Dict[str, Any]] = []
-    feats += [
-        {
-            "type": "Feature",
-            "id": str(r["id"]),
-            "properties": {"type": "closure", "code": r["code"], "status": r["status"]},
-            "geometry": r["geom"],
-        }
-        for r in closures
-        if r["geom"]
-    ]
-    feats += [
-        {
-            "type": "Feature",
-            "id": str(r["id"]),
-            "properties": {"type": "pole", "code": r["code"], "status": r["status"]},
-            "geometry": r["geom"],
-        }
-        for r in poles
-        if r["geom"]
-    ]
-    feats += [
-        {
-            "type": "Feature",
-            "id": str(r["id"]),
-            "properties": {"type": r["type"] or "trench", "code": r["cable_code"], "chainage_m": r["chainage_m"]},
-            "geometry": r["geom"],
-        }
-        for r in cables
-    ]
-
-    return {"type": "FeatureCollection", "features": feats}
+def pon_assets_geojson(
+    pon_id: str,
+    request: Request,
+    cluster: bool = Query(False, description="group closures and poles into grid clusters"),
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    db: Session = Depends(get_db),
+) -> Response:
+    if cluster:
+        source = """
+            select id, geom, 'closure' as cat from splice_closures where pon_id = :p
+            union all
+            select id, geom, 'pole' as cat from poles where pon_id = :p
+        """
+        feats = cluster_features(db, source, {"p": pon_id}, ASSET_TYPES, cell_size(zoom if zoom is not None else 16))
+        cables = db.execute(
+            text(f"select {pon_map.CABLE_FEATURE} as feature from cable_register t where t.pon_id = :p and t.geom is not null"), {"p": pon_id}
+        ).scalars()
+        feats += [json.loads(c) for c in cables]
+        return JSONResponse({"type": "FeatureCollection", "features": feats})
+
+    payload, etag = pon_map.get_assets(db, pon_id)
+    # Field clients revalidate on every load; unchanged PONs answer with an empty 304
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
+_INCIDENT_KEY = "coalesce(t.opened_at, 'epoch'::timestamptz)"
 
 
 @router.get("/incidents", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
 def incidents_geojson(
     bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon,lat (WGS84)"),
     since: Optional[str] = Query(None),
+    cluster: bool = Query(False, description="group incidents into grid clusters with severity counts"),
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    limit: int = Query(2000, ge=1, le=MAP_MAX_PAGE, description="features per page, newest first"),
+    after: Optional[str] = Query(None, description="`next` cursor from the previous page"),
     db: Session = Depends(get_db),
-) -> Dict[str, Any]:
+) -> Response:
     clauses: List[str] = []
     params: Dict[str, Any] = {}
+    box: Optional[List[float]] = None
     if bbox:
         # bbox is in lon/lat, WGS84
-        clauses.append("ST_Intersects(geom, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326))")
-        minx, miny, maxx, maxy = [float(x) for x in bbox.split(",")]
+        clauses.append("ST_Intersects(t.geom, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326))")
+        box = [float(x) for x in bbox.split(",")]
+        minx, miny, maxx, maxy = box
         params.update({"minx": minx, "miny": miny, "maxx": maxx, "maxy": maxy})
     if since:
-        clauses.append("coalesce(opened_at, created_at) >= :since")
+        clauses.append("t.opened_at >= cast(:since as timestamptz)")
         params["since"] = since
-    where_sql = (" where " + " and ".join(clauses)) if clauses else ""
-    rows = (
-        db.execute(text(f"select id, category, severity, status, ST_AsGeoJSON(geom)::json as geom from incidents{where_sql} order by opened_at desc nulls last limit 2000"), params)
-        .mappings()
-        .all()
-    )
-    return {
-        "type": "FeatureCollection",
-        "features": [
-            {"type": "Feature", "id": str(r["id"]), "properties": {"category": r["category"], "severity": r["severity"], "status": r["status"]}, "geometry": r["geom"]}
-            for r in rows
-            if r["geom"]
-        ],
-    }
-
+    if cluster:
+        # Every incident in the view is counted; paging does not apply
+        where_sql = (" where " + " and ".join(clauses)) if clauses else ""
+        source = f"select t.id, t.geom, t.severity as cat from incidents t{where_sql}"
+        feats = cluster_features(db, source, params, INCIDENT_SEVERITIES, cell_size(zoom, box))
+        return JSONResponse({"type": "FeatureCollection", "features": feats})
+
+    clauses.append("t.geom is not null")
+    if after:
+        try:
+            after_ts, after_id = decode_cursor(after, 2)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        clauses.append(f"({_INCIDENT_KEY}, t.id) < (cast(:after_ts as timestamptz), cast(:after_id as uuid))")
+        params.update({"after_ts": after_ts, "after_id": after_id})
+    params["lim"] = limit + 1
+    feature = feature_sql("t.id", "json_build_object('category', t.category, 'severity', t.severity, 'status', t.status)", "t.geom")
+    sql = f"""
+        select {feature} as feature, {_INCIDENT_KEY} as k_ts, t.id as k_id
+        from incidents t
+        where {" and ".join(clauses)}
+        order by {_INCIDENT_KEY} desc, t.id desc
+        limit :lim
+    """
+    return StreamingResponse(stream_feature_collection([(sql, params)], limit=limit, key_columns=2), media_type="application/json")
@@ -1,17 +1,20 @@
 import hmac
 import hashlib
+import json
 import os
-from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List
 from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from app.core.deps import get_db
-from app.models.incident import Incident, MaintWindow
-from app.models.device import Device
+from app.core.deps import get_db, require_roles
+from app.services import ingest_queue
+from app.services.alerts import ingest_alerts, normalize_librenms, normalize_zabbix
 
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
+BATCH_MAX = int(os.getenv("NMS_BATCH_MAX", "1000"))
+
 
 # LibreNMS configured alert transport
 # Example JSON fields used: hostname, state, severity, rule, alert_id, timestamp, msg
@@ -36,53 +39,12 @@ def _verify_hmac(request: Request, body: bytes):
         raise HTTPException(401, "Invalid signature")
 
 
-def _dedup_recent(db: Session, nms_ref: str, category: str, device_id):
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=30)
-    existing = (
-        db.query(Incident)
-        .filter(and_(Incident.nms_ref == nms_ref, Incident.category == category, Incident.opened_at >= cutoff))
-        .first()
-    )
-    return existing
-
-
-def _is_suppressed(db: Session, device: Device | None) -> bool:
-    now = datetime.now(timezone.utc)
-    # Global window
-    gw = (
-        db.query(MaintWindow)
-        .filter(MaintWindow.scope == "Global")
-        .filter(MaintWindow.start_at <= now)
-        .filter(MaintWindow.end_at >= now)
-        .first()
-    )
-    if gw:
-        return True
-    # Device window
-    if device:
-        dw = (
-            db.query(MaintWindow)
-            .filter(MaintWindow.scope == "Device")
-            .filter(MaintWindow.target_id == device.id)
-            .filter(MaintWindow.start_at <= now)
-            .filter(MaintWindow.end_at >= now)
-            .first()
-        )
-        if dw:
-            return True
-        # PON window
-        if device.pon_id:
-            pw = (
-                db.query(MaintWindow)
-                .filter(MaintWindow.scope == "PON")
-                .filter(MaintWindow.target_id == device.pon_id)
-                .filter(MaintWindow.start_at <= now)
-                .filter(MaintWindow.end_at >= now)
-                .first()
-            )
-            if pw:
-                return True
-    return False
+async def _enqueue(kind: str, raw: bytes) -> JSONResponse:
+    try:
+        msg_id = await ingest_queue.enqueue(kind, raw)
+    except ingest_queue.Backpressure:
+        raise HTTPException(503, "Ingest backlog full", headers={"Retry-After": "30"})
+    return JSONResponse({"ok": True, "queued": True, "id": msg_id}, status_code=202)
 
 
 @router.post("/librenms")
@@ -94,43 +56,15 @@ async def librenms(request: Request, db: Session = Depends(get_db)):
     if "json" not in ctype:
         raise HTTPException(415, "Unsupported Media Type")
     data = await request.json()
-    host = data.get("hostname")
-    sev = data.get("severity", "critical").lower()
-    rule = data.get("rule", "LibreNMS Alert")
-    alert_id = str(data.get("alert_id"))
-    msg = data.get("msg", "")
-    state = data.get("state", "alert")
-
-    device = db.query(Device).filter(Device.name == host).first()
-    severity_map = {"critical": "P1", "major": "P2", "minor": "P3", "warning": "P3", "info": "P4"}
-    category = "Device"
-    title = f"{host} {rule} {state}"
-
-    nms_ref = f"librenms:{alert_id}"
-    if _is_suppressed(db, device):
-        return {"ok": True, "suppressed": True, "reason": "maintenance window"}
-    existing = _dedup_recent(db, nms_ref, category, device.id if device else None)
-    if existing:
-        return {"ok": True, "incident_id": str(existing.id), "dedup": True}
-
-    inc = Incident(
-        device_id=device.id if device else None,
-        pon_id=device.pon_id if device else None,
-        severity=severity_map.get(sev, "P3"),
-        category=category,
-        title=title,
-        description=msg,
-        status="Open",
-        nms_ref=nms_ref,
-        opened_at=datetime.now(timezone.utc),
-    )
-    db.add(inc)
-    db.commit()
-    return {"ok": True, "incident_id": str(inc.id)}
+    if ingest_queue.queue_enabled():
+        return await _enqueue("librenms", raw)
+    results = await ingest_alerts(db, [normalize_librenms(data)])
+    return results[0]
 
 
 # Zabbix webhook
 # Expect { "host": "OLT-01", "severity": "Disaster|High|Average|Warning|Info", "event_id": "123", "problem": true, "name": "Link down", "message": "..." }
+# problem=false clears (resolves) the open incident for the same event_id
 @router.post("/zabbix")
 async def zabbix(request: Request, db: Session = Depends(get_db)):
     _verify_source(request)
@@ -140,49 +74,57 @@ async def zabbix(request: Request, db: Session = Depends(get_db)):
     if "json" not in ctype:
         raise HTTPException(415, "Unsupported Media Type")
     data = await request.json()
-    host = data.get("host")
-    sev = str(data.get("severity", "Average"))
-    problem = bool(data.get("problem", True))
-    name = data.get("name", "Zabbix Alert")
-    event_id = str(data.get("event_id", ""))
-    msg = data.get("message", "")
-
-    device = db.query(Device).filter(Device.name == host).first()
-    severity_map = {"Disaster": "P1", "High": "P2", "Average": "P3", "Warning": "P3", "Info": "P4"}
-    nms_ref = f"zabbix:{event_id}"
-    if problem:
-        if _is_suppressed(db, device):
-            return {"ok": True, "suppressed": True, "reason": "maintenance window"}
-        existing = _dedup_recent(db, nms_ref, "Device", device.id if device else None)
-        if existing:
-            return {"ok": True, "incident_id": str(existing.id), "dedup": True}
-        inc = Incident(
-            device_id=device.id if device else None,
-            pon_id=device.pon_id if device else None,
-            severity=severity_map.get(sev, "P3"),
-            category="Device",
-            title=f"{host} {name}",
-            description=msg,
-            status="Open",
-            nms_ref=nms_ref,
-            opened_at=datetime.now(timezone.utc),
-        )
-        db.add(inc)
-        db.commit()
-        return {"ok": True, "incident_id": str(inc.id)}
-    else:
-        # Clear handler: mark existing as resolved
-        inc = (
-            db.query(Incident)
-            .filter(Incident.nms_ref == nms_ref)
-            .filter(Incident.status != "Closed")
-            .order_by(Incident.opened_at.desc())
-            .first()
-        )
-        if inc:
-            inc.status = "Resolved"
-            inc.resolved_at = datetime.now(timezone.utc)
-            db.commit()
-            return {"ok": True, "incident_id": str(inc.id), "cleared": True}
-        return {"ok": True, "message": "No open incident"}
+    if ingest_queue.queue_enabled():
+        return await _enqueue("zabbix", raw)
+    results = await ingest_alerts(db, [normalize_zabbix(data)])
+    return results[0]
+
+
+def _parse_batch(request: Request, raw: bytes) -> List[Dict[str, Any]]:
+    ctype = request.headers.get("Content-Type", "application/json")
+    if "json" not in ctype:
+        raise HTTPException(415, "Unsupported Media Type")
+    try:
+        data = json.loads(raw or b"null")
+    except ValueError:
+        raise HTTPException(400, "Invalid JSON")
+    # Accept a bare array or {"alerts": [...]}
+    items = data.get("alerts") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        raise HTTPException(400, "Expected an array of alert objects")
+    if len(items) > BATCH_MAX:
+        raise HTTPException(413, f"Batch exceeds {BATCH_MAX} alerts")
+    return items
+
+
+async def _ingest_batch(request: Request, db: Session, source: str, normalize: Callable[[Dict[str, Any]], Dict[str, Any]]):
+    _verify_source(request)
+    raw = await request.body()
+    _verify_hmac(request, raw)
+    items = _parse_batch(request, raw)
+    if items and ingest_queue.queue_enabled():
+        return await _enqueue(f"{source}_batch", raw)
+    alerts = [normalize(item) for item in items]
+    if not alerts:
+        return {"ok": True, "count": 0, "results": []}
+    results = await ingest_alerts(db, alerts)
+    for i, r in enumerate(results):
+        r["index"] = i
+    return {"ok": True, "count": len(results), "results": results}
+
+
+# Batch variants: body is a JSON array of the same objects the single-alert endpoints accept
+@router.post("/librenms/batch")
+async def librenms_batch(request: Request, db: Session = Depends(get_db)):
+    return await _ingest_batch(request, db, "librenms", normalize_librenms)
+
+
+@router.post("/zabbix/batch")
+async def zabbix_batch(request: Request, db: Session = Depends(get_db)):
+    return await _ingest_batch(request, db, "zabbix", normalize_zabbix)
+
 
+@router.get("/ingest/stats", dependencies=[Depends(require_roles("ADMIN", "NOC"))])
+async def ingest_stats():
+    # Backpressure view of the webhook stream: backlog, pending, oldest entry age, counters
+    return await ingest_queue.stats()
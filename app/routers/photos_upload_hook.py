@@ -1,39 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from fastapi import Request
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone, timedelta
+from typing import List
 from uuid import UUID
+import os
 
 from app.core.deps import get_db, require_roles
 from app.core.limiter import env_org_limiter
 from app.models.photo import Photo
-from app.models.pon import PON
-from app.services.s3 import get_object_bytes, head_object, settings
-from app.services.exif import parse_exif
+from app.services.s3 import head_object, settings
+from app.services import photo_derivatives
+from app.services.photo_geofence import check_point, within_sql
+from app.services.exif import fetch_many, read_exif
 
 
 router = APIRouter(prefix="/photos", tags=["photos"])
 
+PHOTO_BULK_MAX = int(os.getenv("PHOTO_BULK_MAX", "500"))
+
 
 class RegisterIn(BaseModel):
     photo_id: str
     s3_key: str
 
 
-def dist_m(a_lat, a_lng, b_lat, b_lng):
-    R = 6371000.0
-    from math import radians, sin, cos, asin, sqrt
-
-    phi1, phi2 = radians(a_lat), radians(b_lat)
-    dphi = radians(b_lat - a_lat)
-    dlmb = radians(b_lng - a_lng)
-    h = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlmb / 2) ** 2
-    return 2 * R * asin(sqrt(h))
+class RegisterBulkIn(BaseModel):
+    photos: List[RegisterIn] = Field(min_length=1)
+
+
+_RESET_DERIVED = ",\n        ".join(
+    f"{col} = case when p.s3_key is distinct from v.s3_key then null else p.{col} end" for col in photo_derivatives.DERIVED_COLUMNS
+)
+
+# EXIF fields and the geofence check (polygon when the PON has one, else center + radius)
+# for all photos in one statement; a new s3_key clears the old derivatives, hash and duplicate flag
+BULK_UPDATE_SQL = f"""
+    update photos p
+    set s3_key = v.s3_key,
+        taken_ts = v.taken_ts,
+        gps_lat = v.lat,
+        gps_lng = v.lng,
+        exif_ok = v.exif_ok,
+        within_geofence = {within_sql("v.lat", "v.lng")},
+        {_RESET_DERIVED}
+    from unnest(
+           cast(:ids as uuid[]), cast(:keys as text[]), cast(:ts as timestamptz[]), cast(:lat as float8[]),
+           cast(:lng as float8[]), cast(:ok as boolean[])
+         ) as v(id, s3_key, taken_ts, lat, lng, exif_ok)
+    join photos q on q.id = v.id
+    left join pons x on x.id = q.pon_id
+    where p.id = v.id
+    returning p.id::text as id, p.within_geofence, p.thumb_url, p.preview_url, p.derivatives_at is null as pending
+"""
 
 
 @router.post("/register", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "SMME")), Depends(env_org_limiter("HEAVY_ORG", 240, 60))])
-def register(payload: RegisterIn, db: Session = Depends(get_db), request: Request = None):
+def register(background: BackgroundTasks, payload: RegisterIn, db: Session = Depends(get_db), request: Request = None):
     p: Photo | None = db.get(Photo, UUID(payload.photo_id))
     if not p:
         raise HTTPException(404, "Photo not found")
@@ -50,40 +75,114 @@ def register(payload: RegisterIn, db: Session = Depends(get_db), request: Reques
     if size <= 0 or size > settings.FILE_MAX_BYTES:
         raise HTTPException(413, "File too large")
 
-    # Read from S3 and parse EXIF
-    blob = get_object_bytes(payload.s3_key)
-    meta = parse_exif(blob)
+    # Parse EXIF from the head of the object (ranged reads)
+    meta = read_exif(payload.s3_key, size)
 
     # Update photo with EXIF
     p.taken_ts = meta["taken_ts"]
     p.gps_lat = meta["gps_lat"]
     p.gps_lng = meta["gps_lng"]
+    if p.s3_key != payload.s3_key:
+        p.s3_key = payload.s3_key
+        for col in photo_derivatives.DERIVED_COLUMNS:
+            setattr(p, col, None)
 
-    # Validate timing and geofence if PON has center
+    # Validate timing, and the geofence with the same predicate as bulk registration
     exif_ok = False
-    within = False
     if p.taken_ts:
         exif_ok = abs((datetime.now(timezone.utc) - p.taken_ts)) <= timedelta(hours=24)
-    pon: PON | None = db.get(PON, p.pon_id)
-    if (
-        pon
-        and pon.center_lat
-        and pon.center_lng
-        and p.gps_lat is not None
-        and p.gps_lng is not None
-    ):
-        within = (
-            dist_m(
-                float(p.gps_lat),
-                float(p.gps_lng),
-                float(pon.center_lat),
-                float(pon.center_lng),
-            )
-            <= pon.geofence_radius_m
-        )
+    _, within = check_point(db, p.pon_id, p.gps_lat, p.gps_lng)
 
     p.exif_ok = exif_ok
     p.within_geofence = within
     db.commit()
-    return {"ok": True, "exif_ok": exif_ok, "within_geofence": within}
-
+    if p.derivatives_at is None:
+        background.add_task(photo_derivatives.run, [(str(p.id), p.s3_key)])
+    return {"ok": True, "exif_ok": exif_ok, "within_geofence": within, "thumb_url": p.thumb_url, "preview_url": p.preview_url}
+
+
+@router.post("/register/bulk", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "SMME")), Depends(env_org_limiter("HEAVY_ORG", 60, 60))])
+def register_bulk(background: BackgroundTasks, payload: RegisterBulkIn, db: Session = Depends(get_db)):
+    """/photos/register for a day's uploads: EXIF is read concurrently, then one UPDATE.
+
+    Photos that fail (unknown id, missing object, type/size, duplicate in the request) get an
+    error in their result and are left unchanged; the rest are registered and their missing
+    thumbnails/previews queued.
+    """
+    if len(payload.photos) > PHOTO_BULK_MAX:
+        raise HTTPException(413, f"At most {PHOTO_BULK_MAX} photos per request")
+
+    results: List[dict] = []
+    for item in payload.photos:
+        try:
+            results.append({"photo_id": str(UUID(item.photo_id)), "s3_key": item.s3_key})
+        except ValueError:
+            results.append({"photo_id": item.photo_id, "s3_key": item.s3_key, "error": "Invalid photo_id"})
+    ids = [r["photo_id"] for r in results if "error" not in r]
+    known = {r.id for r in db.execute(text("select id::text as id from photos where id = any(cast(:ids as uuid[]))"), {"ids": ids})}
+    seen = set()
+    for r in results:
+        if "error" in r:
+            continue
+        if r["photo_id"] not in known:
+            r["error"] = "Photo not found"
+        elif r["photo_id"] in seen:
+            r["error"] = "Duplicate photo_id in request"
+        seen.add(r["photo_id"])
+
+    todo = [r for r in results if "error" not in r]
+    now = datetime.now(timezone.utc)
+    for r, meta in zip(todo, fetch_many([r["s3_key"] for r in todo])):
+        if "error" in meta:
+            r["error"] = meta["error"]
+            continue
+        r.update(taken_ts=meta["taken_ts"], gps_lat=meta["gps_lat"], gps_lng=meta["gps_lng"])
+        r["exif_ok"] = bool(meta["taken_ts"]) and abs(now - meta["taken_ts"]) <= timedelta(hours=24)
+
+    todo = [r for r in results if "error" not in r]
+    if todo:
+        rows = {
+            row.id: row
+            for row in db.execute(
+                text(BULK_UPDATE_SQL),
+                {
+                    "ids": [r["photo_id"] for r in todo],
+                    "keys": [r["s3_key"] for r in todo],
+                    "ts": [r["taken_ts"] for r in todo],
+                    "lat": [r["gps_lat"] for r in todo],
+                    "lng": [r["gps_lng"] for r in todo],
+                    "ok": [r["exif_ok"] for r in todo],
+                },
+            )
+        }
+        db.commit()
+        pending = []
+        for r in todo:
+            row = rows.get(r["photo_id"])
+            r["within_geofence"] = bool(row and row.within_geofence)
+            r["thumb_url"] = row.thumb_url if row else None
+            r["preview_url"] = row.preview_url if row else None
+            if row is not None and row.pending:
+                pending.append((r["photo_id"], r["s3_key"]))
+        if pending:
+            background.add_task(photo_derivatives.run, pending)
+
+    out = []
+    for r in results:
+        if "error" in r:
+            out.append({"photo_id": r["photo_id"], "ok": False, "error": r["error"]})
+        else:
+            out.append(
+                {
+                    "photo_id": r["photo_id"],
+                    "ok": True,
+                    "exif_ok": r["exif_ok"],
+                    "within_geofence": r["within_geofence"],
+                    "taken_ts": r["taken_ts"].isoformat() if r["taken_ts"] else None,
+                    "gps_lat": r["gps_lat"],
+                    "gps_lng": r["gps_lng"],
+                    "thumb_url": r["thumb_url"],
+                    "preview_url": r["preview_url"],
+                }
+            )
+    return {"ok": True, "registered": len(todo), "failed": len(out) - len(todo), "results": out}
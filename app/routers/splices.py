@@ -1,14 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from uuid import uuid4
+from uuid import UUID, uuid4
+from typing import Dict, List
 from pydantic import BaseModel, Field
+import os
 from app.core.deps import get_db, require_roles
 from app.core.limiter import env_org_limiter
 
 
 router = APIRouter(prefix="/splices", tags=["splices"])
 
+SPLICE_BULK_MAX = int(os.getenv("SPLICE_BULK_MAX", "1728"))
+
 
 class SpliceIn(BaseModel):
     tray_id: str
@@ -51,6 +55,110 @@ def add_splice(payload: SpliceIn, db: Session = Depends(get_db)):
     return {"ok": True, "id": sid}
 
 
+class BulkCore(BaseModel):
+    core: int = Field(ge=1)
+    loss_db: float | None = Field(default=None, ge=0.0, le=3.0)
+    passed: bool = True
+    # Override the tray defaults for this core
+    from_cable: str | None = None
+    to_cable: str | None = None
+    method: str | None = None
+
+
+class BulkTray(BaseModel):
+    tray_id: str
+    from_cable: str | None = None
+    to_cable: str | None = None
+    method: str | None = None
+    tech_id: str | None = None
+    splices: List[BulkCore] = Field(min_length=1)
+
+
+class BulkIn(BaseModel):
+    trays: List[BulkTray] = Field(min_length=1)
+
+
+BULK_INSERT_SQL = """
+    insert into splices (id, tray_id, core, from_cable, to_cable, loss_db, method, tech_id, time, passed)
+    select s.id, s.tray_id, s.core, s.fc, s.tc, s.loss, s.method, s.tech, now(), s.passed
+    from unnest(
+      cast(:id as uuid[]), cast(:t as uuid[]), cast(:c as int[]), cast(:fc as text[]), cast(:tc as text[]),
+      cast(:l as numeric[]), cast(:m as text[]), cast(:tech as uuid[]), cast(:p as boolean[])
+    ) as s(id, tray_id, core, fc, tc, loss, method, tech, passed)
+"""
+
+
+@router.post("/bulk", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE")), Depends(env_org_limiter("HEAVY_ORG", 120, 60))])
+def add_splices_bulk(payload: BulkIn, db: Session = Depends(get_db)):
+    """Record whole trays: one insert for every core and one aggregate update of splices_done."""
+    total = sum(len(t.splices) for t in payload.trays)
+    if total > SPLICE_BULK_MAX:
+        raise HTTPException(413, f"At most {SPLICE_BULK_MAX} splices per request")
+    # Canonical form, as the locked trays are keyed by id::text
+    for tray in payload.trays:
+        try:
+            tray.tray_id = str(UUID(tray.tray_id))
+        except ValueError:
+            raise HTTPException(422, f"Invalid tray_id: {tray.tray_id}")
+    tray_ids = list(dict.fromkeys(t.tray_id for t in payload.trays))
+    # Lock the trays so concurrent captures of the same tray validate against each other's cores
+    trays = {
+        r.id: r
+        for r in db.execute(
+            text("select id::text as id, fiber_start, fiber_end from splice_trays where id = any(cast(:ids as uuid[])) order by id for update"),
+            {"ids": tray_ids},
+        )
+    }
+    missing = [t for t in tray_ids if t not in trays]
+    if missing:
+        db.rollback()
+        raise HTTPException(404, f"Tray not found: {', '.join(missing)}")
+    recorded: Dict[str, set] = {}
+    for r in db.execute(text("select tray_id::text as tray_id, core from splices where tray_id = any(cast(:ids as uuid[]))"), {"ids": tray_ids}):
+        recorded.setdefault(r.tray_id, set()).add(r.core)
+
+    errors = []
+    rows: Dict[str, list] = {k: [] for k in ("id", "t", "c", "fc", "tc", "l", "m", "tech", "p")}
+    seen: Dict[str, set] = {}
+    for tray in payload.trays:
+        tr = trays[tray.tray_id]
+        cores = seen.setdefault(tray.tray_id, set())
+        for sp in tray.splices:
+            if (tr.fiber_start is not None and sp.core < tr.fiber_start) or (tr.fiber_end is not None and sp.core > tr.fiber_end):
+                errors.append({"tray_id": tray.tray_id, "core": sp.core, "error": f"outside fibres {tr.fiber_start}-{tr.fiber_end}"})
+            elif sp.core in cores:
+                errors.append({"tray_id": tray.tray_id, "core": sp.core, "error": "duplicate core in request"})
+            elif sp.core in recorded.get(tray.tray_id, ()):
+                errors.append({"tray_id": tray.tray_id, "core": sp.core, "error": "core already recorded"})
+            cores.add(sp.core)
+            rows["id"].append(str(uuid4()))
+            rows["t"].append(tray.tray_id)
+            rows["c"].append(sp.core)
+            rows["fc"].append(sp.from_cable or tray.from_cable)
+            rows["tc"].append(sp.to_cable or tray.to_cable)
+            rows["l"].append(sp.loss_db)
+            rows["m"].append(sp.method or tray.method)
+            rows["tech"].append(tray.tech_id)
+            rows["p"].append(sp.passed)
+    if errors:
+        db.rollback()
+        raise HTTPException(422, {"message": "Invalid cores; nothing was recorded", "errors": errors})
+
+    db.execute(text(BULK_INSERT_SQL), rows)
+    db.execute(
+        text(
+            """
+            update splice_trays st set splices_done = coalesce(st.splices_done, 0) + c.n
+            from (select tray_id, count(*) as n from unnest(cast(:t as uuid[])) as tray_id group by tray_id) c
+            where st.id = c.tray_id
+            """
+        ),
+        {"t": rows["t"]},
+    )
+    db.commit()
+    return {"ok": True, "inserted": total, "trays": len(tray_ids), "ids": rows["id"]}
+
+
 @router.get("/by-tray/{tray_id}", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
 def list_splices(tray_id: str, db: Session = Depends(get_db)):
     rows = (
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from pydantic import BaseModel
@@ -41,13 +42,17 @@ def update_task(task_id: str, payload: TaskUpdateIn, db: Session = Depends(get_d
         task.sla_minutes = mins
         if task.started_at:
             task.sla_due_at = task.started_at + timedelta(minutes=mins)
-    # Hard gate: require at least one validated photo within geofence for the task's PON before marking Done
+    # Hard gate: require at least one validated photo within geofence for the task's PON before marking Done;
+    # it must also have been hashed and found not to be a recycled duplicate (phash is set in the background;
+    # photos recorded before s3_key was, which can never be hashed, are exempt)
     if "status" in data and data["status"] == "Done":
         has_valid_photo = (
             db.query(Photo)
             .filter(Photo.pon_id == task.pon_id)
             .filter(Photo.exif_ok.is_(True))
             .filter(Photo.within_geofence.is_(True))
+            .filter(or_(Photo.phash.isnot(None), Photo.s3_key.is_(None)))
+            .filter(Photo.duplicate_of.is_(None))
             .first()
             is not None
         )
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.core.deps import get_db, require_roles
+from app.services import loss_rollups
+
+
+router = APIRouter(prefix="/tests/analytics", tags=["tests"])
+
+
+@router.get("/loss", dependencies=[Depends(require_roles("ADMIN", "PM", "AUDITOR"))])
+def loss_distribution(
+    dim: str = Query(default="tech", description="pon | smme | tech"),
+    source: str = Query(default="otdr", description="otdr | lspm | splice"),
+    metric: str = Query(default="total_loss", description="total_loss | splice_loss"),
+    order: str = Query(default="p90"),
+    limit: int = Query(default=100, ge=1, le=5000),
+    min_n: int = Query(default=5, ge=1),
+    dim_id: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Loss distribution and pass rates per PON, SMME or technician, worst first, with the overall baseline."""
+    if dim not in loss_rollups.DIMS:
+        raise HTTPException(400, f"dim must be one of {', '.join(loss_rollups.DIMS)}")
+    if metric not in loss_rollups.SOURCES.get(source, ()):
+        raise HTTPException(400, "Unsupported source/metric combination")
+    if dim == "smme" and source == "splice":
+        raise HTTPException(400, "Splices are not attributed to an SMME")
+    if order not in loss_rollups.ORDERS:
+        raise HTTPException(400, f"order must be one of {', '.join(loss_rollups.ORDERS)}")
+    return {
+        "dim": dim,
+        "source": source,
+        "metric": metric,
+        "bucket_db": loss_rollups.BUCKET_DB[metric],
+        "overall": loss_rollups.overall(db, dim, source, metric),
+        "items": loss_rollups.distributions(db, dim, source, metric, order, limit, min_n, dim_id),
+    }
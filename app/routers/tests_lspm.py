@@ -15,6 +15,9 @@ class LSPMIn(BaseModel):
     measured_loss_db: float = Field(ge=0.0, le=30.0)
     margin_db: float | None = Field(default=None, ge=-10.0, le=10.0)
     passed: bool = False
+    # Crew that ran the test (loss analytics)
+    smme_id: str | None = None
+    tech_id: str | None = None
 
 
 @router.post("", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE"))])
@@ -23,8 +26,8 @@ def add_lspm(payload: LSPMIn, db: Session = Depends(get_db)):
     db.execute(
         text(
             """
-      insert into lspm_results (id, test_plan_id, wavelength_nm, measured_loss_db, margin_db, tested_at, passed)
-      values (:id, :tp, :wl, :ml, :mg, now(), :p)
+      insert into lspm_results (id, test_plan_id, wavelength_nm, measured_loss_db, margin_db, tested_at, passed, smme_id, tech_id)
+      values (:id, :tp, :wl, :ml, :mg, now(), :p, :sm, :tech)
     """
         ),
         {
@@ -34,6 +37,8 @@ def add_lspm(payload: LSPMIn, db: Session = Depends(get_db)):
             "ml": payload.measured_loss_db,
             "mg": payload.margin_db,
             "p": payload.passed,
+            "sm": payload.smme_id,
+            "tech": payload.tech_id,
         },
     )
     db.commit()
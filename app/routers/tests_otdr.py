@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from uuid import uuid4
 from pydantic import BaseModel, Field
 from app.core.deps import get_db, require_roles
 from app.core.limiter import env_org_limiter
-from typing import List
-from math import isfinite
+from typing import Any, Dict, List
 from app.models.topology_ext import CableRegister
+from app.services import otdr_snap, otdr_trace, s3, sor
 
 
 router = APIRouter(prefix="/tests/otdr", tags=["tests"])
 
+OTDR_BULK_MAX = int(os.getenv("OTDR_BULK_MAX", "500"))
+OTDR_MAX_SPLICE_LOSS_DB = float(os.getenv("OTDR_MAX_SPLICE_LOSS_DB", "0.3"))
+OTDR_TRACE_MAX_POINTS = int(os.getenv("OTDR_TRACE_MAX_POINTS", "5000"))
+TRACE_COLS = ("trace_key", "trace_points", "trace_levels", "trace_resolution_m", "trace_scale", "trace_bytes")
+
 
 class OTDRIn(BaseModel):
     test_plan_id: str
@@ -25,6 +31,9 @@ class OTDRIn(BaseModel):
     passed: bool = False
     # Optional parsed events: distance_m values to snap
     events_distance_m: List[float] | None = None
+    # Crew that ran the test (loss analytics)
+    smme_id: str | None = None
+    tech_id: str | None = None
 
 
 @router.post("", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE")), Depends(env_org_limiter("HEAVY_ORG", 180, 60))])
@@ -33,8 +42,8 @@ def add_otdr(payload: OTDRIn, db: Session = Depends(get_db)):
     db.execute(
         text(
             """
-      insert into otdr_results (id, test_plan_id, file_url, vendor, wavelength_nm, total_loss_db, event_count, max_splice_loss_db, back_reflection_db, tested_at, passed)
-      values (:id, :tp, :url, :v, :wl, :tl, :ec, :ms, :br, now(), :p)
+      insert into otdr_results (id, test_plan_id, file_url, vendor, wavelength_nm, total_loss_db, event_count, max_splice_loss_db, back_reflection_db, tested_at, passed, smme_id, tech_id)
+      values (:id, :tp, :url, :v, :wl, :tl, :ec, :ms, :br, now(), :p, :sm, :tech)
     """
         ),
         {
@@ -48,74 +57,14 @@ def add_otdr(payload: OTDRIn, db: Session = Depends(get_db)):
             "ms": payload.max_splice_loss_db,
             "br": payload.back_reflection_db,
             "p": payload.passed,
+            "sm": payload.smme_id,
+            "tech": payload.tech_id,
         },
     )
-    db.commit()
     # Optional: insert snapped OTDR events
     if payload.events_distance_m:
-        # Get candidate cable polyline for the plan's PON
-        row = db.execute(text("select p.pon_id from test_plans tp join pons p on tp.pon_id = p.id where tp.id = :tp"), {"tp": payload.test_plan_id}).first()
-        pon_id = row[0] if row else None
-        # Use PostGIS when cable geometry exists, else fallback to polyline JSON
-        rowc = (
-            db.execute(
-                text(
-                    "select id, cable_code, length_m, ST_AsText(geom) as wkt, polyline from cable_register where pon_id = :p order by length_m desc nulls last limit 1"
-                ),
-                {"p": pon_id},
-            )
-            .mappings()
-            .first()
-        )
-        if rowc:
-            if rowc["wkt"]:
-                for d in payload.events_distance_m:
-                    if not isfinite(d):
-                        continue
-                    pt = (
-                        db.execute(
-                            text(
-                                "select ST_X(pt) as lng, ST_Y(pt) as lat from (select ST_LineInterpolatePoint(ST_GeomFromText(:wkt, 4326), greatest(0, least(1, :t))) as pt) q"
-                            ),
-                            {"wkt": rowc["wkt"], "t": float(d) / float(rowc["length_m"] or 1.0)},
-                        )
-                        .mappings()
-                        .first()
-                    )
-                    if pt:
-                        db.execute(
-                            text(
-                                "insert into otdr_events (id, otdr_result_id, distance_m, gps_lat, gps_lng, created_at) values (gen_random_uuid(), :rid, :dist, :lat, :lng, now())"
-                            ),
-                            {"rid": oid, "dist": d, "lat": pt["lat"], "lng": pt["lng"]},
-                        )
-                db.commit()
-            elif rowc["polyline"]:
-                import json
-                try:
-                    coords = json.loads(rowc["polyline"])
-                except Exception:
-                    coords = []
-                def snap_distance_to_polyline(dist_m: float):
-                    if not coords or not isfinite(dist_m):
-                        return None
-                    total = float(rowc["length_m"] or 0)
-                    if total <= 0:
-                        return None
-                    t = max(0.0, min(1.0, dist_m / total))
-                    idx = int(t * (len(coords) - 1))
-                    lat, lng = coords[idx]
-                    return lat, lng
-                for d in payload.events_distance_m:
-                    snapped = snap_distance_to_polyline(d)
-                    if snapped:
-                        db.execute(
-                            text(
-                                "insert into otdr_events (id, otdr_result_id, distance_m, gps_lat, gps_lng, created_at) values (gen_random_uuid(), :rid, :dist, :lat, :lng, now())"
-                            ),
-                            {"rid": oid, "dist": d, "lat": snapped[0], "lng": snapped[1]},
-                        )
-                db.commit()
+        otdr_snap.snap_events(db, oid, payload.test_plan_id, [{"distance_m": d} for d in payload.events_distance_m])
+    db.commit()
     return {"ok": True, "id": oid}
 
 
@@ -124,6 +73,137 @@ def import_otdr(payload: OTDRIn, db: Session = Depends(get_db)):
     return add_otdr(payload, db)
 
 
+class SorIn(BaseModel):
+    test_plan_id: str
+    # Object key in the bucket, or the URL returned when the file was uploaded
+    s3_key: str | None = None
+    file_url: str | None = None
+    smme_id: str | None = None
+    tech_id: str | None = None
+
+
+class SorBulkIn(BaseModel):
+    files: List[SorIn] = Field(min_length=1, max_length=OTDR_BULK_MAX)
+
+
+def _plan_budget(db: Session, test_plan_ids: List[str]) -> Dict[str, float]:
+    rows = db.execute(
+        text("select id::text as id, max_loss_db from test_plans where id = any(cast(:ids as uuid[]))"),
+        {"ids": list(set(test_plan_ids))},
+    ).all()
+    return {r.id: float(r.max_loss_db) for r in rows}
+
+
+def _store_sor(db: Session, item: SorIn, url: str, summary: Dict[str, Any], max_loss: float) -> Dict[str, Any]:
+    oid = str(uuid4())
+    passed = summary["total_loss_db"] <= max_loss and summary["max_splice_loss_db"] <= OTDR_MAX_SPLICE_LOSS_DB
+    trace = summary.get("trace") or dict.fromkeys(TRACE_COLS)
+    db.execute(
+        text(
+            """
+      insert into otdr_results (id, test_plan_id, file_url, s3_key, vendor, wavelength_nm, total_loss_db, event_count, max_splice_loss_db,
+                                back_reflection_db, orl_db, fiber_length_m, pulse_width_ns, tested_at, passed,
+                                trace_key, trace_points, trace_levels, trace_resolution_m, trace_scale, trace_bytes, smme_id, tech_id)
+      values (:id, :tp, :url, :key, :v, :wl, :tl, :ec, :ms, :br, :orl, :len, :pw, now(), :p,
+              :trace_key, :trace_points, :trace_levels, :trace_resolution_m, :trace_scale, :trace_bytes, :sm, :tech)
+    """
+        ),
+        {
+            "id": oid, "tp": item.test_plan_id, "url": url, "key": summary["s3_key"], "v": summary["vendor"],
+            "wl": summary["wavelength_nm"], "tl": summary["total_loss_db"], "ec": summary["event_count"],
+            "ms": summary["max_splice_loss_db"], "br": summary["back_reflection_db"], "orl": summary["orl_db"],
+            "len": summary["fiber_length_m"], "pw": summary["pulse_width_ns"], "p": passed, **trace,
+            "sm": item.smme_id, "tech": item.tech_id,
+        },
+    )
+    otdr_snap.snap_events(db, oid, item.test_plan_id, summary["events"])
+    db.commit()
+    out = {k: v for k, v in summary.items() if k not in ("events", "trace")}
+    return {"ok": True, "id": oid, "passed": passed, **out, "events": summary["events"]}
+
+
+def _sor_key(item: SorIn) -> str:
+    if not (item.s3_key or item.file_url):
+        raise HTTPException(400, "s3_key or file_url required")
+    return sor.key_from_url(item.s3_key or item.file_url)
+
+
+def _sor_url(item: SorIn, key: str) -> str:
+    return item.file_url or f"{s3.settings.S3_ENDPOINT}/{s3.S3_BUCKET}/{key}".replace("http://", "https://")
+
+
+@router.post("/sor", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE")), Depends(env_org_limiter("HEAVY_ORG", 180, 60))])
+def import_sor(payload: SorIn, db: Session = Depends(get_db)):
+    """Parse a .sor trace stored in S3 and record the results computed from it."""
+    key = _sor_key(payload)
+    budget = _plan_budget(db, [payload.test_plan_id])
+    if payload.test_plan_id not in budget:
+        raise HTTPException(404, "Test plan not found")
+    summary = sor.parse_object(key, store_trace=True)
+    if "error" in summary:
+        raise HTTPException(422, f"Unreadable SOR file: {summary['error']}")
+    return _store_sor(db, payload, _sor_url(payload, key), summary, budget[payload.test_plan_id])
+
+
+@router.post("/sor/bulk", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE")), Depends(env_org_limiter("HEAVY_ORG", 180, 60))])
+def import_sor_bulk(payload: SorBulkIn, db: Session = Depends(get_db)):
+    """Parse a test campaign's .sor files on the OTDR process pool; one result (or error) per file, in order."""
+    keys = [_sor_key(f) for f in payload.files]
+    budget = _plan_budget(db, [f.test_plan_id for f in payload.files])
+    results = []
+    for item, key, summary in zip(payload.files, keys, sor.parse_many(keys, store_trace=True)):
+        if item.test_plan_id not in budget:
+            results.append({"ok": False, "s3_key": key, "error": "Test plan not found"})
+        elif "error" in summary:
+            results.append({"ok": False, "s3_key": key, "error": f"Unreadable SOR file: {summary['error']}"})
+        else:
+            r = _store_sor(db, item, _sor_url(item, key), summary, budget[item.test_plan_id])
+            r.pop("events")
+            results.append(r)
+    return {"parsed": sum(1 for r in results if r["ok"]), "failed": sum(1 for r in results if not r["ok"]), "results": results}
+
+
+@router.get("/{oid}/trace", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
+def otdr_trace_window(
+    oid: str,
+    from_m: float | None = Query(default=None, ge=0),
+    to_m: float | None = Query(default=None, ge=0),
+    points: int = Query(default=1000, ge=10, le=OTDR_TRACE_MAX_POINTS),
+    db: Session = Depends(get_db),
+):
+    """Min/max envelope of the stored trace between from_m and to_m, in at most `points` buckets."""
+    if from_m is not None and to_m is not None and to_m <= from_m:
+        raise HTTPException(400, "to_m must be greater than from_m")
+    trace_sql = text(f"select s3_key, {', '.join(TRACE_COLS)} from otdr_results where id = cast(:id as uuid)")
+    row = db.execute(trace_sql, {"id": oid}).mappings().first()
+    if row is None:
+        raise HTTPException(404, "OTDR result not found")
+    meta = dict(row)
+    if not meta["trace_key"]:
+        if not meta["s3_key"]:
+            raise HTTPException(404, "No trace stored for this result")
+        # Results parsed before traces were kept: store the levels on first view. Concurrent
+        # first views each upload under their own prefix; only the first one is recorded
+        summary = sor.parse_object(meta["s3_key"], store_trace=True)
+        if "trace" not in summary:
+            raise HTTPException(422, f"Unreadable SOR file: {summary.get('error', 'no data points')}")
+        won = db.execute(
+            text(
+                "update otdr_results set " + ", ".join(f"{c} = :{c}" for c in TRACE_COLS)
+                + " where id = cast(:id as uuid) and trace_key is null returning id"
+            ),
+            {"id": oid, **summary["trace"]},
+        ).first()
+        db.commit()
+        if won:
+            meta.update(summary["trace"])
+        else:
+            otdr_trace.discard(summary["trace"])
+            meta = dict(db.execute(trace_sql, {"id": oid}).mappings().first())
+    return {"id": oid, "resolution_m": meta["trace_resolution_m"], "length_m": round(meta["trace_points"] * meta["trace_resolution_m"], 2),
+            **otdr_trace.window(meta, from_m, to_m, points)}
+
+
 @router.get("/by-plan/{plan_id}", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
 def list_otdr(plan_id: str, db: Session = Depends(get_db)):
     rows = (
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Dict, Any
 from app.core.deps import get_db, require_roles
+from app.services import loss_budget
+from app.services.correlation import topology_cache
 
 
 router = APIRouter(prefix="/topology", tags=["topology"])
@@ -37,3 +40,29 @@ def get_topology_for_pon(pon_id: str, db: Session = Depends(get_db)) -> Dict[str
 
     return {"nodes": [dict(n) for n in nodes], "edges": [dict(e) for e in edges]}
 
+
+@router.get("/pon/{pon_id}/loss-budget", dependencies=[Depends(require_roles("ADMIN", "PM", "SITE", "AUDITOR"))])
+def pon_loss_budget(
+    pon_id: str,
+    request: Request,
+    wavelength_nm: int = Query(default=1310, ge=1260, le=1650),
+    db: Session = Depends(get_db),
+):
+    """Expected loss of every OLT-to-drop path, with test plan margins (cached until the PON's inputs change)."""
+    payload, etag = loss_budget.get_budget(db, pon_id, wavelength_nm)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
+@router.get("/cache-stats", dependencies=[Depends(require_roles("ADMIN", "NOC"))])
+def topology_cache_stats() -> Dict[str, Any]:
+    return topology_cache.stats()
+
+
+@router.post("/cache/invalidate", dependencies=[Depends(require_roles("ADMIN", "NOC"))])
+def invalidate_topology_cache() -> Dict[str, Any]:
+    # Topology is maintained outside the API; reload now instead of waiting for the TTL
+    topology_cache.invalidate()
+    return {"ok": True}
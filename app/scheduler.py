@@ -1,8 +1,16 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timezone
+from uuid import uuid4
 from sqlalchemy import text
 
 from app.core.deps import SessionLocal
+from app.core.redis_client import get_redis_sync
+from app.services.alert_dedup import FLAP_COUNTS_KEY
+from app.services.geo_lod import rebuild_stale
+from app.services.import_jobs import run_pending as run_import_jobs
+from app.services.loss_rollups import rebuild as rebuild_loss_rollups
+from app.services.photo_derivatives import run_pending as run_photo_derivatives
+from app.services.photo_geofence import revalidate as revalidate_photo_geofences
 
 
 sched = BackgroundScheduler(timezone="Africa/Johannesburg")
@@ -36,11 +44,66 @@ def job_sla_scan():
 
 
 def job_photo_revalidate():
+    # Only photos of PONs whose geofence changed since their last check
     with SessionLocal() as db:
-        db.execute(text("""
-            update photos set exif_ok = exif_ok where taken_ts is not null
-        """))
-        db.commit()
+        revalidate_photo_geofences(db)
+
+
+def job_flap_flush():
+    # Move pending flap counters aside atomically so increments during the flush are kept
+    r = get_redis_sync()
+    flushing = f"{FLAP_COUNTS_KEY}:flush:{uuid4()}"
+    try:
+        r.rename(FLAP_COUNTS_KEY, flushing)
+    except Exception:
+        return  # nothing pending (or Redis unavailable)
+    counts = r.hgetall(flushing)
+    if counts:
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    text(
+                        """
+                    update incidents i set flap_count = i.flap_count + v.n
+                    from (select unnest(cast(:ids as uuid[])) as id, unnest(cast(:ns as int[])) as n) v
+                    where i.id = v.id
+                """
+                    ),
+                    {"ids": list(counts.keys()), "ns": [int(n) for n in counts.values()]},
+                )
+                db.commit()
+        except Exception:
+            # Fold the counts back into the pending hash for the next run instead of losing them
+            pipe = r.pipeline(transaction=False)
+            for incident_id, n in counts.items():
+                pipe.hincrby(FLAP_COUNTS_KEY, incident_id, int(n))
+            pipe.delete(flushing)
+            pipe.execute()
+            raise
+    r.delete(flushing)
+
+
+def job_geo_lods():
+    # Ward/suburb loads via scripts/import_sa_geographies.sh bump the dataset version
+    with SessionLocal() as db:
+        rebuild_stale(db)
+
+
+def job_import_jobs():
+    # Also resumes jobs whose worker died (no heartbeat for IMPORT_JOB_STALE_SEC)
+    run_import_jobs()
+
+
+def job_loss_rollups():
+    # Triggers keep the histograms current; this recount corrects drift from cascaded deletes
+    with SessionLocal() as db:
+        rebuild_loss_rollups(db)
+
+
+def job_photo_derivatives():
+    # Registration queues derivatives after the response; this catches what a restart dropped
+    with SessionLocal() as db:
+        run_photo_derivatives(db)
 
 
 def job_weekly_report():
@@ -51,6 +114,11 @@ def job_weekly_report():
 def init_jobs():
     sched.add_job(job_sla_scan, "interval", minutes=15, id="sla-scan")
     sched.add_job(job_photo_revalidate, "cron", hour=18, minute=0, id="photo-revalidate")
+    sched.add_job(job_flap_flush, "interval", minutes=1, id="flap-flush")
+    sched.add_job(job_geo_lods, "interval", minutes=5, id="geo-lods")
+    sched.add_job(job_import_jobs, "interval", seconds=30, id="import-jobs")
+    sched.add_job(job_loss_rollups, "cron", hour=2, minute=30, id="loss-rollups")
+    sched.add_job(job_photo_derivatives, "interval", minutes=10, id="photo-derivatives")
     sched.add_job(job_weekly_report, "cron", day_of_week="mon", hour=6, minute=0, id="weekly-report")
     sched.start()
 
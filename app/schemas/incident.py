@@ -28,6 +28,8 @@ class IncidentUpdate(BaseModel):
 
 class IncidentOut(IncidentCreate, IncidentUpdate):
     id: uuid.UUID
+    flap_count: Optional[int] = None
+    parent_incident_id: Optional[uuid.UUID] = None
 
     class Config:
         orm_mode = True
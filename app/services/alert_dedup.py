@@ -0,0 +1,80 @@
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+
+DEDUP_WINDOW_SEC = int(os.getenv("NMS_DEDUP_WINDOW_SEC", "1800"))
+# A ref that changes state NMS_FLAP_CHANGES times within NMS_FLAP_WINDOW_MIN minutes is flapping
+FLAP_CHANGES = int(os.getenv("NMS_FLAP_CHANGES", "4"))
+FLAP_WINDOW_SEC = int(os.getenv("NMS_FLAP_WINDOW_MIN", "10")) * 60
+
+# Hash of incident_id -> flap changes not yet written to incidents.flap_count
+FLAP_COUNTS_KEY = "nms:flapcount"
+
+
+def _dedup_key(alert: Dict[str, Any]) -> str:
+    return f"nms:dedup:{alert['category']}:{alert['nms_ref']}"
+
+
+async def lookup(r: aioredis.Redis, alerts: List[Dict[str, Any]]) -> List[Optional[str]]:
+    if not alerts:
+        return []
+    return await r.mget([_dedup_key(a) for a in alerts])
+
+
+async def remember(r: aioredis.Redis, pairs: List[Tuple[Dict[str, Any], str]]) -> None:
+    if not pairs:
+        return
+    pipe = r.pipeline(transaction=False)
+    for alert, incident_id in pairs:
+        pipe.set(_dedup_key(alert), incident_id, ex=DEDUP_WINDOW_SEC)
+    await pipe.execute()
+
+
+async def record_states(r: aioredis.Redis, alerts: List[Dict[str, Any]]) -> List[int]:
+    """Record each alert's problem/clear state; return state changes per ref within the flap window.
+
+    Two round trips per call: swap in the new state to learn which alerts changed it, then
+    append those changes to a per-ref sorted set trimmed to the window.
+    """
+    if not alerts:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for a in alerts:
+        pipe.set(f"nms:state:{a['nms_ref']}", "1" if a["problem"] else "0", ex=FLAP_WINDOW_SEC, get=True)
+    previous = await pipe.execute()
+
+    now = time.time()
+    pipe = r.pipeline(transaction=False)
+    for i, a in enumerate(alerts):
+        key = f"nms:flap:{a['nms_ref']}"
+        state = "1" if a["problem"] else "0"
+        if previous[i] is not None and previous[i] != state:
+            pipe.zadd(key, {f"{now}:{i}": now})
+        pipe.zremrangebyscore(key, 0, now - FLAP_WINDOW_SEC)
+        pipe.zcard(key)
+        pipe.expire(key, FLAP_WINDOW_SEC)
+    replies = await pipe.execute()
+
+    # zcard is the second-to-last reply of each alert's group of commands
+    counts: List[int] = []
+    pos = 0
+    for i, a in enumerate(alerts):
+        changed = previous[i] is not None and previous[i] != ("1" if a["problem"] else "0")
+        pos += 4 if changed else 3
+        counts.append(int(replies[pos - 2]))
+    return counts
+
+
+async def damp(r: aioredis.Redis, alert: Dict[str, Any], incident_id: str) -> Tuple[bool, int]:
+    """Fold a flapping alert into its incident; returns (flapping just engaged, total flap count)."""
+    pipe = r.pipeline(transaction=False)
+    pipe.set(f"nms:flapping:{alert['nms_ref']}", incident_id, ex=FLAP_WINDOW_SEC, nx=True)
+    pipe.expire(f"nms:flapping:{alert['nms_ref']}", FLAP_WINDOW_SEC)
+    pipe.hincrby(FLAP_COUNTS_KEY, incident_id, 1)
+    pipe.incr(f"nms:flaptotal:{incident_id}")
+    pipe.expire(f"nms:flaptotal:{incident_id}", DEDUP_WINDOW_SEC)
+    engaged, _, _, total, _ = await pipe.execute()
+    return bool(engaged), int(total)
@@ -0,0 +1,257 @@
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.redis_client import get_redis
+from app.models.device import Device
+from app.models.incident import Incident
+from app.services import alert_dedup, correlation
+from app.services.maint_index import maint_index
+
+
+LIBRENMS_SEVERITY = {"critical": "P1", "major": "P2", "minor": "P3", "warning": "P3", "info": "P4"}
+ZABBIX_SEVERITY = {"Disaster": "P1", "High": "P2", "Average": "P3", "Warning": "P3", "Info": "P4"}
+DEDUP_WINDOW = timedelta(seconds=alert_dedup.DEDUP_WINDOW_SEC)
+
+log = logging.getLogger(__name__)
+
+
+# Normalized alert shape shared by the single and batch webhook paths:
+# source, host, severity, category, title, description, nms_ref, problem
+def normalize_librenms(data: Dict[str, Any]) -> Dict[str, Any]:
+    host = data.get("hostname")
+    sev = str(data.get("severity", "critical")).lower()
+    rule = data.get("rule", "LibreNMS Alert")
+    state = data.get("state", "alert")
+    return {
+        "source": "librenms",
+        "host": host,
+        "severity": LIBRENMS_SEVERITY.get(sev, "P3"),
+        "category": "Device",
+        "title": f"{host} {rule} {state}",
+        "description": data.get("msg", ""),
+        "nms_ref": f"librenms:{data.get('alert_id')}",
+        "problem": True,
+    }
+
+
+def normalize_zabbix(data: Dict[str, Any]) -> Dict[str, Any]:
+    host = data.get("host")
+    sev = str(data.get("severity", "Average"))
+    return {
+        "source": "zabbix",
+        "host": host,
+        "severity": ZABBIX_SEVERITY.get(sev, "P3"),
+        "category": "Device",
+        "title": f"{host} {data.get('name', 'Zabbix Alert')}",
+        "description": data.get("message", ""),
+        "nms_ref": f"zabbix:{data.get('event_id', '')}",
+        "problem": bool(data.get("problem", True)),
+    }
+
+
+def _load_devices(db: Session, hosts: List[str]) -> Dict[str, Device]:
+    if not hosts:
+        return {}
+    devices: Dict[str, Device] = {}
+    for d in db.query(Device).filter(Device.name.in_(hosts)).all():
+        devices.setdefault(d.name, d)
+    return devices
+
+
+def _recent_incidents(db: Session, now: datetime, keys: set) -> Dict[tuple, Any]:
+    if not keys:
+        return {}
+    refs = sorted({ref for ref, _ in keys})
+    cats = sorted({cat for _, cat in keys})
+    rows = (
+        db.query(Incident.id, Incident.nms_ref, Incident.category)
+        .filter(Incident.nms_ref.in_(refs))
+        .filter(Incident.category.in_(cats))
+        .filter(Incident.opened_at >= now - DEDUP_WINDOW)
+        .order_by(Incident.opened_at.desc())
+        .all()
+    )
+    found: Dict[tuple, Any] = {}
+    for r in rows:
+        found.setdefault((r.nms_ref, r.category), r.id)
+    return found
+
+
+def process_alerts(db: Session, alerts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resolve devices, suppression, dedup and inserts for a batch of normalized alerts.
+
+    Issues a fixed number of statements per batch regardless of its size and commits once;
+    maintenance suppression is answered by the in-process window index. New incidents on
+    ONTs behind a failing upstream element are linked under one correlation parent.
+    Results are returned in input order and mirror the single-alert webhook responses.
+    """
+    now = datetime.now(timezone.utc)
+    results: List[Dict[str, Any]] = [{} for _ in alerts]
+
+    devices = _load_devices(db, sorted({a["host"] for a in alerts if a.get("host")}))
+
+    problems = [i for i, a in enumerate(alerts) if a["problem"]]
+
+    def suppressed(device: Device | None) -> bool:
+        if not device:
+            return maint_index.is_suppressed(db, now=now)
+        return maint_index.is_suppressed(db, device_id=device.id, pon_id=device.pon_id, now=now)
+
+    recent = _recent_incidents(db, now, {(alerts[i]["nms_ref"], alerts[i]["category"]) for i in problems})
+
+    new_rows: List[Dict[str, Any]] = []
+    new_idx: List[int] = []
+    for i in problems:
+        a = alerts[i]
+        device = devices.get(a["host"])
+        if suppressed(device):
+            results[i] = {"ok": True, "suppressed": True, "reason": "maintenance window"}
+            continue
+        key = (a["nms_ref"], a["category"])
+        existing_id = recent.get(key)
+        if existing_id is not None:
+            results[i] = {"ok": True, "incident_id": str(existing_id), "dedup": True}
+            continue
+        inc_id = uuid.uuid4()
+        # Later alerts in the same batch with this ref dedup onto the new incident
+        recent[key] = inc_id
+        new_rows.append(
+            {
+                "id": inc_id,
+                "device_id": device.id if device else None,
+                "pon_id": device.pon_id if device else None,
+                "severity": a["severity"],
+                "category": a["category"],
+                "title": a["title"],
+                "description": a["description"],
+                "status": "Open",
+                "nms_ref": a["nms_ref"],
+                "opened_at": now,
+                "parent_incident_id": None,
+            }
+        )
+        new_idx.append(i)
+        results[i] = {"ok": True, "incident_id": str(inc_id)}
+
+    if new_rows:
+        correlation.correlate(db, new_rows, now)
+        db.execute(insert(Incident), new_rows)
+        for i, row in zip(new_idx, new_rows):
+            if row.get("parent_incident_id"):
+                results[i]["parent_incident_id"] = str(row["parent_incident_id"])
+
+    # Clears: only the last event per ref in the batch decides whether it resolves
+    last_event = {a["nms_ref"]: i for i, a in enumerate(alerts)}
+    clears = [i for i, a in enumerate(alerts) if not a["problem"]]
+    clear_refs = sorted({alerts[i]["nms_ref"] for i in clears if last_event[alerts[i]["nms_ref"]] == i})
+    cleared: Dict[str, str] = {}
+    if clear_refs:
+        # A clear resolves the newest still-open incident per ref, like the single-alert path;
+        # already Resolved incidents keep their resolved_at
+        newest_open = (
+            select(Incident.id)
+            .where(Incident.nms_ref.in_(clear_refs))
+            .where(Incident.status.notin_(["Closed", "Resolved"]))
+            .distinct(Incident.nms_ref)
+            .order_by(Incident.nms_ref, Incident.opened_at.desc())
+        )
+        rows = db.execute(
+            update(Incident)
+            .where(Incident.id.in_(newest_open.scalar_subquery()))
+            .values(status="Resolved", resolved_at=now)
+            .returning(Incident.id, Incident.nms_ref, Incident.parent_incident_id)
+        ).all()
+        for r in rows:
+            cleared[r.nms_ref] = str(r.id)
+        correlation.resolve_parents(db, [r.parent_incident_id for r in rows], now)
+    for i in clears:
+        ref = alerts[i]["nms_ref"]
+        if last_event[ref] != i:
+            results[i] = {"ok": True, "message": "Superseded by later alert in batch"}
+        elif ref in cleared:
+            results[i] = {"ok": True, "incident_id": cleared[ref], "cleared": True}
+        else:
+            results[i] = {"ok": True, "message": "No open incident"}
+
+    db.commit()
+    return results
+
+
+def reopen_flapping(db: Session, incident_ids: List[str]) -> None:
+    # Flapping incidents stay open while damped; one write per flap episode
+    if not incident_ids:
+        return
+    db.execute(
+        update(Incident)
+        .where(Incident.id.in_([uuid.UUID(i) for i in incident_ids]))
+        .where(Incident.status != "Closed")
+        .values(
+            status=case((Incident.parent_incident_id.isnot(None), correlation.CORRELATED), else_="Open"),
+            resolved_at=None,
+        )
+    )
+    db.commit()
+
+
+def _db_stage(db: Session, alerts: List[Dict[str, Any]], reopen: List[str]) -> List[Dict[str, Any]]:
+    results = process_alerts(db, alerts) if alerts else []
+    reopen_flapping(db, reopen)
+    return results
+
+
+async def ingest_alerts(db: Session, alerts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Redis dedup and flap damping in front of `process_alerts`.
+
+    Alerts whose nms_ref already maps to an incident in Redis are answered without touching
+    the database; flapping refs are folded into their incident with a counter that the
+    scheduler flushes to incidents.flap_count. Only the rest reach the set-based DB stage.
+    Falls back to the DB-only path when Redis is unavailable (an alert that cannot be damped
+    goes to the DB stage).
+    """
+    try:
+        r = await get_redis()
+        cached = await alert_dedup.lookup(r, alerts)
+        changes = await alert_dedup.record_states(r, alerts)
+    except Exception as e:  # noqa: BLE001
+        log.warning("alert dedup unavailable, using database only: %s", e)
+        return await run_in_threadpool(process_alerts, db, alerts)
+
+    results: List[Dict[str, Any]] = [{} for _ in alerts]
+    pending: List[int] = []
+    reopen: List[str] = []
+    for i, a in enumerate(alerts):
+        incident_id = cached[i]
+        flapping = changes[i] >= alert_dedup.FLAP_CHANGES
+        if incident_id and flapping:
+            try:
+                engaged, count = await alert_dedup.damp(r, a, incident_id)
+            except Exception as e:  # noqa: BLE001
+                # Its state change is already counted: the DB stage handles it, a retry would count it twice
+                log.warning("flap damping unavailable for %s, using database: %s", a["nms_ref"], e)
+                pending.append(i)
+                continue
+            if engaged:
+                reopen.append(incident_id)
+            results[i] = {"ok": True, "incident_id": incident_id, "flapping": True, "flap_count": count}
+            results[i]["dedup" if a["problem"] else "damped"] = True
+        elif incident_id and a["problem"]:
+            results[i] = {"ok": True, "incident_id": incident_id, "dedup": True}
+        else:
+            pending.append(i)
+
+    if pending or reopen:
+        db_results = await run_in_threadpool(_db_stage, db, [alerts[i] for i in pending], reopen)
+        for i, res in zip(pending, db_results):
+            results[i] = res
+        seen = [(alerts[i], res["incident_id"]) for i, res in zip(pending, db_results) if alerts[i]["problem"] and res.get("incident_id")]
+        try:
+            await alert_dedup.remember(r, seen)
+        except Exception as e:  # noqa: BLE001
+            log.warning("failed to cache alert dedup keys: %s", e)
+    return results
@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.models.device import Device
+from app.models.incident import Incident
+from app.models.topology_ext import PortMap, Splitter, TopoEdge, TopoNode
+
+
+CORRELATION_ENABLED = os.getenv("CORRELATION_ENABLED", "true").lower() in ("1", "true", "yes")
+CORRELATION_WINDOW_SEC = int(os.getenv("CORRELATION_WINDOW_SEC", "300"))
+CORRELATION_MIN_CHILDREN = int(os.getenv("CORRELATION_MIN_CHILDREN", "3"))
+CORRELATION_MIN_RATIO = float(os.getenv("CORRELATION_MIN_RATIO", "0.5"))
+TOPOLOGY_CACHE_TTL_SEC = float(os.getenv("TOPOLOGY_CACHE_TTL_SEC", "300"))
+
+CORRELATED = "Correlated"
+REF_PREFIX = "corr:"
+
+# Upstream elements an ONT hangs off, e.g. ("olt", id), ("olt_port", id, "0/1/3"),
+# ("cable", "FDR-012"), ("splitter", id)
+Element = Tuple[Any, ...]
+
+
+class Topology:
+    """Upstream path of every mapped ONT, outermost element first, plus element sizes."""
+
+    def __init__(self):
+        self.paths: Dict[Any, Tuple[Element, ...]] = {}
+        self.size: Dict[Element, int] = {}
+        self.members: Dict[Element, List[Any]] = {}
+        self.labels: Dict[Element, str] = {}
+        self.pons: Dict[Element, Any] = {}
+
+    def add(self, device_id: Any, path: Iterable[Element], pon_id: Any, labels: Dict[Element, str]) -> None:
+        path = tuple(path)
+        if not path or device_id in self.paths:
+            return
+        self.paths[device_id] = path
+        for el in path:
+            self.size[el] = self.size.get(el, 0) + 1
+            self.members.setdefault(el, []).append(device_id)
+            self.labels.setdefault(el, labels.get(el) or element_ref(el))
+            self.pons.setdefault(el, pon_id)
+
+
+def element_ref(el: Element) -> str:
+    return REF_PREFIX + ":".join(str(p) for p in el)
+
+
+def _cable_paths(nodes, edges) -> Dict[Tuple[Any, str], List[str]]:
+    """Cable codes from the OLT node to every node of each PON, keyed by (pon_id, node code)."""
+    by_id = {n.id: n for n in nodes}
+    adj: Dict[Any, List[Tuple[Any, Optional[str]]]] = {}
+    for e in edges:
+        adj.setdefault(e.a_id, []).append((e.b_id, e.cable_code))
+        adj.setdefault(e.b_id, []).append((e.a_id, e.cable_code))
+    out: Dict[Tuple[Any, str], List[str]] = {}
+    for root in nodes:
+        if (root.type or "").lower() != "olt" or (root.pon_id, root.code) in out:
+            continue
+        out[(root.pon_id, root.code)] = []
+        queue = deque([root.id])
+        while queue:
+            nid = queue.popleft()
+            here = out[(by_id[nid].pon_id, by_id[nid].code)]
+            for nxt, cable in adj.get(nid, []):
+                n = by_id.get(nxt)
+                if n is None or (n.pon_id, n.code) in out:
+                    continue
+                path = list(here)
+                if cable and (not path or path[-1] != cable):
+                    path.append(cable)
+                out[(n.pon_id, n.code)] = path
+                queue.append(nxt)
+    return out
+
+
+def load_topology(db: Session) -> Topology:
+    ports = (
+        db.query(PortMap.onu_device_id, PortMap.olt_device_id, PortMap.olt_port, PortMap.splitter_id, PortMap.pon_id)
+        .filter(PortMap.onu_device_id.isnot(None))
+        .all()
+    )
+    splitters = {s.id: s for s in db.query(Splitter.id, Splitter.code, Splitter.pon_id).all()}
+    olt_ids = {p.olt_device_id for p in ports if p.olt_device_id}
+    olt_names = dict(db.query(Device.id, Device.name).filter(Device.id.in_(olt_ids)).all()) if olt_ids else {}
+    cables = _cable_paths(
+        db.query(TopoNode.id, TopoNode.type, TopoNode.code, TopoNode.pon_id).all(),
+        db.query(TopoEdge.a_id, TopoEdge.b_id, TopoEdge.cable_code).all(),
+    )
+
+    topo = Topology()
+    for p in ports:
+        path: List[Element] = []
+        labels: Dict[Element, str] = {}
+        if p.olt_device_id:
+            olt = ("olt", p.olt_device_id)
+            name = olt_names.get(p.olt_device_id, str(p.olt_device_id))
+            path.append(olt)
+            labels[olt] = f"OLT {name}"
+            if p.olt_port:
+                port = ("olt_port", p.olt_device_id, p.olt_port)
+                path.append(port)
+                labels[port] = f"OLT {name} port {p.olt_port}"
+        s = splitters.get(p.splitter_id)
+        if s is not None:
+            for code in cables.get((s.pon_id, s.code), []):
+                path.append(("cable", code))
+                labels[("cable", code)] = f"Cable {code}"
+            spl = ("splitter", s.id)
+            path.append(spl)
+            labels[spl] = f"Splitter {s.code}"
+        topo.add(p.onu_device_id, path, p.pon_id, labels)
+    return topo
+
+
+class TopologyCache:
+    """Process-local copy of the PON topology, reloaded after `ttl_sec` or `invalidate()`."""
+
+    def __init__(
+        self,
+        loader: Callable[[Session], Topology] = load_topology,
+        ttl_sec: float = TOPOLOGY_CACHE_TTL_SEC,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._loader = loader
+        self._ttl = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._topo: Optional[Topology] = None
+        self._loaded_at: Optional[float] = None
+        self._counters = {"refreshes": 0, "invalidations": 0, "refresh_errors": 0}
+
+    def get(self, db: Session) -> Topology:
+        loaded_at = self._loaded_at
+        if self._topo is not None and loaded_at is not None and self._clock() - loaded_at < self._ttl:
+            return self._topo
+        with self._lock:
+            if self._topo is not None and self._loaded_at is not None and self._clock() - self._loaded_at < self._ttl:
+                return self._topo
+            try:
+                self._topo = self._loader(db)
+            except Exception:
+                self._counters["refresh_errors"] += 1
+                if self._topo is None:
+                    raise
+                return self._topo
+            self._loaded_at = self._clock()
+            self._counters["refreshes"] += 1
+            return self._topo
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        topo = self._topo
+        loaded_at = self._loaded_at
+        return {
+            **self._counters,
+            "devices": len(topo.paths) if topo else 0,
+            "elements": len(topo.size) if topo else 0,
+            "ttl_sec": self._ttl,
+            "age_sec": None if loaded_at is None else round(self._clock() - loaded_at, 3),
+        }
+
+
+topology_cache = TopologyCache()
+
+
+class Plan:
+    def __init__(self):
+        self.assign: Dict[int, Element] = {}
+        self.new_parents: List[Element] = []
+        self.relink: List[Tuple[Any, Element]] = []
+        self.nest: List[Tuple[Element, Element]] = []
+        self.counts: Dict[Element, int] = {}
+
+
+def plan(
+    topo: Topology,
+    batch: List[Tuple[int, Any]],
+    recent: List[Tuple[Any, Any, Any]],
+    open_parents: Dict[Element, Any],
+    min_children: int = CORRELATION_MIN_CHILDREN,
+    min_ratio: float = CORRELATION_MIN_RATIO,
+) -> Plan:
+    """Pick the root-cause element for each new alert.
+
+    `batch` holds (row index, device_id) of new problem alerts, `recent` (incident_id,
+    device_id, parent_incident_id) of problem incidents opened within the window and
+    `open_parents` the element of every open correlation parent. Walking each path from the
+    OLT down, an alert joins the first element that already has an open parent, or that now
+    has at least `min_children` down ONTs making up `min_ratio` of everything behind it
+    (narrowed to the deepest element on the path with the same failures).
+    """
+    out = Plan()
+    down: Set[Any] = {d for _, d, _ in recent if d in topo.paths}
+    down.update(d for _, d in batch if d in topo.paths)
+    counts: Dict[Element, int] = {}
+    for d in down:
+        for el in topo.paths[d]:
+            counts[el] = counts.get(el, 0) + 1
+    out.counts = counts
+
+    def root_of(path: Tuple[Element, ...]) -> Optional[Element]:
+        for k, el in enumerate(path):
+            if el in open_parents:
+                return el
+            n = counts.get(el, 0)
+            if n >= min_children and n >= min_ratio * topo.size[el]:
+                # Narrow to the tightest element that still explains every failure below it
+                while k + 1 < len(path) and counts.get(path[k + 1], 0) == n:
+                    k += 1
+                return path[k]
+        return None
+
+    chosen: Set[Element] = set()
+    for idx, device_id in batch:
+        path = topo.paths.get(device_id)
+        el = root_of(path) if path else None
+        if el is None:
+            continue
+        out.assign[idx] = el
+        if el not in open_parents and el not in chosen:
+            out.new_parents.append(el)
+        chosen.add(el)
+
+    if not out.new_parents:
+        return out
+    fresh = set(out.new_parents)
+    # Alerts that opened standalone incidents earlier in the storm move under the new parent
+    for incident_id, device_id, parent_id in recent:
+        path = topo.paths.get(device_id)
+        if parent_id is None and path:
+            el = next((e for e in path if e in fresh), None)
+            if el is not None:
+                out.relink.append((incident_id, el))
+    # Parents opened on a smaller element (e.g. one splitter) nest under the wider outage
+    for el in open_parents:
+        members = topo.members.get(el)
+        if not members:
+            continue
+        path = topo.paths[members[0]]
+        upper = next((e for e in path[: path.index(el)] if e in fresh), None)
+        if upper is not None:
+            out.nest.append((el, upper))
+    return out
+
+
+def correlate(db: Session, rows: List[Dict[str, Any]], now: datetime) -> List[Dict[str, Any]]:
+    """Link new problem incident rows under topology parents before they are inserted.
+
+    Mutates `rows` (parent_incident_id, status) and writes new parents, relinks and nesting
+    with a fixed number of statements. Returns the inserted parent rows.
+    """
+    if not CORRELATION_ENABLED or not rows:
+        return []
+    topo = topology_cache.get(db)
+    batch = [(i, r["device_id"]) for i, r in enumerate(rows) if r.get("device_id") in topo.paths]
+    if not batch:
+        return []
+
+    tops = {topo.paths[d][0] for _, d in batch}
+    scope = sorted({m for el in tops for m in topo.members[el]}, key=str)
+    recent = (
+        db.query(Incident.id, Incident.device_id, Incident.parent_incident_id)
+        .filter(Incident.device_id.in_(scope))
+        .filter(Incident.opened_at >= now - timedelta(seconds=CORRELATION_WINDOW_SEC))
+        .filter(Incident.status.in_(("Open", CORRELATED)))
+        .all()
+    )
+    refs = {element_ref(el): el for _, d in batch for el in topo.paths[d]}
+    open_parents = {
+        refs[r.nms_ref]: r.id
+        for r in db.query(Incident.id, Incident.nms_ref)
+        .filter(Incident.nms_ref.in_(sorted(refs)))
+        .filter(Incident.status.in_(("Open", "Acknowledged")))
+        .all()
+    }
+
+    p = plan(topo, batch, [(r.id, r.device_id, r.parent_incident_id) for r in recent], open_parents)
+    if not p.assign:
+        return []
+
+    parents: List[Dict[str, Any]] = []
+    ids = dict(open_parents)
+    for el in p.new_parents:
+        ids[el] = uuid.uuid4()
+        parents.append(
+            {
+                "id": ids[el],
+                "device_id": el[1] if el[0] in ("olt", "olt_port") else None,
+                "pon_id": topo.pons.get(el),
+                "severity": "P1",
+                "category": "Link",
+                "title": f"{topo.labels[el]} outage",
+                "description": f"Correlated outage: {p.counts[el]} of {topo.size[el]} ONTs down",
+                "status": "Open",
+                "nms_ref": element_ref(el),
+                "opened_at": now,
+            }
+        )
+    for idx, el in p.assign.items():
+        rows[idx]["parent_incident_id"] = ids[el]
+        rows[idx]["status"] = CORRELATED
+
+    if parents:
+        db.execute(insert(Incident), parents)
+    if p.relink:
+        db.execute(
+            update(Incident),
+            [{"id": i, "parent_incident_id": ids[el], "status": CORRELATED} for i, el in p.relink],
+        )
+    if p.nest:
+        db.execute(update(Incident), [{"id": ids[child], "parent_incident_id": ids[el]} for child, el in p.nest])
+    return parents
+
+
+def resolve_parents(db: Session, parent_ids: Iterable[Any], now: datetime) -> List[Any]:
+    """Resolve correlation parents once none of their children is still open."""
+    parent_ids = sorted({p for p in parent_ids if p is not None}, key=str)
+    if not parent_ids:
+        return []
+    still_open = {
+        r.parent_incident_id
+        for r in db.query(Incident.parent_incident_id)
+        .filter(Incident.parent_incident_id.in_(parent_ids))
+        .filter(Incident.status.notin_(("Resolved", "Closed")))
+        .distinct()
+        .all()
+    }
+    done = [p for p in parent_ids if p not in still_open]
+    if not done:
+        return []
+    rows = db.execute(
+        update(Incident)
+        .where(Incident.id.in_(done))
+        .where(Incident.status.notin_(("Resolved", "Closed")))
+        .values(status="Resolved", resolved_at=now)
+        .returning(Incident.id, Incident.parent_incident_id)
+    ).all()
+    # A nested parent resolving may complete the wider outage above it
+    return [r.id for r in rows] + resolve_parents(db, [r.parent_incident_id for r in rows], now)
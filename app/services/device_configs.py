@@ -0,0 +1,69 @@
+import hashlib
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.device import Device, DeviceConfig, GoldenTemplate
+from app.models.incident import Incident
+
+
+def store_config(db: Session, data: Dict[str, Any], config_id: Optional[uuid.UUID] = None) -> Dict[str, Any]:
+    """Persist an Oxidized config snapshot and open a P3 incident on policy violations.
+
+    Passing a deterministic `config_id` makes redelivery idempotent: a snapshot that was
+    already stored is reported again instead of inserted twice.
+    Raises ValueError for malformed payloads and LookupError for unknown devices.
+    """
+    # Expect at least: {"name": "OLT-01", "config": "..."}
+    name = data.get("name")
+    config_text = data.get("config")
+    if not name or not config_text:
+        raise ValueError("name and config required")
+
+    device = db.query(Device).filter(Device.name == name).first()
+    if not device:
+        raise LookupError("Device not found")
+
+    if config_id is not None:
+        existing = db.get(DeviceConfig, config_id)
+        if existing:
+            return {"ok": True, "device_id": str(device.id), "config_id": str(existing.id), "duplicate": True}
+
+    cfg = DeviceConfig(
+        id=config_id or uuid.uuid4(),
+        device_id=device.id,
+        running_config=config_text,
+        collected_at=datetime.now(timezone.utc),
+        hash_sha256=hashlib.sha256(config_text.encode()).hexdigest(),
+    )
+    db.add(cfg)
+    db.flush()
+
+    # Diff/policy check against golden template by device role
+    gt = db.query(GoldenTemplate).filter(GoldenTemplate.device_role == device.role).first()
+    out_of_policy = []
+    if gt and gt.policy_regex_deny:
+        for line in config_text.splitlines():
+            if re.search(gt.policy_regex_deny, line):
+                out_of_policy.append(line)
+
+    if out_of_policy:
+        inc = Incident(
+            id=uuid.uuid4(),
+            device_id=device.id,
+            pon_id=device.pon_id,
+            severity="P3",
+            category="Config",
+            title=f"Out-of-policy config on {device.name}",
+            description="\n".join(out_of_policy[:50]),
+            status="Open",
+            opened_at=datetime.now(timezone.utc),
+            nms_ref=f"oxidized:{cfg.id}",
+        )
+        db.add(inc)
+
+    db.commit()
+    return {"ok": True, "device_id": str(device.id), "config_id": str(cfg.id), "violations": len(out_of_policy)}
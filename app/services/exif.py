@@ -1,10 +1,56 @@
+"""Photo EXIF: capture time (DateTimeOriginal, taken as UTC) and GPS position.
+
+read_exif() fetches only the head of the object with an S3 Range GET (EXIF_HEAD_BYTES),
+finds the EXIF block (JPEG APP1 "Exif" segment or PNG eXIf chunk) and walks its TIFF
+IFDs once. More bytes are read only when the block ends past the head (e.g. a large ICC
+profile segment before it); formats or blocks it cannot read fall back to the full
+object and parse_exif().
+"""
+import logging
+import os
+import struct
+from concurrent.futures import Executor, ThreadPoolExecutor
 from io import BytesIO
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from PIL import Image
 import exifread
 
+from app.services import s3
+
+
+EXIF_HEAD_BYTES = int(os.getenv("EXIF_HEAD_BYTES", str(128 * 1024)))
+# Concurrent S3 reads for bulk registration; the work is network bound, so threads
+EXIF_THREADS = int(os.getenv("EXIF_THREADS", "16"))
+
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+# TIFF field type -> bytes per value (BYTE, ASCII, SHORT, LONG, RATIONAL, UNDEFINED, SLONG, SRATIONAL)
+_TYPE_SIZE = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+log = logging.getLogger(__name__)
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> Optional[Executor]:
+    global _pool
+    if EXIF_THREADS <= 1:
+        return None
+    if _pool is None:
+        _pool = ThreadPoolExecutor(EXIF_THREADS, thread_name_prefix="exif")
+    return _pool
+
+
+class Truncated(Exception):
+    """The EXIF block continues past the bytes read; `needed` is the length required."""
+
+    def __init__(self, needed: int):
+        super().__init__(needed)
+        self.needed = needed
+
 
 def _to_deg(value) -> float:
     d = float(value[0].num) / float(value[0].den)
@@ -13,6 +59,11 @@ def _to_deg(value) -> float:
     return d + (m / 60.0) + (s / 3600.0)
 
 
+def _to_deg_floats(dms) -> float:
+    d, m, s = (list(dms) + [0.0, 0.0, 0.0])[:3]
+    return d + (m / 60.0) + (s / 3600.0)
+
+
 def parse_exif(stream: bytes) -> dict:
     """Return dict: taken_ts (UTC), gps_lat, gps_lng."""
     out: dict[str, Optional[float | datetime]] = {"taken_ts": None, "gps_lat": None, "gps_lng": None}
@@ -58,3 +109,166 @@ def parse_exif(stream: bytes) -> dict:
 
     return out
 
+
+def _exif_block(data: bytes) -> Optional[bytes]:
+    """TIFF bytes of the EXIF block, None when the image has none.
+
+    Raises Truncated when more of the file is needed and ValueError for other formats.
+    """
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while True:
+            if i + 4 > len(data):
+                raise Truncated(i + 4)
+            if data[i] != 0xFF:
+                raise ValueError("bad JPEG marker")
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker in (0xD9, 0xDA):  # EOI / start of scan: no EXIF before the image data
+                return None
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            end = i + 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+            if marker == 0xE1:
+                if i + 10 > len(data):
+                    raise Truncated(i + 10)
+                if data[i + 4 : i + 10] == b"Exif\x00\x00":
+                    if end > len(data):
+                        raise Truncated(end)
+                    return data[i + 10 : end]
+            i = end
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        i = 8
+        while True:
+            if i + 8 > len(data):
+                raise Truncated(i + 8)
+            n = int.from_bytes(data[i : i + 4], "big")
+            kind = data[i + 4 : i + 8]
+            if kind == b"eXIf":
+                if i + 8 + n > len(data):
+                    raise Truncated(i + 12 + n)
+                return data[i + 8 : i + 8 + n]
+            if kind in (b"IDAT", b"IEND"):
+                return None
+            i += 12 + n
+    raise ValueError("not a JPEG or PNG")
+
+
+def _ifd(tiff: bytes, offset: int, order: str) -> Dict[int, Tuple[int, int, bytes]]:
+    """Entries of one IFD: tag -> (type, count, raw value bytes)."""
+    (n,) = struct.unpack_from(order + "H", tiff, offset)
+    out = {}
+    for k in range(n):
+        p = offset + 2 + 12 * k
+        tag, typ, count = struct.unpack_from(order + "HHI", tiff, p)
+        size = _TYPE_SIZE.get(typ, 1) * count
+        if size <= 4:
+            raw = tiff[p + 8 : p + 8 + size]
+        else:
+            (at,) = struct.unpack_from(order + "I", tiff, p + 8)
+            raw = tiff[at : at + size]
+            if len(raw) < size:
+                raise ValueError(f"EXIF tag {tag:#x} points past the block")
+        out[tag] = (typ, count, raw)
+    return out
+
+
+def _value(entry: Tuple[int, int, bytes], order: str) -> Any:
+    typ, count, raw = entry
+    if typ == 2:
+        return raw.split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+    if typ in (5, 10):
+        nums = struct.unpack(order + ("I" if typ == 5 else "i") * (2 * count), raw)
+        return [a / b if b else 0.0 for a, b in zip(nums[::2], nums[1::2])]
+    if typ in (3, 4, 9):
+        return list(struct.unpack(order + {3: "H", 4: "I", 9: "i"}[typ] * count, raw))
+    return raw
+
+
+def parse_tiff(tiff: bytes) -> Dict[str, Any]:
+    """DateTimeOriginal and GPS from an EXIF TIFF block (same dict as parse_exif)."""
+    out: Dict[str, Any] = {"taken_ts": None, "gps_lat": None, "gps_lng": None}
+    if tiff[:4] not in (b"II*\x00", b"MM\x00*"):
+        raise ValueError("bad TIFF header")
+    order = "<" if tiff[:2] == b"II" else ">"
+    (ifd0_at,) = struct.unpack_from(order + "I", tiff, 4)
+    ifd0 = _ifd(tiff, ifd0_at, order)
+
+    if TAG_EXIF_IFD in ifd0:
+        sub = _ifd(tiff, _value(ifd0[TAG_EXIF_IFD], order)[0], order)
+        if TAG_DATETIME_ORIGINAL in sub:
+            try:
+                dto = _value(sub[TAG_DATETIME_ORIGINAL], order)
+                out["taken_ts"] = datetime.strptime(dto, "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            except ValueError:
+                pass
+
+    if TAG_GPS_IFD in ifd0:
+        gps = _ifd(tiff, _value(ifd0[TAG_GPS_IFD], order)[0], order)
+        if all(t in gps for t in (1, 2, 3, 4)):
+            lat = _to_deg_floats(_value(gps[2], order))
+            lng = _to_deg_floats(_value(gps[4], order))
+            if str(_value(gps[1], order)).upper().startswith("S"):
+                lat = -lat
+            if str(_value(gps[3], order)).upper().startswith("W"):
+                lng = -lng
+            out["gps_lat"] = round(lat, 6)
+            out["gps_lng"] = round(lng, 6)
+    return out
+
+
+def parse_head(data: bytes) -> Dict[str, Any]:
+    """parse_exif() of the leading bytes of a file; raises Truncated when they are not enough."""
+    tiff = _exif_block(data)
+    if tiff is None:
+        return {"taken_ts": None, "gps_lat": None, "gps_lng": None}
+    return parse_tiff(tiff)
+
+
+def read_exif(key: str, size: int) -> Dict[str, Any]:
+    """parse_exif() of an S3 object of `size` bytes, reading only as much of it as needed."""
+    data = s3.get_object_range(key, 0, min(size, EXIF_HEAD_BYTES) - 1)
+    while True:
+        try:
+            return parse_head(data)
+        except Truncated as t:
+            if len(data) >= size:
+                break
+            upto = min(size, max(t.needed, len(data) + EXIF_HEAD_BYTES))
+            data += s3.get_object_range(key, len(data), upto - 1)
+        except (ValueError, struct.error) as e:
+            log.info("EXIF header parse of %s failed (%s); reading whole object", key, e)
+            break
+    if len(data) < size:
+        data = s3.get_object_bytes(key)
+    return parse_exif(data)
+
+
+def fetch_photo(key: str) -> Dict[str, Any]:
+    """Check an uploaded photo (type, size) and read its EXIF; errors are returned, not raised."""
+    try:
+        meta = s3.head_object(key)
+    except Exception:  # noqa: BLE001
+        return {"s3_key": key, "error": "S3 object not found"}
+    ctype = (meta.get("ContentType") or "").lower()
+    size = int(meta.get("ContentLength") or 0)
+    if s3.settings.ALLOWED_CONTENT_TYPES and ctype not in s3.settings.ALLOWED_CONTENT_TYPES:
+        return {"s3_key": key, "error": f"Unsupported Content-Type: {ctype}"}
+    if size <= 0 or size > s3.settings.FILE_MAX_BYTES:
+        return {"s3_key": key, "error": "File too large"}
+    try:
+        return {"s3_key": key, **read_exif(key, size)}
+    except Exception as e:  # noqa: BLE001
+        return {"s3_key": key, "error": str(e) or type(e).__name__}
+
+
+def fetch_many(keys: Iterable[str], pool: Optional[Executor] = None) -> List[Dict[str, Any]]:
+    """fetch_photo() for many keys on the thread pool, in input order."""
+    keys = list(keys)
+    pool = pool if pool is not None else get_pool()
+    if pool is None or len(keys) < 2:
+        return [fetch_photo(k) for k in keys]
+    return list(pool.map(fetch_photo, keys))
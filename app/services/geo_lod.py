@@ -0,0 +1,118 @@
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis_sync
+
+
+# Simplification tolerances in degrees, coarsest first (~550 m .. ~11 m at the equator).
+# Must match the default of rebuild_geo_lods() in migration 0017.
+LOD_TOLERANCES: List[float] = [0.005, 0.002, 0.0008, 0.0003, 0.0001]
+FULL = -1
+GEO_CACHE_TTL_SEC = int(os.getenv("GEO_CACHE_TTL_SEC", "604800"))
+
+# layer -> (source table, properties expression)
+GEO_LAYERS: Dict[str, Tuple[str, str]] = {
+    "wards": ("geo_wards", "json_build_object('name', t.name, 'code', t.code)"),
+    "suburbs": ("geo_suburbs", "json_build_object('name', t.name, 'ward_id', t.ward_id)"),
+}
+
+log = logging.getLogger(__name__)
+
+
+def level_for(zoom: Optional[float] = None, tolerance: Optional[float] = None) -> int:
+    """Coarsest precomputed level whose tolerance stays below one screen pixel at `zoom`."""
+    if tolerance is None and zoom is None:
+        return FULL
+    if tolerance is None:
+        tolerance = 360.0 / (256 * 2 ** max(0.0, zoom))
+    for level, tol in enumerate(LOD_TOLERANCES):
+        if tol <= tolerance:
+            return level
+    return FULL
+
+
+def _digits(level: int) -> int:
+    # Coordinates finer than a tenth of the tolerance are noise in the payload
+    if level == FULL:
+        return 7
+    return max(3, math.ceil(-math.log10(LOD_TOLERANCES[level])) + 1)
+
+
+def dataset_version(db: Session, layer: str) -> Tuple[int, int]:
+    row = db.execute(
+        text("select version, lod_version from geo_dataset_versions where layer = :l"), {"l": layer}
+    ).first()
+    return (int(row.version), int(row.lod_version)) if row else (0, 0)
+
+
+def feature_collection(db: Session, layer: str, level: int, bbox: Optional[List[float]] = None, lods_ready: bool = True) -> str:
+    """FeatureCollection text assembled by Postgres for one LOD level."""
+    table, props = GEO_LAYERS[layer]
+    params: Dict[str, object] = {"digits": _digits(level), "layer": layer, "level": level}
+    if level == FULL:
+        source = f"select t.id, t.geom, {props} as props from {table} t"
+    elif lods_ready:
+        source = f"""
+            select t.id, s.geom, {props} as props
+            from geo_simplified s join {table} t on t.id = s.feature_id
+            where s.layer = :layer and s.level = :level
+        """
+    else:
+        # Dataset changed since the last rebuild: simplify on the fly until it has run
+        params["tol"] = LOD_TOLERANCES[level]
+        source = f"select t.id, ST_SimplifyPreserveTopology(t.geom, :tol) as geom, {props} as props from {table} t"
+    where = ""
+    if bbox:
+        where = "where f.geom && ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326)"
+        params.update(dict(zip(("minx", "miny", "maxx", "maxy"), bbox)))
+    sql = f"""
+        select json_build_object(
+            'type', 'FeatureCollection',
+            'features', coalesce(json_agg(json_build_object(
+                'type', 'Feature', 'id', f.id::text, 'properties', f.props,
+                'geometry', ST_AsGeoJSON(f.geom, :digits)::json
+            )), '[]'::json)
+        )::text
+        from ({source}) f {where}
+    """
+    return db.execute(text(sql), params).scalar()
+
+
+def get_feature_collection(db: Session, layer: str, level: int) -> Tuple[str, str]:
+    """Whole-layer payload and ETag, rendered once per dataset version and level."""
+    version, lod_version = dataset_version(db, layer)
+    lods_ready = level == FULL or lod_version == version
+    etag = f'"{layer}-{version}-{level}"' if lods_ready else f'"{layer}-{version}-{level}-live"'
+    key = f"geo:{layer}:{version}:{level}"
+    if lods_ready:
+        try:
+            cached = get_redis_sync().get(key)
+            if cached is not None:
+                return cached, etag
+        except Exception as e:  # noqa: BLE001
+            log.warning("geo cache unavailable: %s", e)
+    payload = feature_collection(db, layer, level, lods_ready=lods_ready)
+    if lods_ready:
+        try:
+            get_redis_sync().set(key, payload, ex=GEO_CACHE_TTL_SEC)
+        except Exception as e:  # noqa: BLE001
+            log.warning("failed to cache %s: %s", key, e)
+    return payload, etag
+
+
+def rebuild(db: Session, layer: str) -> int:
+    n = db.execute(
+        text("select rebuild_geo_lods(:l, cast(:tols as float8[]))"), {"l": layer, "tols": LOD_TOLERANCES}
+    ).scalar()
+    db.commit()
+    return int(n or 0)
+
+
+def rebuild_stale(db: Session) -> Dict[str, int]:
+    stale = db.execute(text("select layer from geo_dataset_versions where lod_version <> version")).scalars().all()
+    return {layer: rebuild(db, layer) for layer in stale if layer in GEO_LAYERS}
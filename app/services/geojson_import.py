@@ -0,0 +1,479 @@
+import codecs
+import hashlib
+import json
+import math
+import re
+import uuid
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+READ_CHUNK_BYTES = 1024 * 1024
+# A single feature (or other top-level member) larger than this is rejected rather than buffered
+MAX_VALUE_BYTES = 256 * 1024 * 1024
+
+# Named CRSs accepted in the legacy `crs` member; everything is stored as SRID 4326
+WGS84_CRS = ("urn:ogc:def:crs:OGC:1.3:CRS84", "urn:ogc:def:crs:EPSG::4326", "EPSG:4326", "CRS84")
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class _Reader:
+    """Text window over a binary stream; only the unparsed tail stays in memory."""
+
+    def __init__(self, fp: IO[bytes], chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.text = ""
+
+    def fill(self, size: int) -> None:
+        data = self.fp.read(size)
+        self.eof = not data
+        self.buf = self.buf[self.pos :] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos : self.pos + 1]
+            self.fill(self.chunk_size)
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"expected '{ch}' at offset {self.pos}")
+        self.pos += 1
+
+    def value(self, keep_text: bool = False) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(str(e)) from None
+            else:
+                # A bare number running into the end of the window may continue in the next chunk
+                truncated = end == len(self.buf) and isinstance(obj, (int, float)) and not isinstance(obj, bool)
+                if not truncated or self.eof:
+                    if keep_text:
+                        self.text = self.buf[self.pos : end]
+                    self.pos = end
+                    return obj
+            pending = len(self.buf) - self.pos
+            if pending > MAX_VALUE_BYTES:
+                raise ValueError("GeoJSON member too large")
+            # Grow geometrically so one huge polygon is not re-decoded once per chunk
+            self.fill(max(self.chunk_size, pending))
+
+
+def iter_features(fp: IO[bytes], chunk_size: int = READ_CHUNK_BYTES, raw: bool = False) -> Iterator[Any]:
+    """Yield the features of a GeoJSON FeatureCollection read incrementally from `fp`.
+
+    Only the feature being decoded (plus one read chunk) is held in memory. Other top-level
+    members are decoded and dropped; raises ValueError on malformed input, a `crs` other than
+    WGS84, or when the document is not a FeatureCollection. With `raw=True` each feature is
+    yielded as its JSON text, for handing to worker processes.
+    """
+    r = _Reader(fp, chunk_size)
+    r.expect("{")
+    doc_type = None
+    if r.peek() == "}":
+        r.pos += 1
+    else:
+        while True:
+            key = r.value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected member name at offset {r.pos}")
+            r.expect(":")
+            if key == "features":
+                if doc_type not in (None, "FeatureCollection"):
+                    raise ValueError("Expected GeoJSON FeatureCollection")
+                r.expect("[")
+                if r.peek() == "]":
+                    r.pos += 1
+                else:
+                    while True:
+                        feature = r.value(keep_text=raw)
+                        if not isinstance(feature, dict):
+                            raise ValueError("feature is not an object")
+                        yield r.text if raw else feature
+                        sep = r.peek()
+                        r.pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise ValueError(f"expected ',' or ']' at offset {r.pos - 1}")
+            else:
+                v = r.value()
+                if key == "type":
+                    doc_type = v
+                elif key == "crs":
+                    name = ((v or {}).get("properties") or {}).get("name") if isinstance(v, dict) else None
+                    if name not in WGS84_CRS:
+                        raise ValueError(f"unsupported crs {name!r}; reproject to EPSG:4326")
+            sep = r.peek()
+            r.pos += 1
+            if sep == "}":
+                break
+            if sep != ",":
+                raise ValueError(f"expected ',' or '}}' at offset {r.pos - 1}")
+    if r.peek():
+        raise ValueError("trailing data after GeoJSON document")
+    if doc_type != "FeatureCollection":
+        raise ValueError("Expected GeoJSON FeatureCollection")
+
+
+def _s(v: Any) -> Optional[str]:
+    return None if v is None else str(v)
+
+
+def _num(v: Any) -> Optional[str]:
+    if v is None or v == "":
+        return None
+    float(v)  # ValueError rejects the feature before it reaches the numeric cast
+    return str(v)
+
+
+def _ward_ref(v: Any) -> Optional[str]:
+    return None if v is None else str(uuid.UUID(str(v)))
+
+
+# Enrichment evaluated inside the load: each asset is linked to the ward and suburb under it
+# and flagged against its PON geofence once, at import, instead of at query time
+_WARD = "(select w.id from geo_wards w where ST_Intersects(w.geom, ST_PointOnSurface(s.g)) limit 1)"
+_SUBURB = "(select b.id from geo_suburbs b where ST_Intersects(b.geom, ST_PointOnSurface(s.g)) limit 1)"
+_IN_PON = "ST_Covers((select p.geofence_geom from pons p where p.id = cast(:p as uuid)), s.g)"
+
+
+class DiffTarget:
+    def __init__(self, table: str, code_col: str, values: Dict[str, str], insert_values: Dict[str, str], deletable: str = "false"):
+        # Asset table matched by (pon_id, code_col) against the staged code
+        self.table = table
+        self.code_col = code_col
+        # column -> expression over staging row `s`, written on insert and on change
+        self.values = values
+        self.insert_values = insert_values
+        # predicate over `t`: rows missing from the file are only deleted when it holds (never by default)
+        self.deletable = deletable
+
+
+class ImportLayer:
+    def __init__(
+        self,
+        row: Callable[[Dict[str, Any]], Tuple[Optional[str], ...]],
+        insert_sql: str,
+        geom_types: Tuple[str, ...],
+        needs_pon: bool = False,
+        diff: Optional[DiffTarget] = None,
+    ):
+        # properties -> (code, name, ref, kind, chainage_m) staged as text; ValueError rejects
+        self.row = row
+        # set-based load from the valid rows of geojson_stage; :p is the PON for asset layers
+        self.insert_sql = insert_sql
+        self.geom_types = geom_types
+        # ST_CollectionExtract dimension that ST_MakeValid output is reduced to
+        self.dim = {"Point": 1, "LineString": 2}.get(geom_types[0], 3)
+        self.needs_pon = needs_pon
+        self.diff = diff
+
+
+_AREA = ("Polygon", "MultiPolygon")
+_VALID = "from geojson_stage s where s.reason is null"
+_ASSET_VALUES = {"geom": "s.g", "ward_id": _WARD, "suburb_id": _SUBURB, "within_pon": _IN_PON, "content_hash": "s.hash"}
+
+IMPORT_LAYERS: Dict[str, ImportLayer] = {
+    "wards": ImportLayer(
+        lambda p: (_s(p.get("code") or p.get("WARD_NO")), _s(p.get("name") or p.get("WARD_NAME")), None, None, None),
+        f"insert into geo_wards (id, name, code, geom) select gen_random_uuid(), s.name, s.code, ST_Multi(s.g) {_VALID} order by s.seq",
+        _AREA,
+    ),
+    "suburbs": ImportLayer(
+        lambda p: (None, _s(p.get("name") or p.get("SUB_PLACE")), _ward_ref(p.get("ward_id")), None, None),
+        f"""
+        insert into geo_suburbs (id, name, ward_id, geom)
+        select gen_random_uuid(), s.name, coalesce(cast(s.ref as uuid), {_WARD}), ST_Multi(s.g) {_VALID} order by s.seq
+        """,
+        _AREA,
+    ),
+    "closures": ImportLayer(
+        lambda p: (_s(p.get("code")), None, None, None, None),
+        # The last feature wins when a code repeats, as with row-by-row upserts
+        f"""
+        insert into splice_closures (id, pon_id, code, geom, status, ward_id, suburb_id, within_pon, content_hash)
+        select gen_random_uuid(), cast(:p as uuid), s.code, s.g, 'Planned', {_WARD}, {_SUBURB}, {_IN_PON}, s.hash
+        from (
+            select distinct on (code, case when code is null then seq end) *
+            from geojson_stage where reason is null
+            order by code, case when code is null then seq end, seq desc
+        ) s
+        on conflict (code) do update
+        set geom = excluded.geom, ward_id = excluded.ward_id, suburb_id = excluded.suburb_id, within_pon = excluded.within_pon,
+            content_hash = excluded.content_hash
+        """,
+        ("Point",),
+        needs_pon=True,
+        # Codes are unique across PONs; closures with trays or past Planned are field data, never deleted
+        diff=DiffTarget(
+            "splice_closures", "code", _ASSET_VALUES, {"status": "'Planned'"},
+            deletable="t.status = 'Planned' and not exists (select 1 from splice_trays st where st.closure_id = t.id)",
+        ),
+    ),
+    "poles": ImportLayer(
+        lambda p: (_s(p.get("code")), None, None, None, None),
+        f"""
+        insert into poles (id, pon_id, code, geom, status, ward_id, suburb_id, within_pon, content_hash)
+        select gen_random_uuid(), cast(:p as uuid), s.code, s.g, 'Planned', {_WARD}, {_SUBURB}, {_IN_PON}, s.hash
+        {_VALID} order by s.seq
+        """,
+        ("Point",),
+        needs_pon=True,
+        diff=DiffTarget("poles", "code", _ASSET_VALUES, {"status": "'Planned'"}, deletable="coalesce(t.status, 'Planned') = 'Planned'"),
+    ),
+    "cables": ImportLayer(
+        lambda p: (_s(p.get("cable_code") or p.get("code")), None, None, _s(p.get("type") or "trench"), _num(p.get("chainage_m"))),
+        f"""
+        insert into cable_register (id, pon_id, cable_code, type, chainage_m, geom, ward_id, suburb_id, within_pon, content_hash)
+        select gen_random_uuid(), cast(:p as uuid), s.code, s.kind, cast(s.chainage_m as numeric), s.g, {_WARD}, {_SUBURB}, {_IN_PON}, s.hash
+        {_VALID} order by s.seq
+        on conflict do nothing
+        """,
+        ("LineString",),
+        needs_pon=True,
+        # Only cables an import created (content_hash) and nobody has surveyed since: a registered
+        # polyline or length feeds OTDR snapping and loss budgets and is never deleted by a file
+        diff=DiffTarget(
+            "cable_register", "cable_code", {**_ASSET_VALUES, "type": "s.kind", "chainage_m": "cast(s.chainage_m as numeric)"}, {},
+            deletable="t.content_hash is not null and t.polyline is null and t.length_m is null",
+        ),
+    ),
+}
+
+
+def _pt(p: Any) -> str:
+    if not isinstance(p, list) or len(p) < 2:
+        raise ValueError("malformed position")
+    x, y = p[0], p[1]
+    if type(x) not in (int, float) or type(y) not in (int, float) or not (math.isfinite(x) and math.isfinite(y)):
+        raise ValueError("non-numeric coordinate")
+    if not (-180 <= x <= 180 and -90 <= y <= 90):
+        # Projected coordinates (e.g. Lo29 / UTM metres) without a crs member end up here
+        raise ValueError("coordinates outside EPSG:4326 bounds")
+    return f"{x!r} {y!r}"
+
+
+def _line(coords: Any, closed: bool = False) -> str:
+    if not isinstance(coords, list) or len(coords) < (4 if closed else 2):
+        raise ValueError("too few positions")
+    if closed and coords[0][:2] != coords[-1][:2]:
+        raise ValueError("unclosed polygon ring")
+    return "(" + ",".join(map(_pt, coords)) + ")"
+
+
+def _polygon(coords: Any) -> str:
+    if not isinstance(coords, list) or not coords:
+        raise ValueError("polygon without rings")
+    return "(" + ",".join(_line(ring, closed=True) for ring in coords) + ")"
+
+
+def to_ewkt(geom: Dict[str, Any]) -> str:
+    """EWKT for a GeoJSON geometry, checking structure, ring closure and WGS84 bounds.
+
+    COPY parses EWKT straight into the geometry column; raises ValueError with the reject reason.
+    """
+    t, c = geom.get("type"), geom.get("coordinates")
+    if t == "Point":
+        body = "POINT(" + _pt(c) + ")"
+    elif t == "LineString":
+        body = "LINESTRING" + _line(c)
+    elif t == "Polygon":
+        body = "POLYGON" + _polygon(c)
+    elif t == "MultiPolygon":
+        if not isinstance(c, list) or not c:
+            raise ValueError("empty coordinates")
+        body = "MULTIPOLYGON(" + ",".join(map(_polygon, c)) + ")"
+    else:
+        raise ValueError(f"unsupported geometry type {t!r}")
+    return "SRID=4326;" + body
+
+
+def _copy_field(v: Optional[str]) -> str:
+    if v is None:
+        return "\\N"
+    return v.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def encode_feature(layer: str, seq: int, feature: Any) -> Tuple[Optional[bytes], Optional[str]]:
+    """One COPY text line for the staging table, or the reason the feature is rejected."""
+    spec = IMPORT_LAYERS[layer]
+    if not isinstance(feature, dict):
+        return None, "feature is not an object"
+    geom = feature.get("geometry")
+    if not isinstance(geom, dict):
+        return None, "missing geometry"
+    if geom.get("type") not in spec.geom_types:
+        return None, f"geometry type {geom.get('type')!r} not allowed for {layer}"
+    props = feature.get("properties")
+    if props is not None and not isinstance(props, dict):
+        return None, "properties is not an object"
+    try:
+        fields = spec.row(props or {})
+        ewkt = to_ewkt(geom)
+    except (ValueError, TypeError, IndexError) as e:
+        return None, str(e) or type(e).__name__
+    body = "\t".join([*map(_copy_field, fields), ewkt])
+    # Content hash over attributes + geometry as imported, for diff imports
+    digest = hashlib.md5(body.encode()).hexdigest()
+    return f"{seq}\t{body}\t{digest}\n".encode(), None
+
+
+def check_feature(layer: str, feature: Dict[str, Any]) -> Optional[str]:
+    return encode_feature(layer, 0, feature)[1]
+
+
+def _apply_diff(db: Session, t: DiffTarget, pon_id: Optional[str], delete_missing: bool) -> Dict[str, int]:
+    """Apply only the differences between the staged layer and the PON's rows, matched by code."""
+    # Closure codes are unique across PONs, so a closure moved to this PON is matched (and moved)
+    match = f"t.{t.code_col} = s.code" + ("" if t.table == "splice_closures" else " and t.pon_id = cast(:p as uuid)")
+    changed = "(t.content_hash is distinct from s.hash or t.pon_id is distinct from cast(:p as uuid))"
+    params = {"p": pon_id}
+    db.execute(
+        text(
+            "create temporary table geojson_diff as "
+            "select distinct on (code) * from geojson_stage where reason is null order by code, seq desc"
+        )
+    )
+    unchanged = db.execute(
+        text(f"select count(*) from geojson_diff s where exists (select 1 from {t.table} t where {match} and not {changed})"), params
+    ).scalar()
+    sets = ", ".join(f"{col} = {expr}" for col, expr in t.values.items())
+    updated = db.execute(
+        text(f"update {t.table} t set {sets}, pon_id = cast(:p as uuid) from geojson_diff s where {match} and {changed}"), params
+    ).rowcount
+    cols = {**t.values, **t.insert_values}
+    inserted = db.execute(
+        text(
+            f"""
+            insert into {t.table} (id, pon_id, {t.code_col}, {", ".join(cols)})
+            select gen_random_uuid(), cast(:p as uuid), s.code, {", ".join(cols.values())}
+            from geojson_diff s where not exists (select 1 from {t.table} t where {match})
+            order by s.seq
+            """
+        ),
+        params,
+    ).rowcount
+    missing = (
+        f"t.pon_id = cast(:p as uuid) and t.{t.code_col} is not null "
+        f"and not exists (select 1 from geojson_diff s where s.code = t.{t.code_col})"
+    )
+    deleted = 0
+    if delete_missing:
+        deleted = db.execute(text(f"delete from {t.table} t where {missing} and ({t.deletable})"), params).rowcount
+    kept = db.execute(text(f"select count(*) from {t.table} t where {missing}"), params).scalar()
+    db.execute(text("drop table geojson_diff"))
+    return {"inserted": inserted, "updated": updated, "unchanged": int(unchanged or 0), "deleted": deleted, "kept": int(kept or 0)}
+
+
+def load_lines(
+    db: Session, layer: str, lines: Iterable[bytes], pon_id: Optional[str] = None, diff: bool = False, delete_missing: bool = False
+) -> Dict[str, Any]:
+    """COPY encoded features into a temporary staging table, validate, then load them with one INSERT ... SELECT.
+
+    Invalid geometries are repaired with ST_MakeValid where the result keeps the layer's
+    geometry type, otherwise rejected. Returns rows loaded, repaired count and rejects as
+    (seq, reason). With `diff`, features are matched to the PON's rows by code and only
+    inserts, changed rows (content hash) and deletes of rows missing from the file are
+    applied; `changes` then summarises them. Runs in the caller's transaction; nothing is
+    committed here.
+    """
+    spec = IMPORT_LAYERS[layer]
+    db.execute(
+        text(
+            """
+            create temporary table geojson_stage (
+                seq bigint, code text, name text, ref text, kind text, chainage_m text,
+                g geometry, hash text, reason text, repaired boolean not null default false
+            )
+            """
+        )
+    )
+    # COPY goes through the psycopg connection underneath the session, inside the same transaction
+    raw = db.connection().connection.driver_connection
+    n = 0
+    with raw.cursor() as cur:
+        with cur.copy("copy geojson_stage (seq, code, name, ref, kind, chainage_m, g, hash) from stdin") as copy:
+            buf: List[bytes] = []
+            for line in lines:
+                buf.append(line)
+                n += 1
+                if len(buf) >= 1000:
+                    copy.write(b"".join(buf))
+                    buf = []
+            if buf:
+                copy.write(b"".join(buf))
+    out: Dict[str, Any] = {"staged": n, "loaded": 0, "repaired": 0, "rejected": []}
+    if n:
+        types = [t.upper() for t in spec.geom_types]
+        db.execute(
+            text(
+                """
+                update geojson_stage
+                set repaired = true,
+                    g = case when cast(:dim as int) = 2
+                             then ST_LineMerge(ST_CollectionExtract(ST_MakeValid(g), 2))
+                             else ST_CollectionExtract(ST_MakeValid(g), cast(:dim as int)) end
+                where not ST_IsValid(g)
+                """
+            ),
+            {"dim": spec.dim},
+        )
+        db.execute(
+            text(
+                """
+                update geojson_stage
+                set reason = case when repaired then 'invalid geometry; repair changed its type' else 'empty geometry' end
+                where g is null or ST_IsEmpty(g) or GeometryType(g) <> all(cast(:types as text[]))
+                """
+            ),
+            {"types": types},
+        )
+        if diff:
+            db.execute(text("update geojson_stage set reason = 'code required for diff import' where code is null and reason is null"))
+            out["changes"] = _apply_diff(db, spec.diff, pon_id, delete_missing)
+            out["loaded"] = out["changes"]["inserted"] + out["changes"]["updated"]
+        else:
+            out["loaded"] = db.execute(text(spec.insert_sql), {"p": pon_id}).rowcount
+        stats = db.execute(
+            text("select count(*) filter (where repaired and reason is null) from geojson_stage")
+        ).scalar()
+        out["repaired"] = int(stats or 0)
+        out["rejected"] = [tuple(r) for r in db.execute(text("select seq, reason from geojson_stage where reason is not null order by seq"))]
+    db.execute(text("drop table geojson_stage"))
+    return out
+
+
+def load_features(
+    db: Session, layer: str, features: Iterable[Dict[str, Any]], pon_id: Optional[str] = None, diff: bool = False, delete_missing: bool = False
+) -> Dict[str, Any]:
+    """load_lines() for already-parsed features, encoded in this process."""
+    rejected: List[Tuple[int, str]] = []
+
+    def lines() -> Iterator[bytes]:
+        for seq, f in enumerate(features):
+            line, reason = encode_feature(layer, seq, f)
+            if reason:
+                rejected.append((seq, reason))
+            else:
+                yield line
+
+    out = load_lines(db, layer, lines(), pon_id, diff, delete_missing)
+    out["staged"] += len(rejected)
+    out["rejected"] = sorted(rejected + out["rejected"])
+    return out
@@ -0,0 +1,83 @@
+import base64
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from app.core.deps import get_db_session
+
+
+STREAM_FETCH_ROWS = int(os.getenv("MAP_STREAM_FETCH_ROWS", "2000"))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+Query = Tuple[str, Dict[str, Any]]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[str]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def feature_sql(id_expr: str, props_expr: str, geom_expr: str) -> str:
+    """Feature text assembled by Postgres; the geometry text is concatenated, never parsed."""
+    return (
+        f"""'{{"type":"Feature","id":' || to_json(({id_expr})::text)::text"""
+        f""" || ',"properties":' || ({props_expr})::text"""
+        f""" || ',"geometry":' || ST_AsGeoJSON({geom_expr}) || '}}'"""
+    )
+
+
+def stream_feature_collection(queries: List[Query], limit: Optional[int] = None, key_columns: int = 0) -> Iterator[bytes]:
+    """Yield a FeatureCollection from queries returning a `feature` text column.
+
+    Rows are read through a server-side cursor and written out in ~64 kB chunks, so memory
+    stays flat regardless of the result size. For keyset paging, run one query selecting
+    `limit + 1` rows with the sort key as the last `key_columns` columns: when the extra row
+    shows up the collection ends with a `next` cursor built from the last emitted key.
+    Opens its own session because the request's session is closed before a streaming body runs.
+    """
+    db = get_db_session()
+    try:
+        buf: List[str] = ['{"type":"FeatureCollection","features":[']
+        size = len(buf[0])
+        first = True
+        emitted = 0
+        last_key: Optional[Sequence[Any]] = None
+        more = False
+        for sql, params in queries:
+            result = db.execute(text(sql), params, execution_options={"stream_results": True, "yield_per": STREAM_FETCH_ROWS})
+            for row in result:
+                if limit is not None and emitted == limit:
+                    more = True
+                    break
+                feature = row[0]
+                if not first:
+                    buf.append(",")
+                buf.append(feature)
+                size += len(feature) + 1
+                first = False
+                emitted += 1
+                if key_columns:
+                    last_key = tuple(row[-key_columns:])
+                if size >= STREAM_CHUNK_BYTES:
+                    yield "".join(buf).encode()
+                    buf, size = [], 0
+            result.close()
+        tail = "]"
+        if more and last_key is not None:
+            tail += ',"next":' + json.dumps(encode_cursor(last_key))
+        buf.append(tail + "}")
+        yield "".join(buf).encode()
+    finally:
+        db.close()
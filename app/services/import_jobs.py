@@ -0,0 +1,268 @@
+"""Background GeoJSON import jobs.
+
+POST /imports/jobs stores the upload in S3 and queues a row in `import_jobs`. A worker claims
+queued jobs (and jobs whose worker stopped heartbeating) and streams the object through the
+import pipeline (app.services.import_pipeline), committing every IMPORT_JOB_CHUNK features
+together with the checkpoint, so a crashed run resumes after the last committed chunk.
+Features that fail validation or the database insert are recorded in `import_job_rejects`
+and do not fail the job; a database error in a chunk is narrowed down to the offending
+features by bisection.
+
+Jobs run from the scheduler, right after upload, or standalone:
+
+    python -m app.services.import_jobs
+"""
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.core.deps import SessionLocal
+from app.services import geo_lod, s3
+from app.services.geojson_import import IMPORT_LAYERS, iter_features, load_lines
+from app.services.import_pipeline import Encoded, Item, chunked, encoded_chunks, get_pool
+from app.services.map_tiles import LAYERS as TILE_LAYERS, bump_layers
+
+
+CHUNK = int(os.getenv("IMPORT_JOB_CHUNK", "5000"))
+STALE_SEC = int(os.getenv("IMPORT_JOB_STALE_SEC", "300"))
+MAX_ATTEMPTS = int(os.getenv("IMPORT_JOB_MAX_ATTEMPTS", "3"))
+KEY_PREFIX = "imports"
+
+QUEUED, RUNNING, DONE, FAILED = "Queued", "Running", "Done", "Failed"
+
+log = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class _CountingReader:
+    def __init__(self, fp: IO[bytes]):
+        self.fp = fp
+        self.bytes = 0
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.fp.read(n)
+        self.bytes += len(data)
+        return data
+
+
+def create_job(db: Session, layer: str, pon_id: Optional[str], fileobj: IO[bytes], filename: Optional[str]) -> Dict[str, Any]:
+    job_id = str(uuid.uuid4())
+    key = f"{KEY_PREFIX}/{job_id}/source.geojson"
+    size = None
+    if fileobj.seekable():
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+    s3.upload_fileobj(key, fileobj, "application/geo+json")
+    db.execute(
+        text(
+            """
+            insert into import_jobs (id, layer, pon_id, filename, s3_key, bytes_total)
+            values (cast(:id as uuid), :layer, cast(:p as uuid), :fn, :key, :size)
+            """
+        ),
+        {"id": job_id, "layer": layer, "p": pon_id, "fn": filename, "key": key, "size": size},
+    )
+    db.commit()
+    return get_job(db, job_id)
+
+
+def get_job(db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+    row = db.execute(
+        text(
+            """
+            select id::text as id, layer, pon_id::text as pon_id, filename, status, bytes_total, bytes_done,
+                   checkpoint as features_done, features_loaded, features_rejected, rejects_key, error, attempts,
+                   created_at, started_at, finished_at, heartbeat_at,
+                   extract(epoch from coalesce(finished_at, now()) - started_at) as elapsed_sec
+            from import_jobs where id = cast(:id as uuid)
+            """
+        ),
+        {"id": job_id},
+    ).mappings().first()
+    if row is None:
+        return None
+    job = dict(row)
+    elapsed = float(job.pop("elapsed_sec") or 0)
+    job["elapsed_sec"] = round(elapsed, 1)
+    # Average since the first start, so time lost to a crashed run shows up in the rate
+    job["features_per_sec"] = round(job["features_done"] / elapsed, 1) if elapsed > 0 else None
+    if job["bytes_total"]:
+        job["progress"] = round(min(1.0, job["bytes_done"] / job["bytes_total"]), 4)
+    else:
+        job["progress"] = 1.0 if job["status"] == DONE else None
+    return job
+
+
+def claim(db: Session) -> Optional[Dict[str, Any]]:
+    """Take the oldest queued job, or one whose worker stopped heartbeating."""
+    row = db.execute(
+        text(
+            """
+            update import_jobs j
+            set status = :running, lease = cast(:lease as uuid), attempts = j.attempts + 1,
+                heartbeat_at = now(), started_at = coalesce(j.started_at, now())
+            where j.id = (
+                select id from import_jobs
+                where status = :queued
+                   or (status = :running and heartbeat_at < now() - make_interval(secs => :stale))
+                order by created_at
+                limit 1
+                for update skip locked
+            )
+            returning j.id::text as id, j.layer, j.pon_id::text as pon_id, j.s3_key, j.checkpoint,
+                      j.features_loaded, j.features_rejected, j.attempts, j.lease::text as lease
+            """
+        ),
+        {"running": RUNNING, "queued": QUEUED, "lease": str(uuid.uuid4()), "stale": STALE_SEC},
+    ).mappings().first()
+    db.commit()
+    return dict(row) if row else None
+
+
+def _error_text(e: Exception) -> str:
+    orig = getattr(e, "orig", None) or e
+    return (str(orig).strip().splitlines() or [type(orig).__name__])[0]
+
+
+def _load_isolating(db: Session, layer: str, lines: List[Tuple[int, bytes]], pon_id: Optional[str], rejects: List[Tuple[int, str]]) -> int:
+    """Load `lines` in a savepoint; on a database error bisect until the bad features are isolated."""
+    if not lines:
+        return 0
+    try:
+        with db.begin_nested():
+            result = load_lines(db, layer, (line for _, line in lines), pon_id)
+            rejects.extend(result["rejected"])
+            return result["loaded"]
+    except (DBAPIError, psycopg.Error) as e:
+        if len(lines) == 1:
+            rejects.append((lines[0][0], _error_text(e)))
+            return 0
+    mid = len(lines) // 2
+    return _load_isolating(db, layer, lines[:mid], pon_id, rejects) + _load_isolating(db, layer, lines[mid:], pon_id, rejects)
+
+
+def _commit_chunk(db: Session, job: Dict[str, Any], items: List[Item], encoded: Encoded, reader: _CountingReader) -> None:
+    lines, rejects = encoded
+    rejects = list(rejects)
+    loaded = _load_isolating(db, job["layer"], lines, job["pon_id"], rejects)
+    if rejects:
+        raw = dict(items)
+        db.execute(
+            text(
+                """
+                insert into import_job_rejects (job_id, feature_index, error, feature)
+                values (cast(:j as uuid), :i, :e, cast(:f as jsonb))
+                on conflict do nothing
+                """
+            ),
+            [{"j": job["id"], "i": i, "e": err, "f": raw[i] if isinstance(raw[i], str) else json.dumps(raw[i])} for i, err in rejects],
+        )
+    job["checkpoint"] = items[-1][0] + 1
+    job["features_loaded"] += loaded
+    job["features_rejected"] += len(rejects)
+    n = db.execute(
+        text(
+            """
+            update import_jobs set checkpoint = :c, bytes_done = :b, features_loaded = :l, features_rejected = :r, heartbeat_at = now()
+            where id = cast(:id as uuid) and lease = cast(:lease as uuid)
+            """
+        ),
+        {
+            "c": job["checkpoint"], "b": reader.bytes, "l": job["features_loaded"], "r": job["features_rejected"],
+            "id": job["id"], "lease": job["lease"],
+        },
+    ).rowcount
+    if n != 1:
+        db.rollback()
+        raise LeaseLost(job["id"])
+    db.commit()
+
+
+def _write_rejects(db: Session, job: Dict[str, Any]) -> Optional[str]:
+    if not job["features_rejected"]:
+        return None
+    rows = db.execute(
+        text("select feature_index, error, feature from import_job_rejects where job_id = cast(:j as uuid) order by feature_index"),
+        {"j": job["id"]},
+    )
+    body = "".join(json.dumps({"index": r.feature_index, "error": r.error, "feature": r.feature}) + "\n" for r in rows)
+    key = f"{KEY_PREFIX}/{job['id']}/rejects.ndjson"
+    s3.put_bytes(key, "application/x-ndjson", body.encode())
+    return key
+
+
+def _finish(db: Session, job: Dict[str, Any], status: str, error: Optional[str] = None, rejects_key: Optional[str] = None) -> None:
+    db.execute(
+        text(
+            """
+            update import_jobs set status = :s, error = :e, rejects_key = :k, finished_at = now(), heartbeat_at = now()
+            where id = cast(:id as uuid) and lease = cast(:lease as uuid)
+            """
+        ),
+        {"s": status, "e": error, "k": rejects_key, "id": job["id"], "lease": job["lease"]},
+    )
+    db.commit()
+
+
+def process(db: Session, job: Dict[str, Any]) -> None:
+    if job["attempts"] > MAX_ATTEMPTS:
+        _finish(db, job, FAILED, f"gave up after {MAX_ATTEMPTS} attempts (stopped at feature {job['checkpoint']})")
+        return
+    spec = IMPORT_LAYERS.get(job["layer"])
+    if spec is None or (spec.needs_pon and not job["pon_id"]):
+        _finish(db, job, FAILED, "invalid layer or missing pon_id")
+        return
+    body = s3.open_object(job["s3_key"])
+    reader = _CountingReader(body)
+    try:
+        # Features before the checkpoint were committed by an earlier run; they are parsed and skipped
+        pool = get_pool()
+        chunks = chunked(iter_features(reader, raw=pool is not None), CHUNK, start=job["checkpoint"])
+        for items, encoded in encoded_chunks(job["layer"], chunks, pool):
+            _commit_chunk(db, job, items, encoded, reader)
+    except ValueError as e:
+        # Unreadable document: committed chunks stay, the job reports where parsing stopped
+        db.rollback()
+        _finish(db, job, FAILED, f"Invalid GeoJSON after feature {job['checkpoint']}: {e}", _write_rejects(db, job))
+        return
+    finally:
+        body.close()
+    _finish(db, job, DONE, rejects_key=_write_rejects(db, job))
+    if job["layer"] in TILE_LAYERS:
+        bump_layers(job["layer"])
+    if job["layer"] in geo_lod.GEO_LAYERS:
+        geo_lod.rebuild(db, job["layer"])
+
+
+def run_pending(max_jobs: int = 10) -> int:
+    """Work through queued (and abandoned) jobs; returns how many were picked up."""
+    n = 0
+    while n < max_jobs:
+        with SessionLocal() as db:
+            job = claim(db)
+            if job is None:
+                break
+            n += 1
+            try:
+                process(db, job)
+            except LeaseLost:
+                log.warning("import job %s was reclaimed by another worker", job["id"])
+            except Exception:  # noqa: BLE001
+                # Left Running: the next claim after IMPORT_JOB_STALE_SEC resumes from the checkpoint
+                log.exception("import job %s crashed at feature %s", job["id"], job["checkpoint"])
+    return n
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_pending(max_jobs=1_000_000)
@@ -0,0 +1,115 @@
+"""Import pipeline: parse -> validate/encode (process pool) -> PostGIS validate/enrich -> load.
+
+The parser walks the upload in this process and hands out chunks of raw feature text
+(parsing a stream is inherently sequential).
+Worker processes decode them, check structure, ring closure and WGS84 bounds, and encode
+COPY lines with EWKT geometries. The parent writes the lines into the COPY stream in file
+order while the next chunks are being encoded. The set-based steps in load_lines() then
+repair invalid geometries (ST_MakeValid) and link every asset to its ward, suburb and PON
+geofence inside the INSERT ... SELECT.
+
+IMPORT_WORKERS=0 encodes in-process (no pool).
+"""
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.services.geojson_import import encode_feature, iter_features, load_lines
+
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+ENCODE_CHUNK = int(os.getenv("IMPORT_ENCODE_CHUNK", "2000"))
+
+# (feature index, raw JSON text, or the parsed feature when encoding in-process)
+Item = Tuple[int, Any]
+# (COPY lines as (index, line), rejects as (index, reason))
+Encoded = Tuple[List[Tuple[int, bytes]], List[Tuple[int, str]]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> Optional[Executor]:
+    global _pool
+    if IMPORT_WORKERS <= 0:
+        return None
+    if _pool is None:
+        # spawn: forking a threaded API/scheduler process is not safe
+        _pool = ProcessPoolExecutor(IMPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def encode_chunk(layer: str, items: List[Item]) -> Encoded:
+    lines: List[Tuple[int, bytes]] = []
+    rejects: List[Tuple[int, str]] = []
+    for idx, raw in items:
+        line, reason = encode_feature(layer, idx, json.loads(raw) if isinstance(raw, str) else raw)
+        if reason:
+            rejects.append((idx, reason))
+        else:
+            lines.append((idx, line))
+    return lines, rejects
+
+
+def chunked(features: Iterable[Any], size: int, start: int = 0) -> Iterator[List[Item]]:
+    """Group raw features into chunks, skipping the first `start` (already loaded) ones."""
+    chunk: List[Item] = []
+    for idx, raw in enumerate(features):
+        if idx < start:
+            continue
+        chunk.append((idx, raw))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encoded_chunks(layer: str, chunks: Iterable[List[Item]], pool: Optional[Executor] = None) -> Iterator[Tuple[List[Item], Encoded]]:
+    """Encode chunks on the pool, keeping a few in flight, and yield them in input order."""
+    if pool is None:
+        for chunk in chunks:
+            yield chunk, encode_chunk(layer, chunk)
+        return
+    depth = 2 * max(1, IMPORT_WORKERS)
+    inflight: Deque[Tuple[List[Item], "Future[Encoded]"]] = deque()
+    for chunk in chunks:
+        inflight.append((chunk, pool.submit(encode_chunk, layer, chunk)))
+        if len(inflight) >= depth:
+            done, fut = inflight.popleft()
+            yield done, fut.result()
+    while inflight:
+        done, fut = inflight.popleft()
+        yield done, fut.result()
+
+
+def load_stream(
+    db: Session,
+    layer: str,
+    fp: IO[bytes],
+    pon_id: Optional[str] = None,
+    pool: Optional[Executor] = None,
+    diff: bool = False,
+    delete_missing: bool = False,
+) -> Dict[str, Any]:
+    """Run the whole pipeline for one upload inside the caller's transaction (see load_lines for `diff`)."""
+    rejected: List[Tuple[int, str]] = []
+
+    pool = pool if pool is not None else get_pool()
+
+    def lines() -> Iterator[bytes]:
+        # Only worker processes need the source text; in-process encoding reuses the parsed feature
+        chunks = chunked(iter_features(fp, raw=pool is not None), ENCODE_CHUNK)
+        for _, (encoded, rejects) in encoded_chunks(layer, chunks, pool):
+            rejected.extend(rejects)
+            for _, line in encoded:
+                yield line
+
+    out = load_lines(db, layer, lines(), pon_id, diff, delete_missing)
+    out["staged"] += len(rejected)
+    out["rejected"] = sorted(rejected + out["rejected"])
+    return out
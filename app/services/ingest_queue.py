@@ -0,0 +1,302 @@
+"""Durable Redis stream between the NMS/Oxidized webhooks and the incident/config writers.
+
+With WEBHOOK_INGEST_MODE=queue the webhooks only verify the caller, XADD the raw body and
+answer 202. Consumers in the `ingest-writers` group drain the stream in batches through the
+same set-based alert pipeline as the batch endpoints. Entries are acked only after their
+batch commits (at-least-once); entries left pending by a dead consumer are reclaimed after
+INGEST_CLAIM_IDLE_MS. Replays are harmless: alerts dedup on nms_ref and config snapshots use
+an id derived from the stream entry id.
+
+Workers run inside the API process (INGEST_WORKER_INPROCESS, default) or standalone:
+
+    python -m app.services.ingest_queue
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+from sqlalchemy.exc import InterfaceError, OperationalError
+from starlette.concurrency import run_in_threadpool
+
+from app.core.deps import SessionLocal
+from app.core.redis_client import get_redis
+from app.services.alerts import ingest_alerts, normalize_librenms, normalize_zabbix
+from app.services.device_configs import store_config
+
+
+INGEST_MODE = os.getenv("WEBHOOK_INGEST_MODE", "sync").lower()
+STREAM = os.getenv("INGEST_STREAM", "ingest:webhooks")
+DEAD_STREAM = f"{STREAM}:dead"
+STATS_KEY = f"{STREAM}:stats"
+GROUP = "ingest-writers"
+STREAM_MAXLEN = int(os.getenv("INGEST_STREAM_MAXLEN", "1000000"))
+MAX_BACKLOG = int(os.getenv("INGEST_MAX_BACKLOG", "200000"))
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+BLOCK_MS = int(os.getenv("INGEST_BLOCK_MS", "2000"))
+CLAIM_IDLE_MS = int(os.getenv("INGEST_CLAIM_IDLE_MS", "60000"))
+MAX_DELIVERIES = int(os.getenv("INGEST_MAX_DELIVERIES", "5"))
+WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+WORKER_INPROCESS = os.getenv("INGEST_WORKER_INPROCESS", "true").lower() in ("1", "true", "yes")
+
+NORMALIZERS = {"librenms": normalize_librenms, "zabbix": normalize_zabbix}
+
+log = logging.getLogger(__name__)
+
+
+class Backpressure(Exception):
+    pass
+
+
+def queue_enabled() -> bool:
+    return INGEST_MODE == "queue"
+
+
+async def enqueue(kind: str, body: bytes) -> str:
+    r = await get_redis()
+    # Acked entries are deleted, so the stream length is the undelivered + in-flight backlog
+    backlog = await r.xlen(STREAM)
+    if backlog >= MAX_BACKLOG:
+        await r.hincrby(STATS_KEY, "rejected", 1)
+        raise Backpressure(f"ingest backlog {backlog} >= {MAX_BACKLOG}")
+    msg_id = await r.xadd(
+        STREAM,
+        {"kind": kind, "body": body.decode("utf-8", errors="replace"), "received_at": f"{time.time():.3f}"},
+        maxlen=STREAM_MAXLEN,
+        approximate=True,
+    )
+    await r.hincrby(STATS_KEY, "enqueued", 1)
+    return msg_id
+
+
+async def stats() -> Dict[str, Any]:
+    r = await get_redis()
+    out: Dict[str, Any] = {"mode": INGEST_MODE, "stream": STREAM, "max_backlog": MAX_BACKLOG}
+    out["backlog"] = await r.xlen(STREAM)
+    out["dead_letters"] = await r.xlen(DEAD_STREAM)
+    counters = await r.hgetall(STATS_KEY)
+    out.update({k: int(v) for k, v in counters.items()})
+    try:
+        summary = await r.xpending(STREAM, GROUP)
+        out["pending"] = summary.get("pending", 0)
+        out["consumers"] = len(summary.get("consumers") or [])
+    except ResponseError:
+        out["pending"] = 0
+        out["consumers"] = 0
+    oldest = await r.xrange(STREAM, count=1)
+    if oldest:
+        ms = int(oldest[0][0].split("-")[0])
+        out["oldest_age_sec"] = round(max(0.0, time.time() - ms / 1000.0), 3)
+    else:
+        out["oldest_age_sec"] = 0.0
+    return out
+
+
+async def _ensure_group(r) -> None:
+    try:
+        await r.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _dead_letter(r, entries: List[Tuple[str, Dict[str, str]]], reason: str) -> None:
+    if not entries:
+        return
+    pipe = r.pipeline(transaction=False)
+    for msg_id, fields in entries:
+        pipe.xadd(DEAD_STREAM, {**fields, "source_id": msg_id, "error": reason[:500]}, maxlen=100000, approximate=True)
+    ids = [m for m, _ in entries]
+    pipe.xack(STREAM, GROUP, *ids)
+    pipe.xdel(STREAM, *ids)
+    pipe.hincrby(STATS_KEY, "dead_lettered", len(ids))
+    await pipe.execute()
+
+
+async def _reclaim(r, consumer: str) -> List[Tuple[str, Dict[str, str]]]:
+    # Entries a crashed or stuck consumer never acked; retry them, dead-letter repeat offenders
+    reply = await r.xautoclaim(STREAM, GROUP, consumer, CLAIM_IDLE_MS, "0-0", count=BATCH_SIZE)
+    claimed = [(m, f) for m, f in reply[1] if f]
+    if not claimed:
+        return []
+    poison = []
+    for msg_id, fields in claimed:
+        info = await r.xpending_range(STREAM, GROUP, min=msg_id, max=msg_id, count=1)
+        if info and info[0]["times_delivered"] > MAX_DELIVERIES:
+            poison.append((msg_id, fields))
+    await _dead_letter(r, poison, "max deliveries exceeded")
+    skip = {m for m, _ in poison}
+    return [(m, f) for m, f in claimed if m not in skip]
+
+
+def _store_configs(items: List[Tuple[uuid.UUID, Dict[str, Any]]]) -> List[Optional[str]]:
+    errors: List[Optional[str]] = []
+    with SessionLocal() as db:
+        for config_id, data in items:
+            try:
+                store_config(db, data, config_id=config_id)
+                errors.append(None)
+            except (ValueError, LookupError) as e:
+                db.rollback()
+                errors.append(str(e))
+    return errors
+
+
+def _parse_entry(fields: Dict[str, str]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Normalized alerts or an oxidized snapshot for one entry; raises ValueError when unusable."""
+    kind = fields.get("kind", "")
+    data = json.loads(fields.get("body") or "null")
+    source, _, mode = kind.partition("_")
+    if source in NORMALIZERS:
+        if mode != "batch" and not isinstance(data, dict):
+            raise ValueError(f"{kind} body is not an alert object")
+        items = data if mode == "batch" else [data]
+        if isinstance(items, dict):
+            items = items.get("alerts") or []
+        if not isinstance(items, list):
+            raise ValueError(f"{kind} body is not a list of alerts")
+        return [NORMALIZERS[source](i) for i in items if isinstance(i, dict)], None
+    if kind == "oxidized" and isinstance(data, dict):
+        return [], data
+    raise ValueError(f"unsupported entry kind {kind!r}")
+
+
+async def _ingest(alerts: List[Dict[str, Any]]) -> None:
+    db = SessionLocal()
+    try:
+        await ingest_alerts(db, alerts)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _write_alerts(r, groups: List[Tuple[Tuple[str, Dict[str, str]], List[Dict[str, Any]]]]) -> int:
+    """Write the alerts of all entries at once; when that fails, bisect down to the offending entries.
+
+    Replays of the halves that already committed are harmless (alerts dedup on nms_ref).
+    Connection errors are re-raised so the batch stays pending instead of being dead-lettered.
+    Returns the number of alerts written.
+    """
+    alerts = [a for _, items in groups for a in items]
+    if not alerts:
+        return 0
+    try:
+        await _ingest(alerts)
+        return len(alerts)
+    except (OperationalError, InterfaceError):
+        raise
+    except Exception as e:  # noqa: BLE001
+        if len(groups) == 1:
+            log.warning("dead-lettering ingest entry %s: %s", groups[0][0][0], e)
+            await _dead_letter(r, [groups[0][0]], f"alert write failed: {e}")
+            return 0
+    mid = len(groups) // 2
+    return await _write_alerts(r, groups[:mid]) + await _write_alerts(r, groups[mid:])
+
+
+async def process_entries(r, entries: List[Tuple[str, Dict[str, str]]]) -> None:
+    groups: List[Tuple[Tuple[str, Dict[str, str]], List[Dict[str, Any]]]] = []
+    configs: List[Tuple[uuid.UUID, Dict[str, Any]]] = []
+    config_entries: List[Tuple[str, Dict[str, str]]] = []
+    rejected: List[Tuple[str, Dict[str, str]]] = []
+    # One malformed entry is dead-lettered on its own instead of failing the whole batch
+    for entry in entries:
+        msg_id, fields = entry
+        try:
+            items, config = _parse_entry(fields)
+        except Exception as e:  # noqa: BLE001
+            log.warning("rejecting ingest entry %s: %s", msg_id, e)
+            rejected.append(entry)
+            continue
+        if config is not None:
+            # Deterministic id per stream entry: a redelivered snapshot is not stored twice
+            configs.append((uuid.uuid5(uuid.NAMESPACE_URL, f"{STREAM}/{msg_id}"), config))
+            config_entries.append(entry)
+        elif items:
+            groups.append((entry, items))
+
+    written = await _write_alerts(r, groups)
+    if configs:
+        errors = await run_in_threadpool(_store_configs, configs)
+        await _dead_letter(r, [e for e, err in zip(config_entries, errors) if err], "config rejected")
+    await _dead_letter(r, rejected, "unparseable entry")
+
+    # Dead-lettered entries are already acked and deleted; repeating that is a no-op
+    done = [m for m, _ in entries]
+    pipe = r.pipeline(transaction=False)
+    pipe.xack(STREAM, GROUP, *done)
+    pipe.xdel(STREAM, *done)
+    pipe.hincrby(STATS_KEY, "processed", len(done))
+    pipe.hincrby(STATS_KEY, "alerts_written", written)
+    await pipe.execute()
+
+
+async def run_worker(consumer: str, stop: asyncio.Event) -> None:
+    r = await get_redis()
+    await _ensure_group(r)
+    while not stop.is_set():
+        try:
+            entries = await _reclaim(r, consumer)
+            if not entries:
+                resp = await r.xreadgroup(GROUP, consumer, {STREAM: ">"}, count=BATCH_SIZE, block=BLOCK_MS)
+                entries = resp[0][1] if resp else []
+            if entries:
+                await process_entries(r, entries)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Unacked entries stay pending and are reclaimed after CLAIM_IDLE_MS
+            log.exception("ingest worker %s failed a batch", consumer)
+            try:
+                await r.hincrby(STATS_KEY, "failed_batches", 1)
+            except Exception:
+                pass
+            await asyncio.sleep(1)
+
+
+_stop: Optional[asyncio.Event] = None
+_tasks: List[asyncio.Task] = []
+
+
+def _consumer_name(i: int) -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{i}"
+
+
+def start_inprocess_workers() -> None:
+    global _stop
+    if not queue_enabled() or not WORKER_INPROCESS or _tasks:
+        return
+    _stop = asyncio.Event()
+    for i in range(WORKERS):
+        _tasks.append(asyncio.create_task(run_worker(_consumer_name(i), _stop)))
+    log.info("started %d in-process ingest workers on %s", WORKERS, STREAM)
+
+
+async def stop_inprocess_workers() -> None:
+    if _stop is not None:
+        _stop.set()
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+async def _main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await asyncio.gather(*(run_worker(_consumer_name(i), stop) for i in range(WORKERS)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    asyncio.run(_main())
@@ -0,0 +1,203 @@
+"""Expected end-to-end loss of every OLT-to-drop path in a PON.
+
+The PON's topo_nodes/topo_edges are walked breadth-first from each OLT node; every other
+node of degree one is a drop. Along a path the budget adds:
+
+  fibre      edge length (topo_edges.length_m, else the cable_register length shared over
+             the cable's unmeasured edges) x attenuation at the wavelength
+  splices    one splice per closure node (code matching splice_closures): the mean measured
+             splices.loss_db of the closure for `expected_db`, the worst for `worst_db`,
+             LOSS_BUDGET_SPLICE_DB where nothing is measured yet
+  splitters  insertion loss by splitters.ratio (nodes matching splitters.code or typed splitter)
+  connectors LOSS_BUDGET_CONNECTOR_DB at each end
+
+Test plans whose from_point/to_point names a drop get their max_loss_db margin. Results
+are cached in Redis per PON budget version, which triggers bump on any change to the
+inputs (migration 0026).
+"""
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis_sync
+
+
+LOSS_BUDGET_CACHE_TTL_SEC = int(os.getenv("LOSS_BUDGET_CACHE_TTL_SEC", "86400"))
+SPLICE_DB = float(os.getenv("LOSS_BUDGET_SPLICE_DB", "0.1"))
+CONNECTOR_DB = float(os.getenv("LOSS_BUDGET_CONNECTOR_DB", "0.5"))
+DEFAULT_SPLIT = os.getenv("LOSS_BUDGET_DEFAULT_SPLIT", "1:32")
+
+# Typical G.652 attenuation (dB/km) and PLC splitter insertion loss (dB)
+ATTENUATION_DB_KM = {1310: 0.35, 1490: 0.27, 1550: 0.22, 1625: 0.25}
+SPLITTER_DB = {"1:2": 3.7, "1:4": 7.3, "1:8": 10.5, "1:16": 13.7, "1:32": 17.1, "1:64": 20.5}
+
+log = logging.getLogger(__name__)
+
+
+def attenuation(wavelength_nm: int) -> float:
+    return ATTENUATION_DB_KM[min(ATTENUATION_DB_KM, key=lambda w: abs(w - wavelength_nm))]
+
+
+def splitter_loss(ratio: Optional[str]) -> float:
+    key = (ratio or DEFAULT_SPLIT).replace(" ", "")
+    return SPLITTER_DB.get(key, SPLITTER_DB[DEFAULT_SPLIT])
+
+
+def compute(
+    nodes: List[Tuple[Any, str, str]],
+    edges: List[Tuple[Any, Any, Optional[str], Optional[float]]],
+    closures: Dict[str, Tuple[int, Optional[float], Optional[float]]],
+    splitters: Dict[str, Optional[str]],
+    cable_lengths: Dict[str, float],
+    wavelength_nm: int = 1310,
+) -> List[Dict[str, Any]]:
+    """One entry per drop; `nodes` are (id, type, code), `edges` (a_id, b_id, cable_code, length_m),
+    `closures` code -> (measured splices, mean loss, max loss), `splitters` code -> ratio."""
+    atten = attenuation(wavelength_nm) / 1000.0
+    by_id = {nid: (ntype or "", code) for nid, ntype, code in nodes}
+
+    # Cable length spread over that cable's edges without their own length
+    unmeasured: Dict[str, int] = {}
+    for _, _, cable, length in edges:
+        if length is None and cable:
+            unmeasured[cable] = unmeasured.get(cable, 0) + 1
+    adj: Dict[Any, List[Tuple[Any, float]]] = {}
+    for a, b, cable, length in edges:
+        if length is None:
+            total = cable_lengths.get(cable) if cable else None
+            length = total / unmeasured[cable] if total else 0.0
+        adj.setdefault(a, []).append((b, float(length)))
+        adj.setdefault(b, []).append((a, float(length)))
+
+    # Per-node loss: (expected splice, worst splice, splitter, splices, unmeasured splices)
+    def node_loss(ntype: str, code: str) -> Tuple[float, float, float, int, int]:
+        t = ntype.lower()
+        split = splitter_loss(splitters.get(code)) if code in splitters or t == "splitter" else 0.0
+        if code in closures or t == "closure":
+            n, mean, worst = closures.get(code, (0, None, None))
+            if n:
+                return mean, worst, split, 1, 0
+            return SPLICE_DB, SPLICE_DB, split, 1, 1
+        return 0.0, 0.0, split, 0, 0
+
+    out: List[Dict[str, Any]] = []
+    seen: set = set()
+    for root, (rtype, rcode) in by_id.items():
+        if rtype.lower() != "olt" or root in seen:
+            continue
+        # state: length_m, expected splice, worst splice, splitter, splices, unmeasured, hops
+        state = {root: (0.0, *node_loss(rtype, rcode), 0)}
+        seen.add(root)
+        queue = deque([root])
+        while queue:
+            nid = queue.popleft()
+            length, exp, worst, split, ns, nu, hops = state[nid]
+            children = 0
+            for nxt, seg in adj.get(nid, ()):
+                if nxt in seen or nxt not in by_id:
+                    continue
+                seen.add(nxt)
+                children += 1
+                e, w, s, n, u = node_loss(*by_id[nxt])
+                state[nxt] = (length + seg, exp + e, worst + w, split + s, ns + n, nu + u, hops + 1)
+                queue.append(nxt)
+            if children == 0 and nid != root:
+                fibre = length * atten
+                base = fibre + split + 2 * CONNECTOR_DB
+                out.append(
+                    {
+                        "olt": rcode,
+                        "drop_id": str(nid),
+                        "drop": by_id[nid][1],
+                        "hops": hops,
+                        "length_m": round(length, 1),
+                        "fibre_db": round(fibre, 3),
+                        "splice_db": round(exp, 3),
+                        "splitter_db": round(split, 2),
+                        "connector_db": 2 * CONNECTOR_DB,
+                        "splices": ns,
+                        "unmeasured_splices": nu,
+                        "expected_db": round(base + exp, 2),
+                        "worst_db": round(base + worst, 2),
+                    }
+                )
+    return out
+
+
+INPUT_SQL = {
+    "nodes": "select id, type, code from topo_nodes where pon_id = cast(:p as uuid)",
+    "edges": """
+        select e.a_id, e.b_id, e.cable_code, e.length_m::float8 as length_m
+        from topo_edges e join topo_nodes a on a.id = e.a_id
+        where a.pon_id = cast(:p as uuid)
+    """,
+    "closures": """
+        select c.code, count(s.loss_db) as n, avg(s.loss_db)::float8 as mean, max(s.loss_db)::float8 as worst
+        from splice_closures c
+        left join splice_trays st on st.closure_id = c.id
+        left join splices s on s.tray_id = st.id
+        where c.pon_id = cast(:p as uuid)
+        group by c.code
+    """,
+    "splitters": "select code, ratio from splitters where pon_id = cast(:p as uuid)",
+    "cables": "select cable_code, max(length_m)::float8 as length_m from cable_register where pon_id = cast(:p as uuid) group by cable_code",
+    "plans": "select id::text as id, link_name, from_point, to_point, max_loss_db::float8 as max_loss_db from test_plans where pon_id = cast(:p as uuid)",
+}
+
+
+def budget_version(db: Session, pon_id: str) -> int:
+    """Change counter bumped by triggers on every input of the budget (migration 0026)."""
+    v = db.execute(text("select version from pon_budget_versions where pon_id = cast(:p as uuid)"), {"p": pon_id}).scalar()
+    return int(v or 0)
+
+
+def build(db: Session, pon_id: str, wavelength_nm: int = 1310) -> Dict[str, Any]:
+    p = {"p": pon_id}
+    nodes = [tuple(r) for r in db.execute(text(INPUT_SQL["nodes"]), p)]
+    edges = [tuple(r) for r in db.execute(text(INPUT_SQL["edges"]), p)]
+    closures = {r.code: (int(r.n), r.mean, r.worst) for r in db.execute(text(INPUT_SQL["closures"]), p)}
+    splitters = {r.code: r.ratio for r in db.execute(text(INPUT_SQL["splitters"]), p)}
+    cables = {r.cable_code: r.length_m for r in db.execute(text(INPUT_SQL["cables"]), p) if r.length_m}
+    paths = compute(nodes, edges, closures, splitters, cables, wavelength_nm)
+
+    by_drop = {path["drop"]: path for path in paths}
+    plans = []
+    for plan in db.execute(text(INPUT_SQL["plans"]), p).mappings():
+        path = by_drop.get(plan["to_point"]) or by_drop.get(plan["from_point"])
+        if path is None:
+            continue
+        margin = round(plan["max_loss_db"] - path["expected_db"], 2)
+        path.setdefault("plans", []).append({"id": plan["id"], "link_name": plan["link_name"], "max_loss_db": plan["max_loss_db"], "margin_db": margin})
+        plans.append(margin)
+    return {
+        "pon_id": pon_id,
+        "wavelength_nm": wavelength_nm,
+        "attenuation_db_km": attenuation(wavelength_nm),
+        "paths": paths,
+        "worst_expected_db": max((x["expected_db"] for x in paths), default=None),
+        "plans_over_budget": sum(1 for m in plans if m < 0),
+    }
+
+
+def get_budget(db: Session, pon_id: str, wavelength_nm: int = 1310) -> Tuple[str, str]:
+    """Budget JSON and ETag, computed once per PON budget version and wavelength."""
+    version = budget_version(db, pon_id)
+    etag = f'"budget-{pon_id}-{version}-{wavelength_nm}"'
+    key = f"budget:pon:{pon_id}:{version}:{wavelength_nm}"
+    try:
+        cached = get_redis_sync().get(key)
+        if cached is not None:
+            return cached, etag
+    except Exception as e:  # noqa: BLE001
+        log.warning("loss budget cache unavailable: %s", e)
+    payload = json.dumps(build(db, pon_id, wavelength_nm))
+    try:
+        get_redis_sync().set(key, payload, ex=LOSS_BUDGET_CACHE_TTL_SEC)
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to cache %s: %s", key, e)
+    return payload, etag
@@ -0,0 +1,120 @@
+"""Loss distributions per PON, SMME and technician from the `test_loss_rollups` histograms.
+
+Triggers on otdr_results, lspm_results and splices (migration 0025) fold every insert,
+update and delete into fixed-width loss buckets per dimension, so reports read a few hundred
+bucket rows per crew instead of scanning the result tables. Percentiles are bucket upper
+edges (BUCKET_DB resolution); mean and standard deviation are exact.
+"""
+import math
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+BUCKET_DB = {"total_loss": 0.1, "splice_loss": 0.01}
+DIMS = ("pon", "smme", "tech")
+# source -> metrics it records
+SOURCES = {"otdr": ("total_loss", "splice_loss"), "lspm": ("total_loss",), "splice": ("splice_loss",)}
+ORDERS = ("p90", "p50", "mean", "fail_rate", "over_budget_rate", "n")
+PERCENTILES = (0.5, 0.9, 0.95)
+
+DIST_SQL = """
+with h as (
+  select dim_id, bucket, n, passed, within_budget, sum_db, sum_sq_db,
+         sum(n) over (partition by dim_id order by bucket) as cum,
+         sum(n) over (partition by dim_id) as total
+  from test_loss_rollups
+  where dim = :dim and source = :source and metric = :metric and n > 0
+    and (cast(:id as uuid) is null or dim_id = cast(:id as uuid))
+)
+select dim_id::text as dim_id, max(total) as n, sum(passed) as passed, sum(within_budget) as within_budget,
+       sum(sum_db) as sum_db, sum(sum_sq_db) as sum_sq_db,
+       min(bucket) filter (where cum >= 0.5 * total) as p50,
+       min(bucket) filter (where cum >= 0.9 * total) as p90,
+       min(bucket) filter (where cum >= 0.95 * total) as p95,
+       max(bucket) as max
+from h
+group by dim_id
+having max(total) >= :min_n
+"""
+
+# The same histogram summed over every member of the dimension (the fleet baseline)
+OVERALL_SQL = """
+select bucket, sum(n) as n, sum(passed) as passed, sum(within_budget) as within_budget,
+       sum(sum_db) as sum_db, sum(sum_sq_db) as sum_sq_db
+from test_loss_rollups
+where dim = :dim and source = :source and metric = :metric and n > 0
+group by bucket
+order by bucket
+"""
+
+
+def _stats(n: int, passed: int, within: int, sum_db: float, sum_sq: float) -> Dict[str, Any]:
+    mean = sum_db / n
+    return {
+        "n": n,
+        "mean_db": round(mean, 3),
+        "stddev_db": round(math.sqrt(max(0.0, sum_sq / n - mean * mean)), 3),
+        "pass_rate": round(passed / n, 4),
+        "fail_rate": round(1 - passed / n, 4),
+        "within_budget_rate": round(within / n, 4),
+        "over_budget_rate": round(1 - within / n, 4),
+    }
+
+
+def _edge(bucket: Optional[int], width: float) -> Optional[float]:
+    return None if bucket is None else round((bucket + 1) * width, 3)
+
+
+def overall(db: Session, dim: str, source: str, metric: str) -> Optional[Dict[str, Any]]:
+    width = BUCKET_DB[metric]
+    rows = db.execute(text(OVERALL_SQL), {"dim": dim, "source": source, "metric": metric}).all()
+    n = sum(int(r.n) for r in rows)
+    if not n:
+        return None
+    out = _stats(
+        n, sum(int(r.passed) for r in rows), sum(int(r.within_budget) for r in rows),
+        sum(float(r.sum_db) for r in rows), sum(float(r.sum_sq_db) for r in rows),
+    )
+    cum = 0
+    targets = list(PERCENTILES)
+    for r in rows:
+        cum += int(r.n)
+        while targets and cum >= targets[0] * n:
+            out[f"p{int(targets.pop(0) * 100)}_db"] = _edge(r.bucket, width)
+    out["max_db"] = _edge(rows[-1].bucket, width)
+    return out
+
+
+def distributions(
+    db: Session,
+    dim: str,
+    source: str,
+    metric: str,
+    order: str = "p90",
+    limit: int = 100,
+    min_n: int = 1,
+    dim_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Per-member loss distribution and pass rates, worst first by `order`."""
+    width = BUCKET_DB[metric]
+    rows = db.execute(
+        text(DIST_SQL), {"dim": dim, "source": source, "metric": metric, "id": dim_id, "min_n": min_n}
+    ).mappings().all()
+    out = []
+    for r in rows:
+        item = {"dim_id": r["dim_id"]}
+        item.update(_stats(int(r["n"]), int(r["passed"]), int(r["within_budget"]), float(r["sum_db"]), float(r["sum_sq_db"])))
+        for p in ("p50", "p90", "p95", "max"):
+            item[f"{p}_db"] = _edge(r[p], width)
+        out.append(item)
+    key = {"p90": "p90_db", "p50": "p50_db", "mean": "mean_db"}.get(order, order)
+    out.sort(key=lambda x: (x[key], x["n"]), reverse=True)
+    return out[:limit]
+
+
+def rebuild(db: Session) -> None:
+    """Recount every histogram from the result tables (nightly reconciliation)."""
+    db.execute(text("select rebuild_test_loss_rollups()"))
+    db.commit()
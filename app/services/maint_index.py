@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.incident import MaintWindow
+
+
+MAINT_INDEX_TTL_SEC = float(os.getenv("MAINT_INDEX_TTL_SEC", "30"))
+MAINT_INDEX_RETRY_SEC = float(os.getenv("MAINT_INDEX_RETRY_SEC", "5"))
+
+Window = Tuple[str, Any, datetime, datetime]
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def load_windows(db: Session, now: datetime) -> List[Window]:
+    # Active and upcoming windows only; expired ones can never match again
+    rows = (
+        db.query(MaintWindow.scope, MaintWindow.target_id, MaintWindow.start_at, MaintWindow.end_at)
+        .filter(MaintWindow.end_at >= now)
+        .all()
+    )
+    return [(r.scope, r.target_id, _utc(r.start_at), _utc(r.end_at)) for r in rows]
+
+
+class MaintWindowIndex:
+    """In-process interval index of maintenance windows keyed by (scope, target_id).
+
+    Each key holds window starts sorted ascending plus a running max of their ends, so
+    "is any window covering `now`" is one bisect: the windows that started by `now` are a
+    prefix of the list and one of them covers `now` iff the prefix's max end is >= now.
+
+    The index reloads after `ttl_sec` (bounds staleness across API workers) or after
+    `invalidate()` (called when this worker creates a window). A failed reload keeps the
+    previous index and is not retried for `retry_sec`, so a database outage costs one
+    failed query per interval instead of one per alert.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Session, datetime], Iterable[Window]] = load_windows,
+        ttl_sec: float = MAINT_INDEX_TTL_SEC,
+        retry_sec: float = MAINT_INDEX_RETRY_SEC,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._loader = loader
+        self._ttl = ttl_sec
+        self._retry = retry_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index: Dict[Tuple[str, Any], Tuple[List[datetime], List[datetime]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._windows = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "invalidations": 0,
+            "refresh_errors": 0,
+            "stale_served": 0,
+        }
+
+    def _build(self, windows: Iterable[Window]) -> None:
+        grouped: Dict[Tuple[str, Any], List[Tuple[datetime, datetime]]] = {}
+        count = 0
+        for scope, target_id, start_at, end_at in windows:
+            key = (scope, None if scope == "Global" else target_id)
+            grouped.setdefault(key, []).append((start_at, end_at))
+            count += 1
+        index = {}
+        for key, spans in grouped.items():
+            spans.sort()
+            starts = [s for s, _ in spans]
+            max_ends: List[datetime] = []
+            for _, e in spans:
+                max_ends.append(e if not max_ends or e > max_ends[-1] else max_ends[-1])
+            index[key] = (starts, max_ends)
+        self._index = index
+        self._windows = count
+
+    def _ensure_fresh(self, db: Session, now: datetime) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is not None and self._clock() - loaded_at < self._ttl:
+            self._counters["hits"] += 1
+            return
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._loaded_at is not None and self._clock() - self._loaded_at < self._ttl:
+                self._counters["hits"] += 1
+                return
+            if self._loaded_at is not None and self._retry_at is not None and self._clock() < self._retry_at:
+                self._counters["stale_served"] += 1
+                return
+            self._counters["misses"] += 1
+            try:
+                self._build(self._loader(db, now))
+            except Exception:
+                self._counters["refresh_errors"] += 1
+                # The failed query aborts the caller's transaction; clear it before alert writes
+                if db is not None:
+                    db.rollback()
+                if self._loaded_at is None:
+                    raise
+                # Keep serving the previous index rather than failing alert ingestion
+                self._retry_at = self._clock() + self._retry
+                self._counters["stale_served"] += 1
+                return
+            self._loaded_at = self._clock()
+            self._retry_at = None
+            self._counters["refreshes"] += 1
+
+    def _covers(self, scope: str, target_id: Any, now: datetime) -> bool:
+        entry = self._index.get((scope, target_id))
+        if not entry:
+            return False
+        starts, max_ends = entry
+        k = bisect_right(starts, now)
+        return k > 0 and max_ends[k - 1] >= now
+
+    def is_suppressed(self, db: Session, device_id: Any = None, pon_id: Any = None, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        self._ensure_fresh(db, now)
+        if self._covers("Global", None, now):
+            return True
+        if device_id is not None and self._covers("Device", device_id, now):
+            return True
+        if pon_id is not None and self._covers("PON", pon_id, now):
+            return True
+        return False
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+            self._retry_at = None
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        loaded_at = self._loaded_at
+        age = None if loaded_at is None else round(self._clock() - loaded_at, 3)
+        return {
+            **self._counters,
+            "windows": self._windows,
+            "keys": len(self._index),
+            "ttl_sec": self._ttl,
+            "retry_sec": self._retry,
+            "age_sec": age,
+            "stale": age is None or age >= self._ttl,
+        }
+
+
+maint_index = MaintWindowIndex()
@@ -0,0 +1,107 @@
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+CLUSTER_CELL_PX = float(os.getenv("MAP_CLUSTER_CELL_PX", "60"))
+# "postgis" groups with ST_SnapToGrid in the database; "python" pulls bare coordinates and
+# bins them with numpy (for replicas where the aggregate is too expensive, or for comparison)
+CLUSTER_BACKEND = os.getenv("MAP_CLUSTER_BACKEND", "postgis").lower()
+
+INCIDENT_SEVERITIES = ["P1", "P2", "P3", "P4"]
+ASSET_TYPES = ["closure", "pole"]
+
+
+def cell_size(zoom: Optional[float], bbox: Optional[Sequence[float]] = None) -> float:
+    """Grid cell in degrees: CLUSTER_CELL_PX screen pixels at `zoom`."""
+    if zoom is None:
+        # Assume a ~1024 px wide viewport over the bbox, or a city view
+        width = (bbox[2] - bbox[0]) if bbox else 0.0
+        zoom = math.log2(360.0 * 4 / width) if width > 0 else 10.0
+    return 360.0 / (256 * 2 ** max(0.0, min(zoom, 24.0))) * CLUSTER_CELL_PX
+
+
+def cluster_points(
+    lon: np.ndarray, lat: np.ndarray, cats: np.ndarray, cell: float, k: int
+) -> Dict[str, np.ndarray]:
+    """Bin points into `cell`-degree squares.
+
+    `cats` holds a category code in [0, k) per point. Returns per cluster the centroid
+    (x, y), count, per-category counts (n x k) and the index of its first point.
+    """
+    if len(lon) == 0:
+        empty = np.zeros(0)
+        return {"x": empty, "y": empty, "count": empty.astype(np.int64), "breakdown": np.zeros((0, k), np.int64), "first": empty.astype(np.int64)}
+    gx = np.floor(lon / cell).astype(np.int64)
+    gy = np.floor(lat / cell).astype(np.int64)
+    # Cell indices stay well inside +-2**30 down to zoom 24; pack both into one int64 key
+    keys = ((gx + (1 << 30)) << 31) | (gy + (1 << 30))
+    _, first, inv = np.unique(keys, return_index=True, return_inverse=True)
+    n = len(first)
+    count = np.bincount(inv, minlength=n)
+    x = np.bincount(inv, weights=lon, minlength=n) / count
+    y = np.bincount(inv, weights=lat, minlength=n) / count
+    breakdown = np.bincount(inv * k + cats, minlength=n * k).reshape(n, k)
+    return {"x": x, "y": y, "count": count, "breakdown": breakdown, "first": first}
+
+
+def _features(
+    x: Sequence[float], y: Sequence[float], count: Sequence[int], breakdown: Sequence[Sequence[int]], ids: Sequence[str], labels: List[str]
+) -> List[Dict[str, Any]]:
+    feats = []
+    for i in range(len(count)):
+        n = int(count[i])
+        props: Dict[str, Any] = {"cluster": n > 1, "count": n, "breakdown": {labels[j]: int(breakdown[i][j]) for j in range(len(labels)) if breakdown[i][j]}}
+        feat: Dict[str, Any] = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(float(x[i]), 6), round(float(y[i]), 6)]},
+            "properties": props,
+        }
+        if n == 1:
+            feat["id"] = ids[i]
+        feats.append(feat)
+    return feats
+
+
+def cluster_features(db: Session, source_sql: str, params: Dict[str, Any], labels: List[str], cell: float) -> List[Dict[str, Any]]:
+    """Cluster the rows of `source_sql` (columns id, geom, cat) into grid cells.
+
+    Features with a count of 1 keep their id so the map can open them directly.
+    """
+    params = {**params, "cell": cell}
+    if CLUSTER_BACKEND == "python":
+        rows = db.execute(
+            text(f"select s.id::text as id, ST_X(s.geom) as x, ST_Y(s.geom) as y, s.cat from ({source_sql}) s where s.geom is not null"),
+            params,
+        ).all()
+        codes = {label: j for j, label in enumerate(labels)}
+        keep = [r for r in rows if r.cat in codes]
+        lon = np.fromiter((r.x for r in keep), float, len(keep))
+        lat = np.fromiter((r.y for r in keep), float, len(keep))
+        cats = np.fromiter((codes[r.cat] for r in keep), np.int64, len(keep))
+        c = cluster_points(lon, lat, cats, cell, len(labels))
+        return _features(c["x"], c["y"], c["count"], c["breakdown"], [keep[i].id for i in c["first"]], labels)
+
+    # ST_SnapToGrid snaps to the nearest grid point; counts per category come back as an array
+    breakdown = ", ".join(f"count(*) filter (where s.cat = :cat{j})" for j in range(len(labels)))
+    params.update({f"cat{j}": label for j, label in enumerate(labels)})
+    rows = db.execute(
+        text(
+            f"""
+            select g.n, ST_X(g.c) as x, ST_Y(g.c) as y, g.breakdown, g.id
+            from (
+                select count(*) as n, ST_Centroid(ST_Collect(s.geom)) as c,
+                       array[{breakdown}] as breakdown, min(s.id::text) as id
+                from ({source_sql}) s
+                where s.geom is not null and s.cat in ({", ".join(f":cat{j}" for j in range(len(labels)))})
+                group by ST_SnapToGrid(s.geom, :cell)
+            ) g
+            """
+        ),
+        params,
+    ).all()
+    return _features([r.x for r in rows], [r.y for r in rows], [r.n for r in rows], [r.breakdown for r in rows], [r.id for r in rows], labels)
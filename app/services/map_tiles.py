@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis_binary
+
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_MAX_ZOOM = 22
+MVT_MAX_FEATURES = int(os.getenv("MVT_MAX_FEATURES", "20000"))
+# Line simplification tolerance in tile pixels (1 px = tile width / 256)
+MVT_SIMPLIFY_PX = float(os.getenv("MVT_SIMPLIFY_PX", "0.5"))
+MVT_CACHE_TTL_SEC = int(os.getenv("MVT_CACHE_TTL_SEC", "86400"))
+MVT_INCIDENTS_TTL_SEC = int(os.getenv("MVT_INCIDENTS_TTL_SEC", "30"))
+
+WEB_MERCATOR_WIDTH_M = 40075016.685578488
+
+log = logging.getLogger(__name__)
+
+
+class TileLayer:
+    def __init__(
+        self,
+        table: str,
+        props: List[Tuple[int, str]],
+        min_zoom: int,
+        line: bool = False,
+        where: Optional[List[Tuple[int, str]]] = None,
+        order: str = "",
+        ttl_sec: int = MVT_CACHE_TTL_SEC,
+    ):
+        self.table = table
+        # (from zoom, select expression): attributes only ship once they can be read
+        self.props = props
+        self.min_zoom = min_zoom
+        self.line = line
+        # (below zoom, predicate): thin features out when zoomed out
+        self.where = where or []
+        self.order = order
+        self.ttl_sec = ttl_sec
+
+
+LAYERS: Dict[str, TileLayer] = {
+    "poles": TileLayer(
+        "poles",
+        [(0, "t.id::text as id"), (0, "t.status"), (16, "t.code")],
+        min_zoom=13,
+    ),
+    "closures": TileLayer(
+        "splice_closures",
+        [(0, "t.id::text as id"), (0, "t.status"), (15, "t.code")],
+        min_zoom=11,
+    ),
+    "cables": TileLayer(
+        "cable_register",
+        [(0, "t.id::text as id"), (0, "coalesce(t.type, 'trench') as type"), (15, "t.cable_code as code"), (15, "t.chainage_m::float8 as chainage_m")],
+        min_zoom=10,
+        line=True,
+    ),
+    "incidents": TileLayer(
+        "incidents",
+        [(0, "t.id::text as id"), (0, "t.severity"), (12, "t.status"), (12, "t.category")],
+        min_zoom=0,
+        where=[(12, "t.status not in ('Resolved', 'Closed')"), (9, "t.severity in ('P1', 'P2')")],
+        order="order by t.severity, t.opened_at desc nulls last",
+        ttl_sec=MVT_INCIDENTS_TTL_SEC,
+    ),
+}
+
+
+def tile_sql(layer: str, z: int) -> str:
+    spec = LAYERS[layer]
+    props = ", ".join(expr for zoom, expr in spec.props if z >= zoom)
+    geom = "ST_Transform(t.geom, 3857)"
+    if spec.line:
+        geom = f"ST_SimplifyPreserveTopology({geom}, :tol)"
+    where = "".join(f" and {pred}" for below, pred in spec.where if z < below)
+    # The && filter runs in 4326 so the GIST indexes from 0014 are used
+    return f"""
+        with f as (
+            select ST_AsMVTGeom({geom}, ST_TileEnvelope(:z, :x, :y), {MVT_EXTENT}, {MVT_BUFFER}, true) as geom, {props}
+            from {spec.table} t
+            where t.geom && ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => {MVT_BUFFER / MVT_EXTENT}), 4326){where}
+            {spec.order}
+            limit :limit
+        )
+        select ST_AsMVT(f.*, :layer, {MVT_EXTENT}, 'geom') from f where f.geom is not null
+    """
+
+
+def render_tile(db: Session, layer: str, z: int, x: int, y: int) -> bytes:
+    if z < LAYERS[layer].min_zoom:
+        return b""
+    params = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "limit": MVT_MAX_FEATURES,
+        "layer": layer,
+        "tol": WEB_MERCATOR_WIDTH_M / (2**z) / 256 * MVT_SIMPLIFY_PX,
+    }
+    tile = db.execute(text(tile_sql(layer, z)), params).scalar()
+    return bytes(tile) if tile else b""
+
+
+def _gen_key(layer: str) -> str:
+    return f"mvt:gen:{layer}"
+
+
+def tile_etag(tile: bytes) -> str:
+    return '"' + hashlib.sha1(tile).hexdigest()[:20] + '"'
+
+
+def get_tile(db: Session, layer: str, z: int, x: int, y: int) -> Tuple[bytes, str]:
+    """Tile bytes and ETag, served from Redis when this layer generation was rendered before."""
+    try:
+        r = get_redis_binary()
+        gen = (r.get(_gen_key(layer)) or b"0").decode()
+        key = f"mvt:{layer}:{gen}:{z}:{x}:{y}"
+        cached = r.get(key)
+    except Exception as e:  # noqa: BLE001
+        log.warning("tile cache unavailable: %s", e)
+        tile = render_tile(db, layer, z, x, y)
+        return tile, tile_etag(tile)
+    if cached is not None:
+        return cached, tile_etag(cached)
+    tile = render_tile(db, layer, z, x, y)
+    try:
+        r.set(key, tile, ex=LAYERS[layer].ttl_sec)
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to cache tile %s: %s", key, e)
+    return tile, tile_etag(tile)
+
+
+def bump_layers(*layers: str) -> None:
+    # Moves the layer to a new cache generation; old tiles age out with their TTL
+    try:
+        r = get_redis_binary()
+        pipe = r.pipeline(transaction=False)
+        for layer in layers:
+            pipe.incr(_gen_key(layer))
+        pipe.execute()
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to bump tile generation for %s: %s", ",".join(layers), e)
@@ -0,0 +1,112 @@
+"""Place OTDR events on the PON's cable route.
+
+All events of a result are snapped and inserted with one statement: for cables with a
+PostGIS geometry, ST_LineInterpolatePoint runs over the unnested event fractions; for
+cables that only have a JSON polyline ([[lat, lng], ...]) the points are interpolated
+along its cumulative length with NumPy and passed in as arrays.
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+EARTH_M_PER_DEG = 111320.0
+
+# Longest cable of the plan's PON
+CABLE_SQL = """
+select c.id::text as id, c.length_m, c.geom is not null as has_geom, c.polyline
+from test_plans tp join cable_register c on c.pon_id = tp.pon_id
+where tp.id = cast(:tp as uuid)
+order by c.length_m desc nulls last
+limit 1
+"""
+
+_EVENT_COLS = "id, otdr_result_id, distance_m, gps_lat, gps_lng, event_no, loss_db, reflectance_db, event_code, created_at"
+_EVENTS = """
+unnest(cast(:d as float8[]), cast(:no as int[]), cast(:loss as float8[]), cast(:refl as float8[]), cast(:code as text[]),
+       cast(:lat as float8[]), cast(:lng as float8[])) as e(d, no, loss, refl, code, lat, lng)
+"""
+
+INSERT_GEOM_SQL = f"""
+insert into otdr_events ({_EVENT_COLS})
+select gen_random_uuid(), cast(:rid as uuid), e.d, ST_Y(q.pt), ST_X(q.pt), e.no, e.loss, e.refl, e.code, now()
+from cable_register c
+cross join {_EVENTS}
+cross join lateral (
+  select ST_LineInterpolatePoint(
+    c.geom, greatest(0, least(1, e.d / coalesce(nullif(c.length_m, 0), nullif(ST_Length(c.geom::geography), 0), 1)))
+  ) as pt
+) q
+where c.id = cast(:cid as uuid)
+"""
+
+INSERT_POINTS_SQL = f"""
+insert into otdr_events ({_EVENT_COLS})
+select gen_random_uuid(), cast(:rid as uuid), e.d, e.lat, e.lng, e.no, e.loss, e.refl, e.code, now()
+from {_EVENTS}
+"""
+
+
+def polyline_lengths(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Cumulative length in metres at each vertex (equirectangular; cable spans are short)."""
+    dy = np.diff(lat) * EARTH_M_PER_DEG
+    dx = np.diff(lng) * EARTH_M_PER_DEG * np.cos(np.radians((lat[1:] + lat[:-1]) / 2))
+    return np.concatenate(([0.0], np.cumsum(np.hypot(dx, dy))))
+
+
+def interpolate_polyline(coords: Sequence[Sequence[float]], distances: np.ndarray, length_m: Optional[float] = None) -> Optional[np.ndarray]:
+    """(n, 2) lat/lng for each distance along the polyline.
+
+    Distances are taken as a fraction of the registered `length_m` (the optical length, which
+    includes slack), falling back to the drawn length, and clamped to the route's ends.
+    """
+    pts = np.asarray(coords, dtype=np.float64)
+    if pts.ndim != 2 or pts.shape[0] == 0 or pts.shape[1] < 2:
+        return None
+    if pts.shape[0] == 1:
+        return np.repeat(pts[:1, :2], len(distances), axis=0)
+    cum = polyline_lengths(pts[:, 0], pts[:, 1])
+    total = float(length_m) if length_m and length_m > 0 else cum[-1]
+    if total <= 0 or cum[-1] <= 0:
+        return np.repeat(pts[:1, :2], len(distances), axis=0)
+    along = np.clip(np.asarray(distances, dtype=np.float64) / total, 0.0, 1.0) * cum[-1]
+    return np.column_stack((np.interp(along, cum, pts[:, 0]), np.interp(along, cum, pts[:, 1])))
+
+
+def _arrays(events: List[Dict[str, Any]]) -> Dict[str, list]:
+    return {
+        "d": [float(e["distance_m"]) for e in events],
+        "no": [e.get("event_no") for e in events],
+        "loss": [e.get("loss_db") for e in events],
+        "refl": [e.get("reflectance_db") for e in events],
+        "code": [e.get("code") for e in events],
+    }
+
+
+def snap_events(db: Session, result_id: str, test_plan_id: str, events: List[Dict[str, Any]]) -> int:
+    """Insert the result's events (distance_m plus optional event_no/loss_db/reflectance_db/code) snapped to the route."""
+    events = [e for e in events if e.get("distance_m") is not None and np.isfinite(e["distance_m"])]
+    if not events:
+        return 0
+    cable = db.execute(text(CABLE_SQL), {"tp": test_plan_id}).mappings().first()
+    if not cable:
+        return 0
+    params: Dict[str, Any] = {"rid": result_id, **_arrays(events)}
+    if cable["has_geom"]:
+        params.update(cid=cable["id"], lat=None, lng=None)
+        return db.execute(text(INSERT_GEOM_SQL), params).rowcount
+    if not cable["polyline"]:
+        return 0
+    try:
+        coords = json.loads(cable["polyline"])
+    except (TypeError, ValueError):
+        return 0
+    length = float(cable["length_m"]) if cable["length_m"] is not None else None
+    snapped = interpolate_polyline(coords, np.asarray(params["d"]), length)
+    if snapped is None:
+        return 0
+    params.update(lat=snapped[:, 0].tolist(), lng=snapped[:, 1].tolist())
+    return db.execute(text(INSERT_POINTS_SQL), params).rowcount
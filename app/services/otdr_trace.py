@@ -0,0 +1,154 @@
+"""Stored OTDR traces: compressed sample levels in S3 and windowed reads for the UI.
+
+A parsed trace is kept as its raw uint16 samples (0.001 dB x scale, as in the .sor DataPts
+block) plus min/max-decimated preview levels, each level a separate object (delta-encoded,
+byte-shuffled, zlib):
+
+  {prefix}/L0.bin   n samples                      "<u2"
+  {prefix}/L{k}.bin ceil(n / 8**k) (min, max) pairs "<u2", until a level fits PREVIEW_MIN points
+
+window() serves a distance range at a requested number of points from the coarsest level
+that still has at least that many buckets in the range, so a zoomed-out view of a 100 km
+trace reads a few kB and the full-resolution samples are only read when zoomed in.
+Level objects are cached in Redis as stored (compressed).
+"""
+import logging
+import math
+import os
+import uuid
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.redis_client import get_redis_binary
+from app.services import s3
+
+
+LEVEL_FACTOR = 8
+PREVIEW_MIN = int(os.getenv("OTDR_TRACE_PREVIEW_MIN", "512"))
+TRACE_CACHE_TTL_SEC = int(os.getenv("OTDR_TRACE_CACHE_TTL_SEC", "3600"))
+KEY_PREFIX = "otdr/traces"
+
+log = logging.getLogger(__name__)
+
+
+def build_levels(points: np.ndarray) -> List[np.ndarray]:
+    """Level 0 is the samples; level k is (min, max) of each run of LEVEL_FACTOR**k samples."""
+    levels = [np.ascontiguousarray(points, dtype="<u2")]
+    lo = hi = levels[0]
+    while len(lo) > PREVIEW_MIN:
+        pad = (-len(lo)) % LEVEL_FACTOR
+        # Pad with edge values so the last partial bucket keeps its true min/max
+        lo = np.pad(lo, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).min(axis=1)
+        hi = np.pad(hi, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).max(axis=1)
+        levels.append(np.column_stack((lo, hi)).astype("<u2"))
+    return levels
+
+
+def encode_level(level: np.ndarray) -> bytes:
+    # Deltas between neighbouring samples (mod 2**16) with low and high bytes split into
+    # separate planes compress much better than the samples themselves
+    a = level.astype("<u2", copy=False).reshape(len(level), -1)
+    d = np.diff(a, axis=0, prepend=np.zeros((1, a.shape[1]), dtype="<u2")).astype("<u2")
+    return zlib.compress(d.view(np.uint8).reshape(-1, 2).T.tobytes(), 6)
+
+
+def decode_level(data: bytes, level: int) -> np.ndarray:
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(2, -1)
+    d = np.ascontiguousarray(planes.T).view("<u2").reshape(-1, 1 if level == 0 else 2)
+    arr = np.cumsum(d, axis=0, dtype=np.uint16)
+    return arr[:, 0] if level == 0 else arr
+
+
+def store(points: np.ndarray, resolution_m: float, scale: float, prefix: Optional[str] = None) -> Dict[str, Any]:
+    """Upload the levels of a trace; returns the metadata kept on otdr_results."""
+    prefix = prefix or f"{KEY_PREFIX}/{uuid.uuid4()}"
+    levels = build_levels(points)
+    size = 0
+    for k, level in enumerate(levels):
+        blob = encode_level(level)
+        size += len(blob)
+        s3.put_bytes(f"{prefix}/L{k}.bin", "application/octet-stream", blob)
+    return {
+        "trace_key": prefix,
+        "trace_points": int(len(points)),
+        "trace_levels": len(levels),
+        "trace_resolution_m": float(resolution_m),
+        "trace_scale": float(scale),
+        "trace_bytes": size,
+    }
+
+
+def discard(meta: Dict[str, Any]) -> None:
+    """Delete the level objects of a stored trace that was never recorded (best effort)."""
+    try:
+        s3.delete_objects([f"{meta['trace_key']}/L{k}.bin" for k in range(meta["trace_levels"])])
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to delete unused trace %s: %s", meta["trace_key"], e)
+
+
+def load_level(prefix: str, level: int) -> np.ndarray:
+    key = f"{prefix}/L{level}.bin"
+    cache_key = f"otdr:trace:{key}"
+    try:
+        r = get_redis_binary()
+        cached = r.get(cache_key)
+        if cached is not None:
+            return decode_level(cached, level)
+    except Exception as e:  # noqa: BLE001
+        log.warning("trace cache unavailable: %s", e)
+        return decode_level(s3.get_object_bytes(key), level)
+    data = s3.get_object_bytes(key)
+    try:
+        r.set(cache_key, data, ex=TRACE_CACHE_TTL_SEC)
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to cache trace level %s: %s", key, e)
+    return decode_level(data, level)
+
+
+def window(
+    meta: Dict[str, Any],
+    from_m: Optional[float],
+    to_m: Optional[float],
+    points: int,
+    loader: Callable[[str, int], np.ndarray] = load_level,
+) -> Dict[str, Any]:
+    """At most `points` (min, max) buckets covering [from_m, to_m], in dB (0 at the top of the trace)."""
+    n = meta["trace_points"]
+    res = meta["trace_resolution_m"]
+    i0 = max(0, int(math.floor((from_m or 0.0) / res)))
+    i1 = n if to_m is None else min(n, int(math.ceil(to_m / res)) + 1)
+    if i1 <= i0:
+        return {"from_m": i0 * res, "to_m": i0 * res, "step_m": res, "level": 0, "distance_m": [], "min_db": [], "max_db": []}
+
+    # Coarsest level that still has at least `points` buckets inside the window
+    level = 0
+    while level + 1 < meta["trace_levels"] and (i1 - i0) // LEVEL_FACTOR ** (level + 1) >= points:
+        level += 1
+    f = LEVEL_FACTOR ** level
+    data = loader(meta["trace_key"], level)
+    j0, j1 = i0 // f, -(-i1 // f)
+    if level == 0:
+        lo = hi = data[j0:j1]
+    else:
+        lo, hi = data[j0:j1, 0], data[j0:j1, 1]
+
+    m = j1 - j0
+    buckets = min(points, m)
+    starts = np.unique((np.arange(buckets) * m) // buckets)
+    if len(starts) < m:
+        lo = np.minimum.reduceat(lo, starts)
+        hi = np.maximum.reduceat(hi, starts)
+    step = f * m / len(starts) * res
+    to_db = -0.001 * meta["trace_scale"]
+    # Raw samples grow with attenuation, so the largest raw value is the lowest level
+    return {
+        "from_m": round(i0 * res, 2),
+        "to_m": round(min(i1, n - 1) * res, 2),
+        "step_m": round(step, 3),
+        "level": level,
+        "distance_m": np.round((j0 + starts) * f * res, 2).tolist(),
+        "min_db": np.round(hi.astype(np.float64) * to_db, 3).tolist(),
+        "max_db": np.round(lo.astype(np.float64) * to_db, 3).tolist(),
+    }
@@ -0,0 +1,226 @@
+"""Thumbnails and previews of registered photos for galleries.
+
+Each photo gets two derivatives, upright per its EXIF orientation and without metadata,
+under keys derived from the photo id and a token of its source object (object_token):
+
+  photos/{photo_id}/{token}/thumb.{ext}    longest side PHOTO_THUMB_PX
+  photos/{photo_id}/{token}/preview.{ext}  longest side PHOTO_PREVIEW_PX
+
+A photo re-registered with another object thus gets new URLs (no stale cached images), and
+a late render of the old object cannot overwrite the new derivatives.
+
+Rendering runs on a process pool (PIL decode/resize is CPU bound). JPEGs are decoded
+with DCT scaling (Image.draft) at the smallest scale still covering the preview, so a
+12 MP photo is never decoded at full size. Registration queues the work after the
+response; photos still without derivatives (s3_key set, derivatives_at null) are picked
+up by the scheduler. Both paths claim a photo (derivatives_claimed_at) before rendering
+it, so it is rendered once; a claim older than PHOTO_DERIVATIVE_CLAIM_SEC counts as
+abandoned. A failed render records derivatives_error but leaves derivatives_at null: the
+scheduler retries it once its claim is that old, and registering the photo again retries
+it at once. Results are only saved while the photo still points at the rendered s3_key.
+The perceptual hash for duplicate detection (photo_hash) is taken
+from the same decoded image.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services import photo_hash, s3
+
+
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PHOTO_DERIVATIVE_FORMAT = os.getenv("PHOTO_DERIVATIVE_FORMAT", "webp").lower()
+PHOTO_DERIVATIVE_QUALITY = int(os.getenv("PHOTO_DERIVATIVE_QUALITY", "80"))
+PHOTO_DERIVATIVE_BATCH = int(os.getenv("PHOTO_DERIVATIVE_BATCH", "500"))
+PHOTO_DERIVATIVE_CLAIM_SEC = int(os.getenv("PHOTO_DERIVATIVE_CLAIM_SEC", "900"))
+SIZES = {
+    "preview": int(os.getenv("PHOTO_PREVIEW_PX", "1280")),
+    "thumb": int(os.getenv("PHOTO_THUMB_PX", "320")),
+}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# photos columns derived from the object at s3_key: cleared whenever the key changes
+DERIVED_COLUMNS = (
+    "thumb_url", "preview_url", "derivatives_at", "derivatives_error", "derivatives_claimed_at",
+    "phash", "phash_h0", "phash_h1", "phash_h2", "phash_h3", "duplicate_of", "duplicate_distance",
+)
+
+log = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> Optional[Executor]:
+    global _pool
+    if PHOTO_WORKERS <= 0:
+        return None
+    if _pool is None:
+        # spawn: forking a threaded API/scheduler process is not safe
+        _pool = ProcessPoolExecutor(PHOTO_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def object_token(s3_key: str) -> str:
+    return hashlib.sha1(s3_key.encode()).hexdigest()[:12]
+
+
+def derivative_key(photo_id: str, s3_key: str, name: str, fmt: str = PHOTO_DERIVATIVE_FORMAT) -> str:
+    return f"photos/{photo_id}/{object_token(s3_key)}/{name}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def open_upright(data: bytes) -> Image.Image:
+    """Decoded RGB image with EXIF orientation applied, at least as large as the preview."""
+    img = Image.open(BytesIO(data))
+    largest = max(SIZES.values())
+    if img.format == "JPEG":
+        img.draft("RGB", (largest, largest))
+    img = ImageOps.exif_transpose(img)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def encode(img: Image.Image, fmt: str = PHOTO_DERIVATIVE_FORMAT, quality: int = PHOTO_DERIVATIVE_QUALITY) -> Dict[str, bytes]:
+    """Encoded derivatives by name, largest first (each is resized from the previous one, in place)."""
+    pil_format = FORMATS[fmt][0]
+    out = {}
+    for name, px in sorted(SIZES.items(), key=lambda kv: -kv[1]):
+        img.thumbnail((px, px), Image.LANCZOS)
+        bio = BytesIO()
+        if pil_format == "WEBP":
+            img.save(bio, pil_format, quality=quality, method=4)
+        else:
+            img.save(bio, pil_format, quality=quality, optimize=True, progressive=True)
+        out[name] = bio.getvalue()
+    return out
+
+
+def render(data: bytes, fmt: str = PHOTO_DERIVATIVE_FORMAT, quality: int = PHOTO_DERIVATIVE_QUALITY) -> Dict[str, bytes]:
+    return encode(open_upright(data), fmt, quality)
+
+
+def generate(item: Tuple[str, str]) -> Dict[str, Any]:
+    """Render and store the derivatives of (photo_id, s3_key); errors are returned (used on the pool)."""
+    photo_id, key = item
+    try:
+        content_type = FORMATS[PHOTO_DERIVATIVE_FORMAT][1]
+        img = open_upright(s3.get_object_bytes(key))
+        phash = photo_hash.dhash(img)
+        urls = {}
+        for name, data in encode(img).items():
+            urls[name] = s3.put_bytes(derivative_key(photo_id, key, name), content_type, data)
+        return {"photo_id": photo_id, "s3_key": key, "thumb_url": urls["thumb"], "preview_url": urls["preview"], "phash": phash}
+    except Exception as e:  # noqa: BLE001
+        return {"photo_id": photo_id, "s3_key": key, "error": str(e) or type(e).__name__}
+
+
+def generate_many(items: Iterable[Tuple[str, str]], pool: Optional[Executor] = None) -> List[Dict[str, Any]]:
+    items = list(items)
+    pool = pool if pool is not None else get_pool()
+    if pool is None or len(items) < 2:
+        return [generate(i) for i in items]
+    return list(pool.map(generate, items, chunksize=max(1, len(items) // (4 * PHOTO_WORKERS))))
+
+
+def _unclaimed(p: str) -> str:
+    return f"({p}.derivatives_claimed_at is null or {p}.derivatives_claimed_at < now() - make_interval(secs => :claim_sec))"
+
+
+# Concurrent claims of one row serialize on its row lock; the loser re-checks and skips it
+CLAIM_SQL = f"""
+    update photos p set derivatives_claimed_at = now(), derivatives_error = null
+    from unnest(cast(:ids as uuid[]), cast(:keys as text[])) as v(id, s3_key)
+    where p.id = v.id and p.s3_key = v.s3_key and p.derivatives_at is null
+      and (p.derivatives_error is not null or {_unclaimed("p")})
+    returning p.id::text as id, p.s3_key
+"""
+
+# Failed renders keep their claim, so the scheduler retries them only every PHOTO_DERIVATIVE_CLAIM_SEC
+CLAIM_PENDING_SQL = f"""
+    update photos p set derivatives_claimed_at = now(), derivatives_error = null
+    where p.id in (
+      select q.id from photos q
+      where q.s3_key is not null and q.derivatives_at is null and {_unclaimed("q")}
+      limit :n
+      for update skip locked
+    )
+    returning p.id::text as id, p.s3_key
+"""
+
+SAVE_SQL = """
+    update photos p
+    set thumb_url = v.thumb_url, preview_url = v.preview_url, derivatives_error = v.error,
+        derivatives_at = case when v.error is null then now() end,
+        phash = v.phash, phash_h0 = v.h0, phash_h1 = v.h1, phash_h2 = v.h2, phash_h3 = v.h3,
+        duplicate_of = null, duplicate_distance = null
+    from unnest(
+           cast(:ids as uuid[]), cast(:keys as text[]), cast(:thumbs as text[]), cast(:previews as text[]),
+           cast(:errors as text[]), cast(:hashes as bigint[]), cast(:h0 as int[]), cast(:h1 as int[]), cast(:h2 as int[]),
+           cast(:h3 as int[])
+         ) as v(id, s3_key, thumb_url, preview_url, error, phash, h0, h1, h2, h3)
+    where p.id = v.id and p.s3_key = v.s3_key
+    returning p.id::text as id
+"""
+
+
+def save(db: Session, results: List[Dict[str, Any]]) -> None:
+    """Record derivative URLs and hashes (or the error; the photo stays pending) for all results at
+    once, then flag the photos that duplicate an earlier one (earlier flags are cleared first).
+
+    Results for a photo re-registered with another object meanwhile are dropped.
+    """
+    if not results:
+        return
+    for r in results:
+        if "error" in r:
+            log.warning("photo %s derivatives failed: %s", r["photo_id"], r["error"])
+    parts = [photo_hash.chunks(r["phash"]) if r.get("phash") is not None else [None] * photo_hash.CHUNKS for r in results]
+    saved = set(
+        db.execute(
+            text(SAVE_SQL),
+            {
+                "ids": [r["photo_id"] for r in results],
+                "keys": [r["s3_key"] for r in results],
+                "thumbs": [r.get("thumb_url") for r in results],
+                "previews": [r.get("preview_url") for r in results],
+                "errors": [r.get("error") for r in results],
+                "hashes": [r.get("phash") for r in results],
+                **{f"h{j}": [c[j] for c in parts] for j in range(photo_hash.CHUNKS)},
+            },
+        ).scalars()
+    )
+    hashed = [(r["photo_id"], r["phash"]) for r in results if r.get("phash") is not None and r["photo_id"] in saved]
+    for m in photo_hash.flag_duplicates(db, hashed):
+        log.info("photo %s duplicates %s (%s bits)", m["id"], m["duplicate_of"], m["distance"])
+
+
+def run(items: List[Tuple[str, str]]) -> int:
+    """Generate and record derivatives for (photo_id, s3_key) pairs; background task entry point."""
+    # Imported here so pool workers, which import this module, do not set up the database
+    from app.core.deps import SessionLocal
+
+    with SessionLocal() as db:
+        claimed = db.execute(
+            text(CLAIM_SQL),
+            {"ids": [i for i, _ in items], "keys": [k for _, k in items], "claim_sec": PHOTO_DERIVATIVE_CLAIM_SEC},
+        ).all()
+        db.commit()
+        results = generate_many([(r.id, r.s3_key) for r in claimed])
+        save(db, results)
+        db.commit()
+    return sum(1 for r in results if "error" not in r)
+
+
+def run_pending(db: Session, limit: int = PHOTO_DERIVATIVE_BATCH) -> int:
+    """Catch up registered photos without derivatives (queued work lost to a restart, older photos)."""
+    rows = db.execute(text(CLAIM_PENDING_SQL), {"n": limit, "claim_sec": PHOTO_DERIVATIVE_CLAIM_SEC}).all()
+    db.commit()
+    results = generate_many([(r.id, r.s3_key) for r in rows])
+    save(db, results)
+    db.commit()
+    return len(rows)
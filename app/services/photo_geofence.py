@@ -0,0 +1,102 @@
+"""Photo geofence checks in SQL, and nightly revalidation of PONs whose geofence changed.
+
+A photo is inside its PON when its GPS point lies in pons.geofence_geom or, for PONs
+without a polygon, within geofence_radius_m of the center (ST_DWithin on the sphere).
+Photos without a position, or of PONs with neither, are outside.
+
+Editing a PON's center, radius or polygon stamps pons.geofence_changed_at (trigger,
+migration 0029). revalidate() redoes within_geofence for the photos of those PONs only,
+one UPDATE per batch of PONs that writes just the rows whose result changed, then stamps
+geofence_checked_at with the change it covered.
+"""
+import logging
+import os
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+PHOTO_REVALIDATE_PONS = int(os.getenv("PHOTO_REVALIDATE_PONS", "200"))
+
+log = logging.getLogger(__name__)
+
+
+def within_sql(lat: str, lng: str, pon: str = "x") -> str:
+    """Boolean SQL expression: point (lat, lng) is inside the geofence of pons row `pon`."""
+    point = f"ST_SetSRID(ST_MakePoint(({lng})::float8, ({lat})::float8), 4326)"
+    center = f"ST_SetSRID(ST_MakePoint({pon}.center_lng::float8, {pon}.center_lat::float8), 4326)"
+    return f"""coalesce(
+          case
+            when {lat} is null or {lng} is null then false
+            when {pon}.geofence_geom is not null then ST_Contains({pon}.geofence_geom, {point})
+            when {pon}.center_lat is not null and {pon}.center_lng is not null
+              then ST_DWithin({point}::geography, {center}::geography, {pon}.geofence_radius_m, false)
+          end, false)"""
+
+
+# Single photo (/photos/register, /photos/validate): same predicate as the bulk paths
+POINT_SQL = f"""
+    select x.geofence_geom is not null or (x.center_lat is not null and x.center_lng is not null) as fenced,
+           {within_sql("cast(:lat as float8)", "cast(:lng as float8)")} as within
+    from pons x
+    where x.id = cast(:pon as uuid)
+"""
+
+DIRTY_SQL = """
+    select id::text as id, geofence_changed_at as changed_at
+    from pons
+    where geofence_changed_at is not null
+      and (geofence_checked_at is null or geofence_checked_at < geofence_changed_at)
+      and geofence_changed_at <= :cutoff
+    order by geofence_changed_at
+    limit :n
+"""
+
+REVALIDATE_SQL = f"""
+    update photos p
+    set within_geofence = v.within
+    from (
+      select q.id, {within_sql("q.gps_lat", "q.gps_lng")} as within
+      from photos q
+      join pons x on x.id = q.pon_id
+      where q.pon_id = any(cast(:pons as uuid[]))
+    ) v
+    where p.id = v.id and p.within_geofence is distinct from v.within
+"""
+
+CHECKED_SQL = """
+    update pons x set geofence_checked_at = v.changed_at
+    from unnest(cast(:pons as uuid[]), cast(:changed as timestamptz[])) as v(id, changed_at)
+    where x.id = v.id
+"""
+
+
+def check_point(db: Session, pon_id: Any, lat: Any, lng: Any) -> Tuple[bool, bool]:
+    """(PON has a geofence, point is inside it); (False, False) for a missing PON."""
+    if pon_id is None:
+        return False, False
+    row = db.execute(text(POINT_SQL), {"pon": str(pon_id), "lat": lat, "lng": lng}).first()
+    return (bool(row.fenced), bool(row.within)) if row else (False, False)
+
+
+def revalidate(db: Session, batch: int = PHOTO_REVALIDATE_PONS) -> Dict[str, int]:
+    """Recompute within_geofence for photos of PONs whose geofence changed since their last check.
+
+    PONs edited while this runs stay dirty for the next run (the stamp covers the change seen).
+    """
+    cutoff = db.execute(text("select now()")).scalar()
+    db.commit()
+    pons = photos = 0
+    while True:
+        dirty = db.execute(text(DIRTY_SQL), {"cutoff": cutoff, "n": batch}).all()
+        if not dirty:
+            break
+        ids = [r.id for r in dirty]
+        photos += db.execute(text(REVALIDATE_SQL), {"pons": ids}).rowcount or 0
+        db.execute(text(CHECKED_SQL), {"pons": ids, "changed": [r.changed_at for r in dirty]})
+        db.commit()
+        pons += len(ids)
+    if pons:
+        log.info("photo revalidation: %s PONs, %s photos changed", pons, photos)
+    return {"pons": pons, "photos": photos}
@@ -0,0 +1,145 @@
+"""Perceptual hashes of photos and near-duplicate search (recycled photos).
+
+A 64-bit dHash (sign of horizontal brightness steps on a 9x8 grayscale thumbnail) is taken
+from the upright image when derivatives are rendered; it survives recompression, resizing
+and small edits. Photos within PHASH_MAX_DISTANCE bits of an earlier photo get
+duplicate_of set and no longer satisfy the validated-photo gates.
+
+Search is multi-index hashing: the hash is split into four 16-bit chunks, each indexed
+(photos.phash_h0..h3). Two hashes within k bits agree to within k // 4 bits on at least
+one chunk, so probing every chunk value within that radius finds all matches with a few
+btree lookups; candidates are then checked on the full hash with bit_count.
+"""
+import os
+from itertools import combinations
+from typing import Any, Dict, List, Sequence, Tuple
+
+from PIL import Image
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+# Near-uniform images (blank, lens cap) hash to almost all 0 or 1 bits and match each other
+PHASH_MIN_BITS = 4
+CHUNKS = 4
+CHUNK_BITS = 16
+_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash of an image, as a signed int64 for a Postgres bigint."""
+    small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    px = small.tobytes()
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = (h << 1) | (px[row * 9 + col] < px[row * 9 + col + 1])
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def distance(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
+
+
+def informative(h: int) -> bool:
+    bits = (h & ((1 << 64) - 1)).bit_count()
+    return PHASH_MIN_BITS <= bits <= 64 - PHASH_MIN_BITS
+
+
+def chunks(h: int) -> List[int]:
+    """The four 16-bit chunks of a hash, most significant first."""
+    u = h & ((1 << 64) - 1)
+    return [(u >> (CHUNK_BITS * (CHUNKS - 1 - i))) & _MASK for i in range(CHUNKS)]
+
+
+def chunk_probes(value: int, radius: int) -> List[int]:
+    """All chunk values within `radius` bits of `value`."""
+    out = [value]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            v = value
+            for b in bits:
+                v ^= 1 << b
+            out.append(v)
+    return out
+
+
+def probes(hashes: Sequence[Tuple[str, int]], max_distance: int = PHASH_MAX_DISTANCE) -> Dict[str, List[Any]]:
+    """Flattened (photo id, hash, chunk no, chunk value) probe rows for DUPLICATES_SQL."""
+    radius = max_distance // CHUNKS
+    ids, hs, js, cs = [], [], [], []
+    for photo_id, h in hashes:
+        for j, value in enumerate(chunks(h)):
+            for c in chunk_probes(value, radius):
+                ids.append(photo_id)
+                hs.append(h)
+                js.append(j)
+                cs.append(c)
+    return {"ids": ids, "hs": hs, "js": js, "cs": cs, "k": max_distance}
+
+
+_CANDIDATES = " union all ".join(
+    f"select pr.id, pr.h, q.id as qid, q.phash, q.duplicate_of, q.derivatives_at from probe pr "
+    f"join photos q on pr.j = {j} and q.phash_h{j} = pr.c and q.phash is not null"
+    for j in range(CHUNKS)
+)
+
+# Nearest earlier photo within k bits for each probed photo. "Earlier" is a previous batch
+# (derivatives_at before this transaction) or, within a batch, the lower id.
+MATCHES_SQL = f"""
+    with probe(id, h, j, c) as (
+      select * from unnest(cast(:ids as uuid[]), cast(:hs as bigint[]), cast(:js as int[]), cast(:cs as int[]))
+    ),
+    cand as ({_CANDIDATES})
+    select distinct on (id) id::text as id, coalesce(duplicate_of, qid)::text as duplicate_of,
+           bit_count(cast(phash # h as bit(64))) as distance
+    from cand
+    where qid <> id
+      and (derivatives_at < now() or qid < id)
+      and bit_count(cast(phash # h as bit(64))) <= :k
+    order by id, distance, derivatives_at, qid
+"""
+
+FLAG_SQL = """
+    update photos p set duplicate_of = cast(v.dup as uuid), duplicate_distance = v.d
+    from unnest(cast(:ids as uuid[]), cast(:dups as text[]), cast(:ds as int[])) as v(id, dup, d)
+    where p.id = v.id
+"""
+
+SIMILAR_SQL = f"""
+    with probe(id, h, j, c) as (
+      select * from unnest(cast(:ids as uuid[]), cast(:hs as bigint[]), cast(:js as int[]), cast(:cs as int[]))
+    ),
+    cand as ({_CANDIDATES})
+    select distinct qid::text as id, x.pon_id::text as pon_id, x.thumb_url, x.taken_ts,
+           bit_count(cast(c.phash # c.h as bit(64))) as distance
+    from cand c join photos x on x.id = c.qid
+    where c.qid <> c.id and bit_count(cast(c.phash # c.h as bit(64))) <= :k
+    order by distance, x.taken_ts
+    limit :limit
+"""
+
+
+def flag_duplicates(db: Session, hashes: Sequence[Tuple[str, int]], max_distance: int = PHASH_MAX_DISTANCE) -> List[Dict[str, Any]]:
+    """Set duplicate_of on photos whose hash is within max_distance of an earlier photo.
+
+    Expects the hashes to be saved already (same transaction); returns the matches.
+    """
+    hashes = [(pid, h) for pid, h in hashes if informative(h)]
+    if not hashes:
+        return []
+    matches = [dict(r) for r in db.execute(text(MATCHES_SQL), probes(hashes, max_distance)).mappings()]
+    if matches:
+        db.execute(
+            text(FLAG_SQL),
+            {"ids": [m["id"] for m in matches], "dups": [m["duplicate_of"] for m in matches], "ds": [m["distance"] for m in matches]},
+        )
+    return matches
+
+
+def similar(db: Session, photo_id: str, h: int, max_distance: int = PHASH_MAX_DISTANCE, limit: int = 50) -> List[Dict[str, Any]]:
+    """Photos within max_distance bits of a hash, nearest first."""
+    params = probes([(photo_id, h)], max_distance)
+    params["limit"] = limit
+    return [dict(r) for r in db.execute(text(SIMILAR_SQL), params).mappings()]
@@ -0,0 +1,61 @@
+import logging
+import os
+from typing import Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.redis_client import get_redis_sync
+from app.services.geojson_stream import feature_sql
+
+
+PON_MAP_CACHE_TTL_SEC = int(os.getenv("PON_MAP_CACHE_TTL_SEC", "86400"))
+
+CLOSURE_FEATURE = feature_sql("t.id", "json_build_object('type', 'closure', 'code', t.code, 'status', t.status)", "t.geom")
+POLE_FEATURE = feature_sql("t.id", "json_build_object('type', 'pole', 'code', t.code, 'status', t.status)", "t.geom")
+CABLE_FEATURE = feature_sql(
+    "t.id", "json_build_object('type', coalesce(t.type, 'trench'), 'code', t.cable_code, 'chainage_m', t.chainage_m)", "t.geom"
+)
+
+# One round trip: every feature is built as text and aggregated into the collection
+ASSETS_SQL = f"""
+    select '{{"type":"FeatureCollection","features":[' || coalesce(string_agg(f.feature, ','), '') || ']}}'
+    from (
+        select {CLOSURE_FEATURE} as feature from splice_closures t where t.pon_id = :p and t.geom is not null
+        union all
+        select {POLE_FEATURE} from poles t where t.pon_id = :p and t.geom is not null
+        union all
+        select {CABLE_FEATURE} from cable_register t where t.pon_id = :p and t.geom is not null
+    ) f
+"""
+
+log = logging.getLogger(__name__)
+
+
+def pon_version(db: Session, pon_id: str) -> int:
+    """Change counter bumped by triggers on closures, poles and cables (migration 0019)."""
+    v = db.execute(text("select version from pon_map_versions where pon_id = cast(:p as uuid)"), {"p": pon_id}).scalar()
+    return int(v or 0)
+
+
+def render_assets(db: Session, pon_id: str) -> str:
+    return db.execute(text(ASSETS_SQL), {"p": pon_id}).scalar()
+
+
+def get_assets(db: Session, pon_id: str) -> Tuple[str, str]:
+    """Asset layer payload and ETag, rendered once per PON version."""
+    version = pon_version(db, pon_id)
+    etag = f'"pon-{pon_id}-{version}"'
+    key = f"map:pon:{pon_id}:{version}"
+    try:
+        cached = get_redis_sync().get(key)
+        if cached is not None:
+            return cached, etag
+    except Exception as e:  # noqa: BLE001
+        log.warning("pon map cache unavailable: %s", e)
+    payload = render_assets(db, pon_id)
+    try:
+        get_redis_sync().set(key, payload, ex=PON_MAP_CACHE_TTL_SEC)
+    except Exception as e:  # noqa: BLE001
+        log.warning("failed to cache %s: %s", key, e)
+    return payload, etag
@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import Optional, Tuple, Dict, Any
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 
 import boto3
 
@@ -38,12 +38,36 @@ def get_object_bytes(key: str) -> bytes:
     return obj["Body"].read()
 
 
+def get_object_range(key: str, start: int, end: int) -> bytes:
+    """Bytes start..end (inclusive) of an object via a Range GET."""
+    s3 = get_client()
+    obj = s3.get_object(Bucket=settings.S3_BUCKET, Key=key, Range=f"bytes={start}-{end}")
+    return obj["Body"].read()
+
+
 def put_bytes(key: str, content_type: str, data: bytes) -> str:
     s3 = get_client()
     s3.put_object(Bucket=settings.S3_BUCKET, Key=key, Body=data, ContentType=content_type)
     return f"{settings.S3_ENDPOINT}/{settings.S3_BUCKET}/{key}".replace("http://", "https://")
 
 
+def delete_objects(keys: List[str]) -> None:
+    s3 = get_client()
+    s3.delete_objects(Bucket=settings.S3_BUCKET, Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True})
+
+
+def upload_fileobj(key: str, fileobj: BinaryIO, content_type: str = "application/octet-stream") -> None:
+    # Multipart upload straight from the file object; the body is never held in memory
+    s3 = get_client()
+    s3.upload_fileobj(fileobj, settings.S3_BUCKET, key, ExtraArgs={"ContentType": content_type})
+
+
+def open_object(key: str):
+    """Streaming body of an object (file-like `.read(n)`); close it when done."""
+    s3 = get_client()
+    return s3.get_object(Bucket=settings.S3_BUCKET, Key=key)["Body"]
+
+
 def head_object(key: str) -> Dict[str, Any]:
     s3 = get_client()
     # boto3 S3 compatible head_object
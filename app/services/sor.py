@@ -0,0 +1,306 @@
+"""OTDR trace files (.sor, Telcordia/Bellcore SR-4731 issue 1 and 2).
+
+A .sor file is a map block listing named blocks (name, version, size) followed by the
+blocks themselves; issue 2 prefixes the map and every block with its NUL-terminated name.
+All integers are little-endian. Only the blocks needed for acceptance are decoded:
+
+  SupParams  supplier (vendor)
+  FxdParams  wavelength, pulse width, data spacing, group index
+  KeyEvents  events (time of flight, loss, reflectance, code) and the end-to-end summary
+  DataPts    the backscatter trace, uint16 in 0.001 dB; wrapped with np.frombuffer, not copied
+
+Summaries (total loss, max splice loss, back reflection) are computed from the decoded
+events. parse_many() decodes a campaign of files on a process pool, fetching each object
+from S3 in the worker (and storing its trace levels, see otdr_trace).
+"""
+import multiprocessing
+import os
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import otdr_trace, s3
+
+
+OTDR_WORKERS = int(os.getenv("OTDR_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+C_M_PER_S = 299792458.0
+# KeyEvents time of flight is in 0.1 ns; FxdParams data spacing is 100 ps per 10000 points
+EVENT_TIME_S = 1e-10
+SPACING_TIME_S = 1e-10 / 10000
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class SorError(ValueError):
+    pass
+
+
+def get_pool() -> Optional[Executor]:
+    global _pool
+    if OTDR_WORKERS <= 0:
+        return None
+    if _pool is None:
+        # spawn: forking a threaded API/scheduler process is not safe
+        _pool = ProcessPoolExecutor(OTDR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+class _Cursor:
+    def __init__(self, buf: bytes, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+
+    def unpack(self, fmt: str) -> Tuple[Any, ...]:
+        fmt = "<" + fmt
+        try:
+            out = struct.unpack_from(fmt, self.buf, self.pos)
+        except struct.error as e:
+            raise SorError(f"truncated file at byte {self.pos}") from e
+        self.pos += struct.calcsize(fmt)
+        return out
+
+    def one(self, fmt: str) -> Any:
+        return self.unpack(fmt)[0]
+
+    def chars(self, n: int) -> str:
+        s = self.buf[self.pos:self.pos + n]
+        if len(s) < n:
+            raise SorError(f"truncated file at byte {self.pos}")
+        self.pos += n
+        return s.decode("latin-1")
+
+    def cstr(self) -> str:
+        end = self.buf.find(b"\0", self.pos)
+        if end < 0:
+            raise SorError(f"unterminated string at byte {self.pos}")
+        s = self.buf[self.pos:end].decode("latin-1")
+        self.pos = end + 1
+        return s
+
+
+def _read_map(buf: bytes) -> Tuple[int, Dict[str, Tuple[int, int]]]:
+    """Return (format 1|2, {block name: (offset, size)})."""
+    fmt = 2 if buf[:4] == b"Map\0" else 1
+    c = _Cursor(buf, 4 if fmt == 2 else 0)
+    _, map_size, n_blocks = c.unpack("HIH")
+    blocks: Dict[str, Tuple[int, int]] = {}
+    offset = map_size
+    for _ in range(n_blocks - 1):
+        name = c.cstr()
+        _, size = c.unpack("HI")
+        blocks.setdefault(name, (offset, size))
+        offset += size
+    if offset > len(buf):
+        raise SorError(f"map describes {offset} bytes, file has {len(buf)}")
+    return fmt, blocks
+
+
+def _block(buf: bytes, fmt: int, blocks: Dict[str, Tuple[int, int]], name: str, required: bool = True) -> Optional[_Cursor]:
+    if name not in blocks:
+        if required:
+            raise SorError(f"missing {name} block")
+        return None
+    c = _Cursor(buf, blocks[name][0])
+    if fmt == 2 and c.cstr() != name:
+        raise SorError(f"{name} block header does not match the map")
+    return c
+
+
+def _sup_params(c: Optional[_Cursor]) -> Dict[str, Any]:
+    if c is None:
+        return {}
+    return {"supplier": c.cstr().strip(), "otdr": c.cstr().strip(), "otdr_serial": c.cstr().strip()}
+
+
+def _fxd_params(c: _Cursor, fmt: int) -> Dict[str, Any]:
+    ts, units, wavelength, _offset = c.unpack("I2sHi")
+    if fmt == 2:
+        c.unpack("i")  # acquisition offset distance
+    n = c.one("H")
+    pulses = c.unpack(f"{n}H")
+    spacing = c.unpack(f"{n}I")
+    points = c.unpack(f"{n}I")
+    group_index, backscatter, averages = c.unpack("IHI")
+    if not n or not group_index:
+        raise SorError("FxdParams has no pulse width or group index")
+    ior = group_index / 100000.0
+    return {
+        "timestamp": ts,
+        "units": units.decode("latin-1"),
+        "wavelength_nm": wavelength / 10.0,
+        "pulse_width_ns": pulses[0],
+        "points": points[0],
+        "group_index": ior,
+        "backscatter_db": -backscatter / 10.0,
+        "averages": averages,
+        "resolution_m": spacing[0] * SPACING_TIME_S * C_M_PER_S / ior,
+    }
+
+
+def _key_events(c: _Cursor, fmt: int, ior: float) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    to_m = EVENT_TIME_S * C_M_PER_S / ior
+    events = []
+    for _ in range(c.one("H")):
+        no, tof, slope, loss, refl = c.unpack("HIhhi")
+        code = c.chars(6)
+        c.chars(2)  # loss measurement technique
+        if fmt == 2:
+            c.unpack("5I")  # marker locations
+            c.cstr()  # comment
+        events.append(
+            {
+                "event_no": no,
+                "distance_m": round(tof * to_m, 2),
+                "slope_db_km": slope / 1000.0,
+                "loss_db": loss / 1000.0,
+                "reflectance_db": refl / 1000.0 if refl else None,
+                "code": code,
+                "reflective": code[:1] in ("1", "2"),
+                "end": code[1:2] == "E",
+            }
+        )
+    e2e, _start, _end, orl = c.unpack("iiIH")
+    return events, {"end_to_end_loss_db": e2e / 1000.0, "orl_db": orl / 1000.0}
+
+
+def _data_pts(buf: bytes, c: _Cursor) -> Tuple[np.ndarray, float]:
+    n, n_traces = c.unpack("IH")
+    if not n_traces:
+        return np.zeros(0, dtype="<u2"), 1.0
+    count, scale = c.unpack("IH")
+    c.pos += 6 * (n_traces - 1)  # scale factors of further traces
+    count = min(count, n)
+    if c.pos + 2 * count > len(buf):
+        raise SorError("DataPts block is shorter than its point count")
+    return np.frombuffer(buf, dtype="<u2", count=count, offset=c.pos), scale / 1000.0
+
+
+def parse_sor(data: bytes) -> Dict[str, Any]:
+    """Decode a .sor file. `points` is a read-only uint16 view into `data` (see trace_db)."""
+    buf = bytes(data)
+    fmt, blocks = _read_map(buf)
+    sup = _sup_params(_block(buf, fmt, blocks, "SupParams", required=False))
+    fxd = _fxd_params(_block(buf, fmt, blocks, "FxdParams"), fmt)
+    events, e2e = _key_events(_block(buf, fmt, blocks, "KeyEvents"), fmt, fxd["group_index"])
+    dp = _block(buf, fmt, blocks, "DataPts", required=False)
+    points, scale = _data_pts(buf, dp) if dp is not None else (np.zeros(0, dtype="<u2"), 1.0)
+    return {"format": fmt, "vendor": sup.get("supplier") or None, **sup, **fxd, **e2e, "events": events, "points": points, "scale": scale}
+
+
+def trace_db(parsed: Dict[str, Any]) -> np.ndarray:
+    """Backscatter level in dB (0 at the top, falling with distance), one value per resolution_m."""
+    return parsed["points"].astype(np.float32) * np.float32(-0.001 * parsed["scale"])
+
+
+def summarize(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Acceptance numbers from the decoded events.
+
+    Total loss is the file's end-to-end loss, falling back to the sum of event losses plus
+    fibre attenuation when the instrument left it empty. Splices are the non-reflective events
+    before the end of fibre; back reflection is the worst (highest) reflectance.
+    """
+    events = parsed["events"]
+    end = next((e for e in events if e["end"]), events[-1] if events else None)
+    length = end["distance_m"] if end else None
+    splices = [e["loss_db"] for e in events if not e["reflective"] and not e["end"]]
+    reflections = [e["reflectance_db"] for e in events if e["reflective"] and e["reflectance_db"] is not None]
+    total = parsed["end_to_end_loss_db"]
+    if total <= 0 and events:
+        prev = 0.0
+        total = 0.0
+        for e in events:
+            total += e["slope_db_km"] * (e["distance_m"] - prev) / 1000.0 + (0.0 if e["end"] else e["loss_db"])
+            prev = e["distance_m"]
+    return {
+        "vendor": parsed["vendor"],
+        "wavelength_nm": int(round(parsed["wavelength_nm"])),
+        "pulse_width_ns": parsed["pulse_width_ns"],
+        "total_loss_db": round(max(0.0, total), 2),
+        "event_count": len(events),
+        "max_splice_loss_db": round(max(splices), 3) if splices else 0.0,
+        "back_reflection_db": round(max(reflections), 2) if reflections else None,
+        "orl_db": round(parsed["orl_db"], 2) if parsed["orl_db"] else None,
+        "fiber_length_m": length,
+        "resolution_m": parsed["resolution_m"],
+        "events": events,
+    }
+
+
+def key_from_url(url: str) -> str:
+    """Object key of a URL returned by s3.put_bytes (or a bare key)."""
+    marker = f"/{s3.settings.S3_BUCKET}/"
+    return url.split(marker, 1)[1] if marker in url else url.lstrip("/")
+
+
+def parse_object(key: str, store_trace: bool = False) -> Dict[str, Any]:
+    """Fetch and summarize one trace; errors are returned rather than raised (used on the pool).
+
+    With `store_trace` the samples are also written to S3 as preview levels and the
+    otdr_trace metadata is returned under "trace".
+    """
+    try:
+        parsed = parse_sor(s3.get_object_bytes(key))
+        out = {"s3_key": key, **summarize(parsed)}
+        if store_trace and len(parsed["points"]):
+            out["trace"] = otdr_trace.store(parsed["points"], parsed["resolution_m"], parsed["scale"])
+        return out
+    except Exception as e:  # noqa: BLE001
+        return {"s3_key": key, "error": str(e) or type(e).__name__}
+
+
+def parse_many(keys: Iterable[str], pool: Optional[Executor] = None, store_trace: bool = False) -> List[Dict[str, Any]]:
+    """Fetch and summarize a campaign of traces in input order."""
+    keys = list(keys)
+    pool = pool if pool is not None else get_pool()
+    if pool is None or len(keys) < 2:
+        return [parse_object(k, store_trace) for k in keys]
+    fn = partial(parse_object, store_trace=store_trace)
+    return list(pool.map(fn, keys, chunksize=max(1, len(keys) // (4 * OTDR_WORKERS))))
+
+
+def build_sor(
+    events: List[Dict[str, Any]],
+    points: np.ndarray,
+    *,
+    wavelength_nm: float = 1550.0,
+    pulse_width_ns: int = 100,
+    resolution_m: float = 0.5,
+    group_index: float = 1.468,
+    end_to_end_loss_db: float = 0.0,
+    orl_db: float = 0.0,
+    supplier: str = "",
+    scale: float = 1.0,
+) -> bytes:
+    """Write a minimal issue-2 .sor (SupParams, FxdParams, KeyEvents, DataPts) for fixtures and benchmarks.
+
+    `events` take distance_m, loss_db, reflectance_db and code; `points` are raw uint16 samples.
+    """
+    to_tof = C_M_PER_S * EVENT_TIME_S / group_index
+    spacing = int(round(resolution_m / (SPACING_TIME_S * C_M_PER_S / group_index)))
+    pts = np.asarray(points, dtype="<u2")
+
+    sup = b"SupParams\0" + supplier.encode("latin-1") + b"\0OTDR\0SN\0"
+    fxd = b"FxdParams\0" + struct.pack(
+        "<I2sHiiH", 0, b"mt", int(round(wavelength_nm * 10)), 0, 0, 1
+    ) + struct.pack("<HII", pulse_width_ns, spacing, len(pts)) + struct.pack(
+        "<IHIHIiiHhHHHH2s4i", int(round(group_index * 100000)), 800, 1000, 10, 0, 0, 0, 0, 0, 0, 0, 0, 0, b"ST", 0, 0, 0, 0
+    )
+    ke = b"KeyEvents\0" + struct.pack("<H", len(events))
+    for i, e in enumerate(events, 1):
+        ke += struct.pack(
+            "<HIhhi", i, int(round(e["distance_m"] / to_tof)), int(round(e.get("slope_db_km", 0.0) * 1000)),
+            int(round(e.get("loss_db", 0.0) * 1000)), int(round((e.get("reflectance_db") or 0.0) * 1000)),
+        )
+        ke += e.get("code", "0F9999").encode("latin-1")[:6].ljust(6, b"9") + b"LS" + struct.pack("<5I", 0, 0, 0, 0, 0) + b"\0"
+    ke += struct.pack("<iiIHiI", int(round(end_to_end_loss_db * 1000)), 0, 0, int(round(orl_db * 1000)), 0, 0)
+    dp = b"DataPts\0" + struct.pack("<IHIH", len(pts), 1, len(pts), int(round(scale * 1000))) + pts.tobytes()
+
+    body = [("SupParams", sup), ("FxdParams", fxd), ("KeyEvents", ke), ("DataPts", dp)]
+    entries = b"".join(name.encode() + b"\0" + struct.pack("<HI", 200, len(blob)) for name, blob in body)
+    map_size = 4 + 8 + len(entries)
+    head = b"Map\0" + struct.pack("<HIH", 200, map_size, len(body) + 1) + entries
+    return head + b"".join(blob for _, blob in body)
@@ -0,0 +1,103 @@
+"""Benchmark incident clustering at 100k points.
+
+Always times the numpy binning used by MAP_CLUSTER_BACKEND=python and compares the JSON size
+of the raw points with the clustered layer. With --dsn (or DATABASE_URL) it also loads the
+points into a temporary PostGIS table and times the ST_SnapToGrid path the API runs:
+
+    python scripts/bench_clustering.py --points 100000 --zoom 11
+    python scripts/bench_clustering.py --dsn postgresql+psycopg://... --zoom 11
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+from app.services.map_cluster import INCIDENT_SEVERITIES, _features, cell_size, cluster_points  # noqa: E402
+
+# Greater Johannesburg
+BBOX = (27.7, -26.45, 28.35, -25.9)
+
+
+def synth(n: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # Storm-like: most incidents around a few hotspots, the rest spread over the metro
+    hot = rng.uniform(BBOX[:2], BBOX[2:], size=(20, 2))
+    k = int(n * 0.7)
+    centres = hot[rng.integers(0, len(hot), k)]
+    pts = np.vstack([centres + rng.normal(0, 0.01, (k, 2)), rng.uniform(BBOX[:2], BBOX[2:], size=(n - k, 2))])
+    cats = rng.choice(len(INCIDENT_SEVERITIES), n, p=[0.1, 0.2, 0.5, 0.2])
+    return pts[:, 0], pts[:, 1], cats
+
+
+def bench_numpy(lon, lat, cats, cell, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        c = cluster_points(lon, lat, cats, cell, len(INCIDENT_SEVERITIES))
+        feats = _features(c["x"], c["y"], c["count"], c["breakdown"], [str(i) for i in c["first"]], INCIDENT_SEVERITIES)
+        best = min(best, time.perf_counter() - t)
+    return best, feats
+
+
+def bench_postgis(dsn, lon, lat, cats, cell, repeat):
+    from sqlalchemy import create_engine, text
+
+    from app.services import map_cluster
+
+    engine = create_engine(dsn)
+    with engine.begin() as conn:
+        conn.execute(text("create temporary table bench_incidents (id uuid, severity text, geom geometry(Point, 4326))"))
+        rows = [{"id": str(uuid4()), "s": INCIDENT_SEVERITIES[c], "x": float(x), "y": float(y)} for x, y, c in zip(lon, lat, cats)]
+        conn.execute(text("insert into bench_incidents values (cast(:id as uuid), :s, ST_SetSRID(ST_MakePoint(:x, :y), 4326))"), rows)
+        conn.execute(text("create index on bench_incidents using gist (geom)"))
+        conn.execute(text("analyze bench_incidents"))
+        best = float("inf")
+        feats = []
+        map_cluster.CLUSTER_BACKEND = "postgis"
+        for _ in range(repeat):
+            t = time.perf_counter()
+            feats = map_cluster.cluster_features(conn, "select id, geom, severity as cat from bench_incidents", {}, INCIDENT_SEVERITIES, cell)
+            best = min(best, time.perf_counter() - t)
+    return best, feats
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--points", type=int, default=100000)
+    ap.add_argument("--zoom", type=float, default=11)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    args = ap.parse_args()
+
+    lon, lat, cats = synth(args.points, args.seed)
+    cell = cell_size(args.zoom)
+    raw = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": str(i), "properties": {"severity": INCIDENT_SEVERITIES[c]}, "geometry": {"type": "Point", "coordinates": [round(x, 6), round(y, 6)]}}
+            for i, (x, y, c) in enumerate(zip(lon.tolist(), lat.tolist(), cats.tolist()))
+        ],
+    }
+    raw_bytes = len(json.dumps(raw))
+
+    t_np, feats = bench_numpy(lon, lat, cats, cell, args.repeat)
+    clustered_bytes = len(json.dumps({"type": "FeatureCollection", "features": feats}))
+    print(f"points={args.points} zoom={args.zoom} cell={cell:.5f} deg")
+    print(f"raw GeoJSON:       {raw_bytes / 1e6:8.2f} MB")
+    print(f"clustered GeoJSON: {clustered_bytes / 1e3:8.1f} kB  ({len(feats)} features)")
+    print(f"numpy:   {t_np * 1000:8.1f} ms")
+    if args.dsn:
+        t_pg, pg_feats = bench_postgis(args.dsn, lon, lat, cats, cell, args.repeat)
+        print(f"postgis: {t_pg * 1000:8.1f} ms  ({len(pg_feats)} features)")
+
+
+if __name__ == "__main__":
+    main()
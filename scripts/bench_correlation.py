@@ -0,0 +1,171 @@
+"""Replay an alert storm through topology correlation.
+
+A storm file is JSON lines, one webhook payload per line as LibreNMS/Zabbix posted it, with
+optional `_ts` (seconds since the first alert) and `_source` ("librenms" default, "zabbix").
+Record one from the webhook access log, or synthesize one from device names:
+
+    python scripts/bench_correlation.py synth --hosts hosts.txt --alerts 5000 > storm.jsonl
+
+Replay against a live API through the batch endpoints, grouping alerts that arrive within
+--batch-ms into one request (--speed 0 replays as fast as possible):
+
+    python scripts/bench_correlation.py replay storm.jsonl --speed 0 --batch-ms 1000
+
+Or time the in-memory correlation planner alone on a synthetic OLT/splitter tree:
+
+    python scripts/bench_correlation.py offline --onts 20000 --storm 5000
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _post(url: str, body: bytes) -> dict:
+    headers = {"Content-Type": "application/json"}
+    secret = os.getenv("NMS_HMAC_SECRET")
+    if secret:
+        headers["X-Signature"] = hmac.new(secret.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            return {"status": resp.status, "body": json.loads(resp.read() or b"null")}
+    except urllib.error.HTTPError as e:
+        return {"status": e.code, "body": None}
+
+
+def synth(args) -> None:
+    hosts = [h.strip() for h in open(args.hosts) if h.strip()]
+    random.seed(args.seed)
+    # Affected hosts are one contiguous run of the list, like the ONTs behind a failed port
+    start = random.randrange(max(1, len(hosts) - args.alerts))
+    run = uuid4().hex[:8]
+    for i, host in enumerate(hosts[start : start + args.alerts]):
+        ts = round(random.expovariate(1.0) * args.spread / 3, 3)
+        print(json.dumps({"_ts": min(ts, args.spread), "hostname": host, "severity": "critical", "rule": "Device Down", "alert_id": f"storm-{run}-{i}", "state": "alert"}))
+
+
+def replay(args) -> None:
+    events = [json.loads(line) for line in open(args.file) if line.strip()]
+    events.sort(key=lambda e: e.get("_ts", 0))
+    batches = []
+    for e in events:
+        source = e.pop("_source", "librenms")
+        ts = e.pop("_ts", 0)
+        if batches and batches[-1][1] == source and ts - batches[-1][0] < args.batch_ms / 1000.0:
+            batches[-1][2].append(e)
+        else:
+            batches.append((ts, source, [e]))
+
+    results = []
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    futures = []
+    start = time.perf_counter()
+    for ts, source, items in batches:
+        if args.speed > 0:
+            delay = ts / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        futures.append(pool.submit(_post, f"{args.api}/webhooks/{source}/batch", json.dumps(items).encode()))
+    for f in futures:
+        results.append(f.result())
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    rows = [r for res in results if isinstance(res["body"], list) for r in res["body"]]
+    parents = {r["parent_incident_id"] for r in rows if r.get("parent_incident_id")}
+    linked = sum(1 for r in rows if r.get("parent_incident_id"))
+    standalone = sum(1 for r in rows if r.get("incident_id") and not r.get("parent_incident_id") and not r.get("dedup"))
+    failed = sum(1 for res in results if res["status"] >= 400)
+    print(f"alerts={len(events)} requests={len(batches)} failed_requests={failed} elapsed={elapsed:.2f}s")
+    print(f"throughput: {len(events) / elapsed:10.1f} alerts/s  ({len(events) / elapsed * 60:.0f}/min)")
+    print(f"parents={len(parents)} linked_children={linked} standalone_incidents={standalone}")
+
+
+def offline(args) -> None:
+    # Planner only: no database needed
+    os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+    from app.services.correlation import Topology, plan
+
+    random.seed(args.seed)
+    topo = Topology()
+    onts = []
+    per_port = args.split * args.splitters
+    for o in range(max(1, args.onts // (per_port * args.ports))):
+        olt = ("olt", uuid4())
+        for p in range(args.ports):
+            port = ("olt_port", olt[1], f"0/{p}")
+            feeder = ("cable", f"FDR-{o}-{p}")
+            for _ in range(args.splitters):
+                spl = ("splitter", uuid4())
+                for _ in range(args.split):
+                    d = uuid4()
+                    topo.add(d, [olt, port, feeder, spl], None, {})
+                    onts.append(d)
+
+    # Storm: whole ports fail, plus background noise on random ONTs
+    failing = []
+    ports = sorted({topo.paths[d][1] for d in onts}, key=str)
+    for port in random.sample(ports, min(len(ports), max(1, args.storm // per_port))):
+        failing.extend(topo.members[port])
+    failing = failing[: args.storm]
+    failing.extend(random.sample(onts, min(len(onts), args.storm // 20)))
+
+    recent = []
+    open_parents = {}
+    t0 = time.perf_counter()
+    linked = 0
+    for i in range(0, len(failing), args.batch):
+        chunk = failing[i : i + args.batch]
+        p = plan(topo, list(enumerate(chunk)), recent, open_parents)
+        for el in p.new_parents:
+            open_parents[el] = uuid4()
+        linked += len(p.assign) + len(p.relink)
+        recent.extend((uuid4(), d, open_parents.get(p.assign.get(k))) for k, d in enumerate(chunk))
+    elapsed = time.perf_counter() - t0
+    print(f"onts={len(onts)} elements={len(topo.size)} storm_alerts={len(failing)} batch={args.batch}")
+    print(f"planner: {len(failing) / elapsed:10.1f} alerts/s  ({elapsed:.3f}s)")
+    print(f"parents={len(open_parents)} linked={linked}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("synth")
+    s.add_argument("--hosts", required=True, help="file with one ONT device name per line")
+    s.add_argument("--alerts", type=int, default=2000)
+    s.add_argument("--spread", type=float, default=60.0, help="seconds the storm is spread over")
+    s.add_argument("--seed", type=int, default=1)
+
+    r = sub.add_parser("replay")
+    r.add_argument("file")
+    r.add_argument("--api", default=os.getenv("API", "http://127.0.0.1:8000"))
+    r.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 0 = no delays")
+    r.add_argument("--batch-ms", type=int, default=1000)
+    r.add_argument("--concurrency", type=int, default=4)
+
+    o = sub.add_parser("offline")
+    o.add_argument("--onts", type=int, default=20000)
+    o.add_argument("--ports", type=int, default=16)
+    o.add_argument("--splitters", type=int, default=4)
+    o.add_argument("--split", type=int, default=32)
+    o.add_argument("--storm", type=int, default=5000)
+    o.add_argument("--batch", type=int, default=500)
+    o.add_argument("--seed", type=int, default=1)
+
+    args = ap.parse_args()
+    {"synth": synth, "replay": replay, "offline": offline}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark the streaming GeoJSON import against json.loads on a large pole file.
+
+Writes a synthetic FeatureCollection (default 500k points), then runs each mode in a fresh
+subprocess so peak RSS is measured per mode:
+
+  stream  incremental parser + COPY row encoding (what /imports/geojson runs)
+  json    json.loads of the whole document + the same row encoding (the old import)
+
+With --dsn (or DATABASE_URL) and --pon-id the stream mode also runs load_features() against
+the database inside a transaction that is rolled back unless --commit is given:
+
+    python scripts/bench_geojson_import.py --features 500000
+    python scripts/bench_geojson_import.py --dsn postgresql+psycopg://... --pon-id <uuid>
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+from app.services.geojson_import import encode_feature, iter_features  # noqa: E402
+
+
+def write_file(path: str, n: int) -> int:
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "name": "poles", "features": [\n')
+        for i in range(n):
+            feat = {
+                "type": "Feature",
+                "properties": {"code": f"POLE-{i:07d}", "height_m": 9, "owner": "bench"},
+                "geometry": {"type": "Point", "coordinates": [round(27.7 + (i % 1000) * 6.5e-4, 7), round(-26.45 + (i // 1000) * 1.1e-3, 7)]},
+            }
+            f.write(("," if i else "") + json.dumps(feat) + "\n")
+        f.write("]}\n")
+    return os.path.getsize(path)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, path: str, dsn: str, pon_id: str, commit: bool) -> None:
+    t = time.perf_counter()
+    if mode == "json":
+        with open(path, "rb") as f:
+            features = json.loads(f.read())["features"]
+        n = sum(1 for i, f in enumerate(features) if encode_feature("poles", i, f)[0])
+    elif dsn:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+
+        from app.services.geojson_import import load_features
+
+        with Session(create_engine(dsn)) as db, open(path, "rb") as f:
+            n = load_features(db, "poles", iter_features(f), pon_id)["loaded"]
+            if commit:
+                db.commit()
+            else:
+                db.rollback()
+    else:
+        with open(path, "rb") as f:
+            n = sum(1 for i, feat in enumerate(iter_features(f)) if encode_feature("poles", i, feat)[0])
+    dt = time.perf_counter() - t
+    print(json.dumps({"mode": mode, "features": n, "seconds": dt, "rss_mb": peak_rss_mb()}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--features", type=int, default=500000)
+    ap.add_argument("--file", help="existing GeoJSON file to use instead of a synthetic one")
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--pon-id")
+    ap.add_argument("--commit", action="store_true")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.file, args.dsn if args.pon_id else None, args.pon_id, args.commit)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, "poles.geojson")
+            size = write_file(path, args.features)
+        else:
+            size = os.path.getsize(path)
+        print(f"file: {size / 1e6:.1f} MB")
+        for mode in ("stream", "json"):
+            cmd = [sys.executable, __file__, "--child", mode, "--file", path]
+            if args.dsn and args.pon_id and mode == "stream":
+                cmd += ["--dsn", args.dsn, "--pon-id", args.pon_id] + (["--commit"] if args.commit else [])
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:6s} {r['features'] / r['seconds']:10.0f} features/s  {r['seconds']:6.2f} s  peak RSS {r['rss_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark the import pipeline on a synthetic 1M-pole layer.
+
+Writes a FeatureCollection (default 1M points over greater Johannesburg, 0.5% of them in
+projected metres so they are rejected), then for each worker count runs parse ->
+validate/encode in a fresh subprocess and reports features/s and peak RSS. With --dsn (or
+DATABASE_URL) and --pon-id the last run also COPYs into PostGIS and runs the validate/enrich/
+load step, rolled back unless --commit:
+
+    python scripts/bench_import_pipeline.py --features 1000000 --workers 0 1 3
+    python scripts/bench_import_pipeline.py --dsn postgresql+psycopg://... --pon-id <uuid>
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+
+def write_file(path: str, n: int, seed: int) -> int:
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "name": "poles", "features": [\n')
+        for i in range(n):
+            if rng.random() < 0.005:
+                xy = [rng.uniform(-100000, 100000), rng.uniform(2.8e6, 3.0e6)]
+            else:
+                xy = [round(rng.uniform(27.7, 28.35), 7), round(rng.uniform(-26.45, -25.9), 7)]
+            feat = {"type": "Feature", "properties": {"code": f"POLE-{i:07d}", "height_m": 9}, "geometry": {"type": "Point", "coordinates": xy}}
+            f.write(("," if i else "") + json.dumps(feat) + "\n")
+        f.write("]}\n")
+    return os.path.getsize(path)
+
+
+def child(path: str, workers: int, dsn: str, pon_id: str, commit: bool) -> None:
+    os.environ["IMPORT_WORKERS"] = str(workers)
+    from app.services import import_pipeline
+    from app.services.geojson_import import iter_features
+
+    t = time.perf_counter()
+    out = {"workers": workers}
+    with open(path, "rb") as f:
+        if dsn:
+            from sqlalchemy import create_engine
+            from sqlalchemy.orm import Session
+
+            with Session(create_engine(dsn)) as db:
+                r = import_pipeline.load_stream(db, "poles", f, pon_id)
+                out.update(features=r["staged"], loaded=r["loaded"], rejected=len(r["rejected"]), repaired=r["repaired"])
+                if commit:
+                    db.commit()
+                else:
+                    db.rollback()
+        else:
+            pool = import_pipeline.get_pool()
+            chunks = import_pipeline.chunked(iter_features(f, raw=pool is not None), import_pipeline.ENCODE_CHUNK)
+            n = rejected = 0
+            for items, (_, rejects) in import_pipeline.encoded_chunks("poles", chunks, pool):
+                n += len(items)
+                rejected += len(rejects)
+            out.update(features=n, rejected=rejected)
+            if pool is not None:
+                pool.shutdown()
+    out["seconds"] = time.perf_counter() - t
+    # Children of the pool count separately; this is the parent's peak (ru_maxrss is kB on Linux)
+    out["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    out["children_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps(out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--features", type=int, default=1000000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[0, max(1, (os.cpu_count() or 2) - 1)])
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--pon-id")
+    ap.add_argument("--commit", action="store_true")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.workers[0], args.dsn if args.pon_id else None, args.pon_id, args.commit)
+        return
+
+    print(f"cpus: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "poles.geojson")
+        size = write_file(path, args.features, args.seed)
+        print(f"file: {args.features} features, {size / 1e6:.1f} MB")
+        for i, w in enumerate(args.workers):
+            cmd = [sys.executable, __file__, "--child", path, "--workers", str(w)]
+            if args.dsn and args.pon_id and i == len(args.workers) - 1:
+                cmd += ["--dsn", args.dsn, "--pon-id", args.pon_id] + (["--commit"] if args.commit else [])
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+            extra = f"  loaded {r['loaded']}  repaired {r['repaired']}" if "loaded" in r else ""
+            print(
+                f"workers={w:<2d} {r['features'] / r['seconds']:9.0f} features/s  {r['seconds']:6.2f} s  "
+                f"rejected {r['rejected']}  peak RSS {r['rss_mb']:6.1f} MB (worker {r['children_rss_mb']:6.1f} MB){extra}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark the PON loss budget on a synthetic topology.
+
+Builds an OLT -> closures -> splitters -> drops tree (default 64 closures x 1:64 = 4096
+drops) and times compute(). With --dsn (or DATABASE_URL) and --pon-id it also times
+build() against a real PON (the queries plus the walk, no cache):
+
+    python scripts/bench_loss_budget.py --closures 64 --split 64
+    python scripts/bench_loss_budget.py --dsn postgresql+psycopg://... --pon-id <uuid>
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+from app.services.loss_budget import build, compute  # noqa: E402
+
+
+def synthetic(closures: int, split: int, seed: int):
+    rng = random.Random(seed)
+    nodes = [("olt", "OLT", "OLT-1")]
+    edges = []
+    measured = {}
+    for c in range(closures):
+        nodes += [(f"c{c}", "closure", f"CL-{c}"), (f"s{c}", "splitter", f"S-{c}")]
+        edges += [("olt" if c < 4 else f"c{c // 4 - 1}", f"c{c}", f"FDR-{c}", rng.uniform(200, 1500)), (f"c{c}", f"s{c}", None, 3.0)]
+        measured[f"CL-{c}"] = (rng.randint(0, 48), rng.uniform(0.02, 0.1), rng.uniform(0.1, 0.3))
+        for d in range(split):
+            nodes.append((f"d{c}-{d}", "drop", f"D-{c}-{d}"))
+            edges.append((f"s{c}", f"d{c}-{d}", f"DRP-{c}-{d}", rng.uniform(20, 250)))
+    return nodes, edges, measured, {f"S-{c}": f"1:{split}" for c in range(closures)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--closures", type=int, default=64)
+    ap.add_argument("--split", type=int, default=64)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--pon-id")
+    args = ap.parse_args()
+
+    nodes, edges, closures, splitters = synthetic(args.closures, args.split, args.seed)
+    best = float("inf")
+    for _ in range(args.repeat):
+        t = time.perf_counter()
+        paths = compute(nodes, edges, closures, splitters, {}, 1310)
+        best = min(best, time.perf_counter() - t)
+    print(f"compute: {len(nodes)} nodes, {len(paths)} paths in {best * 1000:.1f} ms (best of {args.repeat})")
+
+    if args.dsn and args.pon_id:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+
+        with Session(create_engine(args.dsn)) as db:
+            t = time.perf_counter()
+            out = build(db, args.pon_id)
+            print(f"build:   {len(out['paths'])} paths in {(time.perf_counter() - t) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark near-duplicate photo search over perceptual hashes.
+
+Generates --photos random 64-bit hashes (plus a few near copies of the query) and compares
+a numpy brute-force Hamming scan with multi-index hashing: sorted 16-bit chunk columns
+probed with photo_hash.probes(), as the indexed photos.phash_h0..h3 columns are in
+Postgres. With --dsn (or DATABASE_URL) and --photo-id it also times the /photos/{id}/similar
+query against a real database:
+
+    python scripts/bench_photo_hash.py --photos 2000000
+    python scripts/bench_photo_hash.py --dsn postgresql+psycopg://... --photo-id <uuid>
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+from app.services import photo_hash  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--photos", type=int, default=1_000_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--max-distance", type=int, default=photo_hash.PHASH_MAX_DISTANCE)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--photo-id")
+    args = ap.parse_args()
+    k = args.max_distance
+
+    rng = np.random.default_rng(args.seed)
+    hashes = rng.integers(0, 2**64, size=args.photos, dtype=np.uint64)
+    queries = hashes[rng.choice(args.photos, args.queries, replace=False)].copy()
+    # Near copies: flip up to k bits of every query hash
+    flips = [np.uint64(sum(1 << int(b) for b in rng.choice(64, rng.integers(0, k + 1), replace=False))) for _ in queries]
+    hashes[: args.queries] = queries ^ np.array(flips, dtype=np.uint64)
+
+    t = time.perf_counter()
+    brute = [np.flatnonzero(np.bitwise_count(hashes ^ q) <= k) for q in queries]
+    dt_brute = (time.perf_counter() - t) / args.queries
+
+    t = time.perf_counter()
+    cols = []
+    for j in range(photo_hash.CHUNKS):
+        chunk = ((hashes >> np.uint64(16 * (photo_hash.CHUNKS - 1 - j))) & np.uint64(0xFFFF)).astype(np.uint16)
+        order = np.argsort(chunk, kind="stable")
+        cols.append((chunk[order], order))
+    build = time.perf_counter() - t
+
+    t = time.perf_counter()
+    mih = []
+    for q in queries:
+        p = photo_hash.probes([("q", int(q))], k)
+        js, cs = np.array(p["js"]), np.array(p["cs"], dtype=np.uint16)
+        cand = []
+        for j, (values, order) in enumerate(cols):
+            c = cs[js == j]
+            for lo, hi in zip(np.searchsorted(values, c, "left"), np.searchsorted(values, c, "right")):
+                cand.append(order[lo:hi])
+        cand = np.unique(np.concatenate(cand))
+        mih.append(cand[np.bitwise_count(hashes[cand] ^ q) <= k])
+    dt_mih = (time.perf_counter() - t) / args.queries
+
+    assert all(np.array_equal(a, b) for a, b in zip(brute, mih))
+    print(f"{args.photos} hashes, k={k}, {len(photo_hash.probes([('q', 0)], k)['cs'])} probes per query")
+    print(f"brute force: {dt_brute * 1000:8.2f} ms/query")
+    print(f"multi-index: {dt_mih * 1000:8.2f} ms/query (index build {build:.1f} s), same matches")
+
+    if args.dsn and args.photo_id:
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import Session
+
+        with Session(create_engine(args.dsn)) as db:
+            h = db.execute(text("select phash from photos where id = cast(:id as uuid)"), {"id": args.photo_id}).scalar()
+            t = time.perf_counter()
+            rows = photo_hash.similar(db, args.photo_id, h, k)
+            print(f"similar():   {(time.perf_counter() - t) * 1000:8.2f} ms, {len(rows)} matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark photo EXIF reads for /photos/register and /photos/register/bulk.
+
+Serves synthetic camera-sized JPEGs (EXIF with time and GPS, noisy pixels) from an
+in-memory S3 stand-in that sleeps --latency-ms per request plus the transfer time at
+--mbps, and compares:
+
+  full      the old path: GET the whole object, parse_exif()
+  ranged    read_exif(): Range GET of the head, one pass over the IFDs
+  bulk      fetch_many(): head_object + read_exif on the EXIF_THREADS pool
+
+    python scripts/bench_photo_register.py --photos 200 --latency-ms 20 --mbps 200
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+from PIL import Image  # noqa: E402
+
+from app.services import exif  # noqa: E402
+
+
+def photo(width: int, height: int) -> bytes:
+    ex = Image.Exif()
+    ex[exif.TAG_EXIF_IFD] = {exif.TAG_DATETIME_ORIGINAL: "2024:05:06 07:08:09"}
+    ex[exif.TAG_GPS_IFD] = {1: "S", 2: (26.0, 12.0, 30.6), 3: "E", 4: (28.0, 2.0, 45.0)}
+    bio = io.BytesIO()
+    Image.effect_noise((width, height), 48).convert("RGB").save(bio, "JPEG", exif=ex.tobytes(), quality=90)
+    return bio.getvalue()
+
+
+class FakeS3:
+    def __init__(self, data: bytes, latency_s: float, bytes_per_s: float):
+        self.data = data
+        self.latency_s = latency_s
+        self.bytes_per_s = bytes_per_s
+        self.settings = SimpleNamespace(ALLOWED_CONTENT_TYPES=("image/jpeg",), FILE_MAX_BYTES=len(data) + 1)
+        self.read = 0
+
+    def _wait(self, n: int):
+        self.read += n
+        time.sleep(self.latency_s + n / self.bytes_per_s)
+
+    def head_object(self, key):
+        self._wait(0)
+        return {"ContentType": "image/jpeg", "ContentLength": len(self.data)}
+
+    def get_object_range(self, key, start, end):
+        chunk = self.data[start : end + 1]
+        self._wait(len(chunk))
+        return chunk
+
+    def get_object_bytes(self, key):
+        self._wait(len(self.data))
+        return self.data
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--photos", type=int, default=200)
+    ap.add_argument("--width", type=int, default=2000)
+    ap.add_argument("--height", type=int, default=1500)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--mbps", type=float, default=200.0, help="link speed in Mbit/s")
+    ap.add_argument("--threads", type=int, default=exif.EXIF_THREADS)
+    args = ap.parse_args()
+
+    data = photo(args.width, args.height)
+    fake = FakeS3(data, args.latency_ms / 1000.0, args.mbps * 1e6 / 8)
+    exif.s3 = fake
+    keys = [f"p{i}.jpg" for i in range(args.photos)]
+    print(f"{args.photos} photos of {len(data) / 1e6:.2f} MB, {args.latency_ms:.0f} ms latency, {args.mbps:.0f} Mbit/s")
+
+    def run(name, fn):
+        fake.read = 0
+        t = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t
+        assert all(o["gps_lat"] == -26.2085 for o in out), name
+        print(f"{name:<8} {args.photos / dt:8.1f} photos/s  {fake.read / args.photos / 1024:8.1f} KB/photo")
+
+    run("full", lambda: [exif.parse_exif(fake.get_object_bytes(k)) for k in keys])
+    run("ranged", lambda: [exif.read_exif(k, len(data)) for k in keys])
+    with ThreadPoolExecutor(args.threads) as pool:
+        run("bulk", lambda: exif.fetch_many(keys, pool))
+
+
+if __name__ == "__main__":
+    main()
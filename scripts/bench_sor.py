@@ -0,0 +1,120 @@
+"""Benchmark the .sor parser on a corpus of OTDR traces.
+
+Uses the .sor files under --dir, or writes a synthetic campaign (default 2000 traces of
+32k points, 5-40 events each). Each mode runs in a fresh subprocess:
+
+  struct   the data points unpacked into a Python list with struct (naive decoder)
+  numpy    parse_sor + summarize in-process (np.frombuffer on the data points)
+  pool     parse_sor + summarize on a spawn process pool of --workers (what /sor/bulk runs)
+
+    python scripts/bench_sor.py --traces 2000
+    python scripts/bench_sor.py --dir /data/campaign-12 --workers 3
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import random
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+import numpy as np  # noqa: E402
+
+from app.services import sor  # noqa: E402
+
+
+def write_corpus(path: str, n: int, points: int, seed: int) -> int:
+    rng = random.Random(seed)
+    size = 0
+    for i in range(n):
+        length = rng.uniform(2000, 20000)
+        events = [{"distance_m": 0.0, "loss_db": 0.4, "reflectance_db": -48.0, "code": "1F9999"}]
+        for d in sorted(rng.uniform(50, length - 50) for _ in range(rng.randint(4, 39))):
+            refl = rng.random() < 0.2
+            events.append(
+                {
+                    "distance_m": d, "loss_db": rng.uniform(0.01, 0.6), "slope_db_km": 0.21,
+                    "reflectance_db": rng.uniform(-65, -35) if refl else None, "code": "1F9999" if refl else "0F9999",
+                }
+            )
+        events.append({"distance_m": length, "reflectance_db": -14.0, "code": "2E9999", "slope_db_km": 0.21})
+        trace = np.cumsum(np.full(points, 0.1)) + np.random.default_rng(seed + i).normal(0, 20, points)
+        data = sor.build_sor(events, np.clip(trace, 0, 65535).astype(np.uint16), supplier="bench")
+        with open(os.path.join(path, f"trace-{i:05d}.sor"), "wb") as f:
+            f.write(data)
+        size += len(data)
+    return size
+
+
+def parse_file(path: str) -> int:
+    with open(path, "rb") as f:
+        return sor.summarize(sor.parse_sor(f.read()))["event_count"]
+
+
+def parse_file_struct(path: str) -> int:
+    with open(path, "rb") as f:
+        data = f.read()
+    p = sor.parse_sor(data)
+    off = len(data) - 2 * len(p["points"])
+    pts = list(struct.unpack_from(f"<{len(p['points'])}H", data, off))
+    db = [v * -0.001 * p["scale"] for v in pts]
+    return len(db) and sor.summarize(p)["event_count"]
+
+
+def child(mode: str, files: list, workers: int) -> None:
+    t = time.perf_counter()
+    if mode == "pool":
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            events = sum(pool.map(parse_file, files, chunksize=max(1, len(files) // (4 * workers))))
+    else:
+        fn = parse_file if mode == "numpy" else parse_file_struct
+        events = sum(fn(p) for p in files)
+    out = {"mode": mode, "files": len(files), "events": events, "seconds": time.perf_counter() - t}
+    # ru_maxrss is kB on Linux
+    out["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", help="directory of .sor files to use instead of a synthetic corpus")
+    ap.add_argument("--traces", type=int, default=2000)
+    ap.add_argument("--points", type=int, default=32000)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, sorted(glob.glob(os.path.join(args.dir, "*.sor"))), args.workers)
+        return
+
+    print(f"cpus: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.dir
+        if not path:
+            path = tmp
+            size = write_corpus(path, args.traces, args.points, args.seed)
+        else:
+            size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, "*.sor")))
+        print(f"corpus: {size / 1e6:.1f} MB")
+        for mode in ("struct", "numpy", "pool"):
+            cmd = [sys.executable, __file__, "--child", mode, "--dir", path, "--workers", str(args.workers)]
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+            print(
+                f"{r['mode']:6s} {r['files'] / r['seconds']:8.0f} files/s  {r['seconds']:6.2f} s  "
+                f"{r['events']} events  peak RSS {r['rss_mb']:6.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare alerts/sec of the single-alert and batch NMS webhook paths.
+
+Run against a live API, e.g.:
+
+    WEBHOOK_IP_LIMIT=100000 uvicorn app.main:app &
+    python scripts/bench_webhooks.py --alerts 2000 --batch-size 200 --concurrency 8
+
+Hosts default to devices named ONT-0..ONT-N; pass --hosts to use names seeded in your DB.
+If NMS_HMAC_SECRET is set the payloads are signed the same way the API verifies them.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+
+def _post(url: str, body: bytes) -> int:
+    headers = {"Content-Type": "application/json"}
+    secret = os.getenv("NMS_HMAC_SECRET")
+    if secret:
+        headers["X-Signature"] = hmac.new(secret.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def _alerts(n: int, hosts: list[str], run: str) -> list[dict]:
+    return [
+        {
+            "hostname": hosts[i % len(hosts)],
+            "severity": "critical",
+            "rule": "Device Down",
+            "alert_id": f"bench-{run}-{i}",
+            "state": "alert",
+            "msg": "benchmark",
+        }
+        for i in range(n)
+    ]
+
+
+def bench_single(base: str, alerts: list[dict], concurrency: int) -> tuple[float, int]:
+    url = f"{base}/webhooks/librenms"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        codes = list(pool.map(lambda a: _post(url, json.dumps(a).encode()), alerts))
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(1 for c in codes if c >= 400)
+
+
+def bench_batch(base: str, alerts: list[dict], batch_size: int, concurrency: int) -> tuple[float, int]:
+    url = f"{base}/webhooks/librenms/batch"
+    batches = [alerts[i : i + batch_size] for i in range(0, len(alerts), batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        codes = list(pool.map(lambda b: _post(url, json.dumps(b).encode()), batches))
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(1 for c in codes if c >= 400)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--api", default=os.getenv("API", "http://127.0.0.1:8000"))
+    ap.add_argument("--alerts", type=int, default=1000)
+    ap.add_argument("--batch-size", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--hosts", default="", help="comma-separated device names")
+    args = ap.parse_args()
+
+    hosts = [h.strip() for h in args.hosts.split(",") if h.strip()] or [f"ONT-{i}" for i in range(200)]
+    run = uuid4().hex[:8]
+
+    t_single, err_single = bench_single(args.api, _alerts(args.alerts, hosts, run + "s"), args.concurrency)
+    t_batch, err_batch = bench_batch(args.api, _alerts(args.alerts, hosts, run + "b"), args.batch_size, args.concurrency)
+
+    print(f"alerts={args.alerts} batch_size={args.batch_size} concurrency={args.concurrency}")
+    print(f"single: {args.alerts / t_single:10.1f} alerts/s  ({t_single:.2f}s, {err_single} failed requests)")
+    print(f"batch:  {args.alerts / t_batch:10.1f} alerts/s  ({t_batch:.2f}s, {err_batch} failed requests)")
+    print(f"speedup: {t_single / t_batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
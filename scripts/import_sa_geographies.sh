@@ -73,6 +73,12 @@ ogr2ogr -f PostgreSQL \
 echo "Running loader SQL..."
 psql "$PG_DSN" -v ON_ERROR_STOP=1 -f "/workspace/sql/load_sa_geographies.sql"
 
+echo "Rebuilding simplified ward/suburb levels of detail..."
+psql "$PG_DSN" -v ON_ERROR_STOP=1 -c "
+  SELECT ${SCHEMA}.rebuild_geo_lods('wards');
+  SELECT ${SCHEMA}.rebuild_geo_lods('suburbs');
+"
+
 echo "Done. Counts:"
 psql "$PG_DSN" -v ON_ERROR_STOP=1 -c "
   SELECT 'geo_wards' AS table, COUNT(*) FROM ${SCHEMA}.geo_wards
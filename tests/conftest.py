@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+# Tests run without a database; let app.core.deps build its engine lazily.
+os.environ.setdefault("DB_SKIP_STARTUP_TESTS", "true")
+
+# Optional PostGIS database migrated to head (alembic upgrade head) for the `postgis` tests
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+class FakeResult:
+    """The parts of a SQLAlchemy Result the services read: rows, mappings, scalars, rowcount."""
+
+    def __init__(self, rows=(), rowcount=None):
+        self.rows = list(rows)
+        self.rowcount = len(self.rows) if rowcount is None else rowcount
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def all(self):
+        return list(self.rows)
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def mappings(self):
+        return self  # rows are dicts where the code reads mappings
+
+    def scalars(self):
+        return FakeResult([r[0] if isinstance(r, tuple) else r for r in self.rows])
+
+    def scalar(self):
+        return next(iter(self.scalars()), None)
+
+
+class FakeDB:
+    """Session stand-in that records statements and answers them with `respond(sql, params)`.
+
+    `respond` returns rows, a FakeResult (also reachable as FakeDB.Result) or None (no rows);
+    it may raise to fail the statement.
+    """
+
+    Result = FakeResult
+
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda sql, params: None)
+        self.statements = []
+        self.commits = self.rollbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.statements.append((sql, params))
+        out = self.respond(sql, params)
+        return out if isinstance(out, FakeResult) else FakeResult(out or ())
+
+    def writes(self, *verbs):
+        """(sql, params) of the statements starting with one of `verbs` (default: any write)."""
+        verbs = verbs or ("insert", "update", "delete")
+        return [(sql, p) for sql, p in self.statements if sql.lstrip().startswith(verbs)]
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db():
+    """FakeDB factory: `db = fake_db(lambda sql, params: rows)`."""
+    return FakeDB
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgis: needs TEST_DATABASE_URL (PostGIS, migrated to head); skipped otherwise")
+
+
+@pytest.fixture
+def pg():
+    """Session on TEST_DATABASE_URL inside a transaction that is rolled back afterwards.
+
+    Code under test may commit: commits only release a savepoint.
+    """
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import Session
+
+    engine = create_engine(TEST_DATABASE_URL)
+    try:
+        conn = engine.connect()
+    except OperationalError as e:
+        pytest.skip(f"TEST_DATABASE_URL unreachable: {e}")
+    trans = conn.begin()
+    db = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        yield db
+    finally:
+        db.close()
+        trans.rollback()
+        conn.close()
+        engine.dispose()
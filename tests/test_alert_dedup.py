@@ -0,0 +1,116 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from app import scheduler
+from app.services import alert_dedup, alerts
+
+
+def _alert(ref, problem=True):
+    return {"source": "zabbix", "host": "OLT-01", "category": "Device", "nms_ref": ref, "problem": problem}
+
+
+def test_lookup_returns_remembered_incidents():
+    async def go():
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        a, b = _alert("zabbix:1"), _alert("zabbix:2")
+        assert await alert_dedup.lookup(r, [a, b]) == [None, None]
+        await alert_dedup.remember(r, [(a, "inc-1")])
+        assert await alert_dedup.lookup(r, [a, b]) == ["inc-1", None]
+        assert 0 < await r.ttl(alert_dedup._dedup_key(a)) <= alert_dedup.DEDUP_WINDOW_SEC
+
+    asyncio.run(go())
+
+
+def test_state_changes_are_counted_and_damping_engages_once():
+    async def go():
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        ref = "zabbix:flap"
+        # Unchanged states are not changes; every flip is
+        assert await alert_dedup.record_states(r, [_alert(ref), _alert(ref)]) == [0, 0]
+        assert await alert_dedup.record_states(r, [_alert(ref, False), _alert(ref), _alert("zabbix:other")]) == [1, 2, 0]
+
+        assert await alert_dedup.damp(r, _alert(ref), "inc-1") == (True, 1)
+        assert await alert_dedup.damp(r, _alert(ref, False), "inc-1") == (False, 2)
+        assert await r.hgetall(alert_dedup.FLAP_COUNTS_KEY) == {"inc-1": "2"}
+
+    asyncio.run(go())
+
+
+def test_ingest_falls_back_to_database_when_redis_is_down(monkeypatch):
+    async def redis_down():
+        raise ConnectionError("redis down")
+
+    batches = []
+
+    def process_alerts(db, batch):
+        batches.append(batch)
+        return [{"ok": True, "incident_id": "inc"} for _ in batch]
+
+    monkeypatch.setattr(alerts, "get_redis", redis_down)
+    monkeypatch.setattr(alerts, "process_alerts", process_alerts)
+    batch = [_alert("zabbix:1"), _alert("zabbix:1"), _alert("zabbix:2", problem=False)]
+    out = asyncio.run(alerts.ingest_alerts(None, batch))
+    assert batches == [batch]
+    assert len(out) == 3
+
+
+
+def test_alert_that_cannot_be_damped_goes_to_the_database(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    flapping, steady = _alert("zabbix:flap"), _alert("zabbix:steady")
+
+    async def get_redis():
+        return r
+
+    async def damp_down(r, alert, incident_id):
+        raise ConnectionError("redis down")
+
+    batches = []
+
+    def process_alerts(db, batch):
+        batches.append(batch)
+        return [{"ok": True, "incident_id": "inc-1"} for _ in batch]
+
+    async def go():
+        await alert_dedup.remember(r, [(flapping, "inc-1"), (steady, "inc-2")])
+        # Flips down to a clear, so the problem below is the FLAP_CHANGES-th change
+        n = alert_dedup.FLAP_CHANGES
+        await alert_dedup.record_states(r, [_alert("zabbix:flap", problem=bool((n - 1 - k) % 2)) for k in range(n)])
+        return await alerts.ingest_alerts(None, [flapping, steady])
+
+    monkeypatch.setattr(alerts, "get_redis", get_redis)
+    monkeypatch.setattr(alerts, "process_alerts", process_alerts)
+    monkeypatch.setattr(alert_dedup, "damp", damp_down)
+    out = asyncio.run(go())
+    assert batches == [[flapping]]
+    assert out == [{"ok": True, "incident_id": "inc-1"}, {"ok": True, "incident_id": "inc-2", "dedup": True}]
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_flap_flush_keeps_counts_when_the_update_fails(monkeypatch, fake_db, fail):
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset(alert_dedup.FLAP_COUNTS_KEY, mapping={"inc-1": 3, "inc-2": 1})
+
+    def respond(sql, params):
+        if fail:
+            # A flap counted while the flush is running
+            r.hincrby(alert_dedup.FLAP_COUNTS_KEY, "inc-1", 1)
+            raise RuntimeError("database unavailable")
+
+    db = fake_db(respond)
+    monkeypatch.setattr(scheduler, "get_redis_sync", lambda: r)
+    monkeypatch.setattr(scheduler, "SessionLocal", lambda: db)
+
+    if fail:
+        with pytest.raises(RuntimeError):
+            scheduler.job_flap_flush()
+        assert r.hgetall(alert_dedup.FLAP_COUNTS_KEY) == {"inc-1": "4", "inc-2": "1"}
+    else:
+        scheduler.job_flap_flush()
+        ((_, params),) = db.statements
+        assert dict(zip(params["ids"], params["ns"])) == {"inc-1": 3, "inc-2": 1}
+        assert not r.exists(alert_dedup.FLAP_COUNTS_KEY)
+    assert r.keys(f"{alert_dedup.FLAP_COUNTS_KEY}:flush:*") == []
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.deps import get_db
+from app.routers import nms_webhook
+from app.services import alerts, correlation
+from app.services.maint_index import MaintWindowIndex
+
+
+def _zabbix(event_id, problem=True, host="OLT-01"):
+    return {"host": host, "severity": "High", "event_id": event_id, "problem": problem, "name": "Link down"}
+
+
+@pytest.fixture
+def no_windows(monkeypatch):
+    windows = []
+    monkeypatch.setattr(alerts, "maint_index", MaintWindowIndex(loader=lambda db, now: windows))
+    monkeypatch.setattr(correlation, "CORRELATION_ENABLED", False)
+    return windows
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def redis_down():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(alerts, "get_redis", redis_down)
+    monkeypatch.setattr(nms_webhook.ingest_queue, "queue_enabled", lambda: False)
+    app = FastAPI()
+    app.include_router(nms_webhook.router)
+    app.dependency_overrides[get_db] = lambda: None
+    return app
+
+
+def _incidents(db, ref):
+    return db.execute(
+        text("select id::text, status, resolved_at from incidents where nms_ref = :ref order by opened_at"), {"ref": ref}
+    ).all()
+
+
+def _incident(db, ref, status, opened_at, resolved_at=None):
+    return db.execute(
+        text(
+            "insert into incidents (id, severity, category, title, status, nms_ref, opened_at, resolved_at)"
+            " values (gen_random_uuid(), 'P2', 'Device', 't', :status, :ref, :opened_at, :resolved_at) returning id::text"
+        ),
+        {"ref": ref, "status": status, "opened_at": opened_at, "resolved_at": resolved_at},
+    ).scalar()
+
+
+def test_batch_rejects_bad_bodies(client, monkeypatch):
+    monkeypatch.setattr(nms_webhook, "BATCH_MAX", 2)
+    c = TestClient(client)
+    assert c.post("/webhooks/zabbix/batch", content=b"[]", headers={"Content-Type": "text/plain"}).status_code == 415
+    assert c.post("/webhooks/zabbix/batch", content=b"{nope").status_code == 400
+    assert c.post("/webhooks/zabbix/batch", json={"alerts": [1]}).status_code == 400
+    assert c.post("/webhooks/zabbix/batch", json=[_zabbix("1")] * 3).status_code == 413
+    assert c.post("/webhooks/librenms/batch", json=[]).json() == {"ok": True, "count": 0, "results": []}
+
+
+@pytest.mark.postgis
+def test_process_alerts_dedups_within_and_across_batches(pg, no_windows):
+    first = alerts.process_alerts(pg, [alerts.normalize_zabbix(_zabbix("dd-1")), alerts.normalize_zabbix(_zabbix("dd-1"))])
+    assert "dedup" not in first[0]
+    assert first[1] == {"ok": True, "incident_id": first[0]["incident_id"], "dedup": True}
+
+    again = alerts.process_alerts(pg, [alerts.normalize_zabbix(_zabbix("dd-1"))])
+    assert again[0]["incident_id"] == first[0]["incident_id"] and again[0]["dedup"]
+    assert len(_incidents(pg, "zabbix:dd-1")) == 1
+
+
+@pytest.mark.postgis
+def test_process_alerts_suppresses_in_maintenance(pg, no_windows):
+    now = datetime.now(timezone.utc)
+    device = pg.execute(
+        text("insert into devices (id, name, role) values (gen_random_uuid(), 'OLT-MW', 'OLT') returning id")
+    ).scalar()
+    no_windows.append(("Device", device, now - timedelta(hours=1), now + timedelta(hours=1)))
+
+    out = alerts.process_alerts(
+        pg, [alerts.normalize_zabbix(_zabbix("mw-1", host="OLT-MW")), alerts.normalize_zabbix(_zabbix("mw-2", host="OLT-OTHER"))]
+    )
+    assert out[0] == {"ok": True, "suppressed": True, "reason": "maintenance window"}
+    assert out[1]["incident_id"]
+    assert _incidents(pg, "zabbix:mw-1") == []
+
+
+@pytest.mark.postgis
+def test_clear_resolves_only_newest_open_incident(pg, no_windows):
+    now = datetime.now(timezone.utc)
+    earlier = now - timedelta(days=2)
+    resolved = _incident(pg, "zabbix:cl-1", "Resolved", now - timedelta(days=3), resolved_at=earlier)
+    older = _incident(pg, "zabbix:cl-1", "Open", now - timedelta(days=1))
+    newest = _incident(pg, "zabbix:cl-1", "Open", now - timedelta(hours=1))
+
+    out = alerts.process_alerts(pg, [alerts.normalize_zabbix(_zabbix("cl-1", problem=False))])
+    assert out[0] == {"ok": True, "incident_id": newest, "cleared": True}
+    rows = {r.id: r for r in _incidents(pg, "zabbix:cl-1")}
+    assert rows[newest].status == "Resolved"
+    assert rows[older].status == "Open"
+    assert rows[resolved].resolved_at == earlier
+
+    # Each further clear takes the next open incident; Resolved ones are never picked again
+    out = alerts.process_alerts(pg, [alerts.normalize_zabbix(_zabbix("cl-1", problem=False))])
+    assert out[0]["incident_id"] == older
+    out = alerts.process_alerts(pg, [alerts.normalize_zabbix(_zabbix("cl-1", problem=False))])
+    assert out[0] == {"ok": True, "message": "No open incident"}
+
+
+@pytest.mark.postgis
+def test_last_event_per_ref_decides_clear(pg, no_windows):
+    _incident(pg, "zabbix:cl-2", "Open", datetime.now(timezone.utc) - timedelta(hours=1))
+    out = alerts.process_alerts(
+        pg, [alerts.normalize_zabbix(_zabbix("cl-2", problem=False)), alerts.normalize_zabbix(_zabbix("cl-2"))]
+    )
+    assert out[0] == {"ok": True, "message": "Superseded by later alert in batch"}
+    assert out[1]["dedup"]
+    assert [r.status for r in _incidents(pg, "zabbix:cl-2")] == ["Open"]
+
+
+@pytest.mark.postgis
+def test_batch_endpoint_falls_back_to_database(pg, no_windows, client):
+    client.dependency_overrides[get_db] = lambda: pg
+    c = TestClient(client)
+    body = [_zabbix("ep-1"), _zabbix("ep-1"), _zabbix("ep-2"), _zabbix("ep-2", problem=False)]
+    res = c.post("/webhooks/zabbix/batch", json=body).json()
+    assert res["count"] == 4
+    assert [r["index"] for r in res["results"]] == [0, 1, 2, 3]
+    assert res["results"][1]["dedup"]
+    assert res["results"][3] == {"ok": True, "incident_id": res["results"][2]["incident_id"], "cleared": True, "index": 3}
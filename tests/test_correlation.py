@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+from app.services.correlation import Topology, _cable_paths, plan
+
+
+def _topology(ports=2, splitters_per_port=2, onts_per_splitter=8):
+    """OLT -> ports -> splitters -> ONTs; returns the topology and ONT ids per splitter."""
+    topo = Topology()
+    olt = ("olt", uuid4())
+    tree = {}
+    for p in range(ports):
+        port = ("olt_port", olt[1], f"0/1/{p}")
+        for s in range(splitters_per_port):
+            spl = ("splitter", uuid4())
+            onts = [uuid4() for _ in range(onts_per_splitter)]
+            for d in onts:
+                topo.add(d, [olt, port, spl], None, {})
+            tree[(port, spl)] = onts
+    return topo, tree
+
+
+def test_port_failure_groups_under_port():
+    topo, tree = _topology()
+    port, _ = next(iter(tree))
+    onts = [d for (p, _), ds in tree.items() if p == port for d in ds]
+    p = plan(topo, list(enumerate(onts)), [], {}, min_children=3, min_ratio=0.5)
+    assert p.new_parents == [port]
+    assert set(p.assign.values()) == {port}
+    assert len(p.assign) == len(onts)
+
+
+def test_below_threshold_stays_standalone():
+    topo, tree = _topology()
+    onts = next(iter(tree.values()))[:2]
+    p = plan(topo, list(enumerate(onts)), [], {}, min_children=3, min_ratio=0.5)
+    assert p.assign == {}
+    assert p.new_parents == []
+
+
+def test_earlier_incidents_relinked_when_threshold_reached():
+    topo, tree = _topology()
+    (_, spl), onts = next(iter(tree.items()))
+    earlier = [(uuid4(), d, None) for d in onts[:3]]
+    p = plan(topo, [(0, onts[3]), (1, onts[4])], earlier, {}, min_children=3, min_ratio=0.5)
+    assert p.new_parents == [spl]
+    assert sorted(i for i, _ in p.relink) == sorted(i for i, _, _ in earlier)
+
+
+def test_existing_parent_absorbs_new_alert_and_nests():
+    topo, tree = _topology(ports=1, splitters_per_port=2)
+    (port, spl_a), onts_a = list(tree.items())[0]
+    (_, spl_b), onts_b = list(tree.items())[1]
+    # One splitter already has an open parent; when its sibling fails too the port takes over
+    p = plan(topo, list(enumerate(onts_a[:1])), [], {spl_a: uuid4()}, min_children=3, min_ratio=0.5)
+    assert p.assign == {0: spl_a}
+    assert p.new_parents == []
+
+    recent = [(uuid4(), d, None) for d in onts_b] + [(uuid4(), d, "parent") for d in onts_a[:6]]
+    p = plan(topo, [(0, onts_a[6])], recent, {spl_a: uuid4()}, min_children=3, min_ratio=0.5)
+    assert p.new_parents == [port]
+    assert p.nest == [(spl_a, port)]
+    assert len(p.relink) == len(onts_b)
+
+
+def test_cable_paths_follow_edges_from_olt():
+    pon = uuid4()
+    nodes = [
+        SimpleNamespace(id=1, type="OLT", code="OLT-1", pon_id=pon),
+        SimpleNamespace(id=2, type="Closure", code="CL-1", pon_id=pon),
+        SimpleNamespace(id=3, type="Splitter", code="SP-1", pon_id=pon),
+    ]
+    edges = [
+        SimpleNamespace(a_id=1, b_id=2, cable_code="FDR-1"),
+        SimpleNamespace(a_id=3, b_id=2, cable_code="DST-7"),
+    ]
+    paths = _cable_paths(nodes, edges)
+    assert paths[(pon, "SP-1")] == ["FDR-1", "DST-7"]
+    assert paths[(pon, "OLT-1")] == []
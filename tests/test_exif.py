@@ -0,0 +1,86 @@
+import io
+import struct
+from datetime import datetime, timezone
+
+from PIL import Image
+
+from app.services import exif
+
+
+def _jpeg(size=(64, 48), dto="2024:05:06 07:08:09", gps=True, icc=0):
+    ex = Image.Exif()
+    ex[0x010F] = "TestCam"
+    ex[exif.TAG_EXIF_IFD] = {exif.TAG_DATETIME_ORIGINAL: dto}
+    if gps:
+        ex[exif.TAG_GPS_IFD] = {1: "S", 2: (26.0, 12.0, 30.6), 3: "E", 4: (28.0, 2.0, 45.0)}
+    bio = io.BytesIO()
+    Image.new("RGB", size, (120, 40, 200)).save(bio, "JPEG", exif=ex.tobytes(), quality=95)
+    data = bio.getvalue()
+    if icc:
+        # Large APP2 segments ahead of the EXIF block
+        app2 = b"".join(b"\xff\xe2" + struct.pack(">H", 65535) + b"\x00" * 65533 for _ in range(icc))
+        data = data[:2] + app2 + data[2:]
+    return data
+
+
+class _S3:
+    def __init__(self, data):
+        self.data = data
+        self.read = 0
+        self.full = 0
+
+    def get_object_range(self, key, start, end):
+        chunk = self.data[start : end + 1]
+        self.read += len(chunk)
+        return chunk
+
+    def get_object_bytes(self, key):
+        self.full += 1
+        self.read += len(self.data)
+        return self.data
+
+
+def test_header_parse_matches_full_parse():
+    data = _jpeg()
+    head = exif.parse_head(data[:4096])
+    assert head == exif.parse_exif(data)
+    assert head["taken_ts"] == datetime(2024, 5, 6, 7, 8, 9, tzinfo=timezone.utc)
+    assert head["gps_lat"] == -26.2085 and head["gps_lng"] == 28.045833
+
+
+def test_read_exif_reads_only_the_head(monkeypatch):
+    # Noise compresses badly, so the JPEG is far larger than the EXIF head
+    img = Image.effect_noise((1600, 1200), 64).convert("RGB")
+    bio = io.BytesIO()
+    ex = Image.Exif()
+    ex[exif.TAG_EXIF_IFD] = {exif.TAG_DATETIME_ORIGINAL: "2024:01:02 03:04:05"}
+    img.save(bio, "JPEG", exif=ex.tobytes(), quality=95)
+    fake = _S3(bio.getvalue())
+    monkeypatch.setattr(exif, "s3", fake)
+    monkeypatch.setattr(exif, "EXIF_HEAD_BYTES", 16 * 1024)
+    out = exif.read_exif("k", len(fake.data))
+    assert out["taken_ts"] == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert fake.full == 0 and fake.read == 16 * 1024 < len(fake.data) // 10
+
+
+def test_read_exif_extends_past_large_segments(monkeypatch):
+    fake = _S3(_jpeg(icc=3))
+    monkeypatch.setattr(exif, "s3", fake)
+    monkeypatch.setattr(exif, "EXIF_HEAD_BYTES", 64 * 1024)
+    out = exif.read_exif("k", len(fake.data))
+    assert out["gps_lat"] == -26.2085
+    assert fake.full == 0
+
+
+def test_no_exif_and_unknown_formats(monkeypatch):
+    bio = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(bio, "PNG")
+    assert exif.parse_head(bio.getvalue()) == {"taken_ts": None, "gps_lat": None, "gps_lng": None}
+
+    bio = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(bio, "GIF")
+    fake = _S3(bio.getvalue())
+    monkeypatch.setattr(exif, "s3", fake)
+    monkeypatch.setattr(exif, "EXIF_HEAD_BYTES", 16)
+    assert exif.read_exif("k", len(fake.data))["taken_ts"] is None
+    assert fake.full == 1
@@ -0,0 +1,19 @@
+from app.services.geo_lod import FULL, LOD_TOLERANCES, level_for
+
+
+def test_no_zoom_or_tolerance_serves_full_resolution():
+    assert level_for() == FULL
+
+
+def test_zoom_picks_coarsest_level_below_a_pixel():
+    assert level_for(zoom=6) == 0
+    assert LOD_TOLERANCES[level_for(zoom=11)] <= 360.0 / (256 * 2**11)
+    assert level_for(zoom=10) < level_for(zoom=11)
+    # Street zoom needs more detail than the finest precomputed level
+    assert level_for(zoom=15) == FULL
+
+
+def test_explicit_tolerance():
+    assert level_for(tolerance=0.001) == LOD_TOLERANCES.index(0.0008)
+    assert level_for(tolerance=0.00001) == FULL
+    assert level_for(zoom=1, tolerance=0.0003) == LOD_TOLERANCES.index(0.0003)
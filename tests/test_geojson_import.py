@@ -0,0 +1,151 @@
+import io
+import json
+
+import pytest
+
+from app.services.geojson_import import check_feature, encode_feature, iter_features
+
+
+def _doc(n, **extra):
+    return {
+        "type": "FeatureCollection",
+        **extra,
+        "features": [
+            {"type": "Feature", "properties": {"code": f"P{i}"}, "geometry": {"type": "Point", "coordinates": [28.0 + i / 1e5, -26.2]}}
+            for i in range(n)
+        ],
+    }
+
+
+def _iter(doc, chunk_size=64):
+    raw = doc if isinstance(doc, bytes) else json.dumps(doc).encode()
+    return list(iter_features(io.BytesIO(raw), chunk_size=chunk_size))
+
+
+def test_features_across_chunk_boundaries():
+    doc = _doc(500, name="poles", crs={"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}})
+    assert _iter(doc, chunk_size=7) == doc["features"]
+
+
+def test_feature_larger_than_chunk_and_members_after_features():
+    ring = [[28 + i / 1e4, -26 + i / 1e4] for i in range(5000)]
+    feat = {"type": "Feature", "properties": {"name": "W1"}, "geometry": {"type": "LineString", "coordinates": ring}}
+    raw = b'\xef\xbb\xbf{"features": [' + json.dumps(feat).encode() + b'], "totalFeatures": 123456789, "type": "FeatureCollection"}'
+    assert _iter(raw, chunk_size=16) == [feat]
+
+
+def test_empty_collection():
+    assert _iter({"type": "FeatureCollection", "features": []}) == []
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b'{"type": "Feature", "features": []}',
+        b'{"features": []}',
+        b'{"type": "FeatureCollection", "features": [{"type": "Feature"}',
+        b'{"type": "FeatureCollection", "features": [1]}',
+        b'{"type": "FeatureCollection", "features": []} trailing',
+        b"[]",
+    ],
+)
+def test_rejects_malformed_documents(raw):
+    with pytest.raises(ValueError):
+        _iter(raw)
+
+
+def test_encode_feature_copy_line():
+    feat = {"properties": {"cable_code": "C\t1", "chainage_m": 12.5}, "geometry": {"type": "LineString", "coordinates": [[28, -26], [28.5, -26.25]]}}
+    line, reason = encode_feature("cables", 7, feat)
+    assert reason is None
+    fields = line.decode().rstrip("\n").split("\t")
+    assert fields[:7] == ["7", "C\\t1", "\\N", "\\N", "trench", "12.5", "SRID=4326;LINESTRING(28 -26,28.5 -26.25)"]
+    assert len(fields[7]) == 32
+
+
+def test_content_hash_ignores_position_and_unrelated_properties():
+    def digest(seq, feat):
+        return encode_feature("poles", seq, feat)[0].split(b"\t")[-1]
+
+    feat = {"properties": {"code": "P1", "owner": "x"}, "geometry": {"type": "Point", "coordinates": [28.1, -26.1]}}
+    same = {"properties": {"code": "P1", "owner": "y"}, "geometry": {"type": "Point", "coordinates": [28.1, -26.1]}}
+    moved = {"properties": {"code": "P1"}, "geometry": {"type": "Point", "coordinates": [28.1, -26.2]}}
+    assert digest(0, feat) == digest(9, same)
+    assert digest(0, feat) != digest(0, moved)
+
+
+def test_check_feature():
+    point = {"type": "Point", "coordinates": [28.0, -26.2]}
+    assert check_feature("poles", {"geometry": point, "properties": {"code": "P1"}}) is None
+    assert check_feature("poles", {"geometry": None}) == "missing geometry"
+    assert "not allowed" in check_feature("wards", {"geometry": point})
+    assert check_feature("cables", {"geometry": {"type": "LineString", "coordinates": [[28, -26]]}}) == "too few positions"
+    # Lo29 metres without a crs member
+    assert check_feature("poles", {"geometry": {"type": "Point", "coordinates": [-52000.0, 2900000.0]}}) == "coordinates outside EPSG:4326 bounds"
+    ring = [[28, -26], [28.1, -26], [28.1, -26.1], [28, -26.1]]
+    assert check_feature("wards", {"geometry": {"type": "Polygon", "coordinates": [ring]}}) == "unclosed polygon ring"
+    assert check_feature("wards", {"geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]}}) is None
+    assert check_feature("suburbs", {"geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]}, "properties": {"ward_id": "x"}})
+
+
+def test_rejects_projected_crs():
+    doc = _doc(1, crs={"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::22239"}})
+    with pytest.raises(ValueError, match="unsupported crs"):
+        _iter(doc)
+
+
+def test_raw_features_are_the_source_text():
+    doc = _doc(50)
+    raw = list(iter_features(io.BytesIO(json.dumps(doc).encode()), chunk_size=13, raw=True))
+    assert [json.loads(r) for r in raw] == doc["features"]
+
+
+def _pole(code, lng):
+    return {"type": "Feature", "properties": {"code": code}, "geometry": {"type": "Point", "coordinates": [lng, -26.2]}}
+
+
+def _cable(code, lng):
+    return {"type": "Feature", "properties": {"cable_code": code}, "geometry": {"type": "LineString", "coordinates": [[lng, -26.2], [lng + 0.001, -26.2]]}}
+
+
+@pytest.mark.postgis
+def test_diff_import_counts(pg):
+    from sqlalchemy import text
+
+    from app.services.geojson_import import load_features
+
+    pon = pg.execute(text("insert into pons (id) values (gen_random_uuid()) returning id::text")).scalar()
+    first = load_features(pg, "poles", [_pole("P1", 28.0), _pole("P2", 28.1), _pole("P3", 28.2)], pon, diff=True)
+    assert first["changes"] == {"inserted": 3, "updated": 0, "unchanged": 0, "deleted": 0, "kept": 0}
+    pg.execute(text("update poles set status = 'Installed' where code = 'P3' and pon_id = cast(:p as uuid)"), {"p": pon})
+
+    # P1 unchanged, P2 moved, P4 new; P3 is missing but Installed, so kept even with deletes on
+    out = load_features(pg, "poles", [_pole("P1", 28.0), _pole("P2", 28.15), _pole("P4", 28.3)], pon, diff=True)
+    assert out["changes"] == {"inserted": 1, "updated": 1, "unchanged": 1, "deleted": 0, "kept": 1}
+    out = load_features(pg, "poles", [_pole("P1", 28.0)], pon, diff=True, delete_missing=True)
+    assert out["changes"] == {"inserted": 0, "updated": 0, "unchanged": 1, "deleted": 2, "kept": 1}
+    codes = pg.execute(text("select code from poles where pon_id = cast(:p as uuid) order by code"), {"p": pon}).scalars().all()
+    assert codes == ["P1", "P3"]
+
+
+@pytest.mark.postgis
+def test_diff_import_keeps_surveyed_and_manual_cables(pg):
+    from sqlalchemy import text
+
+    from app.services.geojson_import import load_features
+
+    pon = pg.execute(text("insert into pons (id) values (gen_random_uuid()) returning id::text")).scalar()
+    pg.execute(
+        text("insert into cable_register (id, pon_id, cable_code, length_m) values (gen_random_uuid(), cast(:p as uuid), 'MANUAL', 850)"),
+        {"p": pon},
+    )
+    load_features(pg, "cables", [_cable("C1", 28.0), _cable("C2", 28.1)], pon, diff=True)
+    pg.execute(text("update cable_register set length_m = 120 where cable_code = 'C2' and pon_id = cast(:p as uuid)"), {"p": pon})
+
+    # Deletes are opt-in
+    out = load_features(pg, "cables", [_cable("C9", 28.5)], pon, diff=True)
+    assert out["changes"]["deleted"] == 0 and out["changes"]["kept"] == 3
+    out = load_features(pg, "cables", [_cable("C9", 28.5)], pon, diff=True, delete_missing=True)
+    assert (out["changes"]["deleted"], out["changes"]["kept"]) == (1, 2)
+    codes = pg.execute(text("select cable_code from cable_register where pon_id = cast(:p as uuid) order by cable_code"), {"p": pon}).scalars().all()
+    assert codes == ["C2", "C9", "MANUAL"]
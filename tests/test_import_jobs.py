@@ -0,0 +1,24 @@
+import psycopg
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.services import import_jobs
+
+
+def test_bad_features_are_isolated_by_bisection(monkeypatch):
+    loaded = []
+
+    def load(db, layer, lines, pon_id):
+        batch = list(lines)
+        if any(line.startswith(b"bad") for line in batch):
+            raise psycopg.errors.InvalidParameterValue("parse error - invalid geometry")
+        loaded.extend(batch)
+        return {"loaded": len(batch), "rejected": []}
+
+    monkeypatch.setattr(import_jobs, "load_lines", load)
+    lines = [(i, b"bad" if i in (3, 17, 18) else b"ok") for i in range(40)]
+    rejects = []
+    with Session(create_engine("sqlite://")) as db:
+        n = import_jobs._load_isolating(db, "poles", lines, None, rejects)
+    assert n == len(loaded) == 37
+    assert rejects == [(3, "parse error - invalid geometry"), (17, "parse error - invalid geometry"), (18, "parse error - invalid geometry")]
@@ -0,0 +1,27 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.import_pipeline import chunked, encoded_chunks
+
+
+def _raw(n):
+    for i in range(n):
+        geom = {"type": "Point", "coordinates": [28 + i / 1e4, -26.2]} if i % 10 else {"type": "Point", "coordinates": [3e6, 1e6]}
+        yield json.dumps({"type": "Feature", "properties": {"code": f"P{i}"}, "geometry": geom})
+
+
+def test_chunked_resumes_after_checkpoint():
+    chunks = list(chunked(_raw(25), 10, start=12))
+    assert [[i for i, _ in c] for c in chunks] == [list(range(12, 22)), list(range(22, 25))]
+
+
+def test_pool_matches_inline_encoding_in_order():
+    inline = list(encoded_chunks("poles", chunked(_raw(300), 32)))
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pooled = list(encoded_chunks("poles", chunked(_raw(300), 32), pool))
+    assert pooled == inline
+    lines = [i for _, (encoded, _) in inline for i, _ in encoded]
+    rejects = [i for _, (_, rej) in inline for i, _ in rej]
+    assert rejects == list(range(0, 300, 10))
+    assert sorted(lines + rejects) == list(range(300))
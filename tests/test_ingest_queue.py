@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import fakeredis.aioredis
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+
+from app.services import ingest_queue as q
+
+
+@pytest.fixture
+def writes(monkeypatch, fake_db):
+    """Alert batches passed to ingest_alerts; a batch containing a "bad" host fails like a bad row."""
+    calls = []
+
+    async def ingest_alerts(db, alerts):
+        calls.append([a["host"] for a in alerts])
+        if any(a["host"] == "bad" for a in alerts):
+            raise DataError("insert", {}, Exception("value too long"))
+        return [{"ok": True} for _ in alerts]
+
+    monkeypatch.setattr(q, "ingest_alerts", ingest_alerts)
+    monkeypatch.setattr(q, "SessionLocal", fake_db)
+    return calls
+
+
+def _run(bodies):
+    async def go():
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await q._ensure_group(r)
+        for kind, body in bodies:
+            await r.xadd(q.STREAM, {"kind": kind, "body": body})
+        resp = await r.xreadgroup(q.GROUP, "c1", {q.STREAM: ">"}, count=100)
+        error = None
+        try:
+            await q.process_entries(r, resp[0][1])
+        except Exception as e:
+            error = e
+        dead = [f for _, f in await r.xrange(q.DEAD_STREAM)]
+        return dead, await r.xlen(q.STREAM), await r.hgetall(q.STATS_KEY), error
+
+    return asyncio.run(go())
+
+
+def _zabbix(host):
+    return json.dumps({"host": host, "event_id": host, "problem": True})
+
+
+def test_malformed_entries_are_dead_lettered_alone(writes):
+    dead, left, stats, error = _run(
+        [
+            ("zabbix", _zabbix("a")),
+            ("zabbix", "{not json"),
+            ("zabbix", json.dumps([{"host": "x"}])),  # a list posted to the single endpoint
+            ("nagios", "{}"),
+            ("zabbix_batch", json.dumps([{"host": "b"}, {"host": "c"}])),
+        ]
+    )
+    assert writes == [["a", "b", "c"]]
+    assert [d["body"] for d in dead] == ["{not json", '[{"host": "x"}]', "{}"]
+    assert {d["error"] for d in dead} == {"unparseable entry"}
+    assert error is None and left == 0
+    assert stats == {"processed": "5", "alerts_written": "3", "dead_lettered": "3"}
+
+
+def test_failed_write_bisects_to_the_offending_entry(writes):
+    dead, left, stats, error = _run([("zabbix", _zabbix(h)) for h in ("a", "b", "bad", "c", "d")])
+    assert writes[0] == ["a", "b", "bad", "c", "d"]
+    assert ["bad"] in writes
+    assert [json.loads(d["body"])["host"] for d in dead] == ["bad"]
+    assert dead[0]["error"].startswith("alert write failed")
+    assert error is None and left == 0
+    assert stats["alerts_written"] == "4"
+
+
+def test_connection_errors_leave_the_batch_pending(monkeypatch, fake_db):
+    async def ingest_alerts(db, alerts):
+        raise OperationalError("connect", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(q, "ingest_alerts", ingest_alerts)
+    monkeypatch.setattr(q, "SessionLocal", fake_db)
+    dead, left, stats, error = _run([("zabbix", _zabbix("a")), ("zabbix", _zabbix("b"))])
+    assert isinstance(error, OperationalError)
+    assert dead == [] and left == 2 and stats == {}
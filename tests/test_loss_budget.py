@@ -0,0 +1,63 @@
+import pytest
+
+from app.services import loss_budget
+from app.services.loss_budget import CONNECTOR_DB, SPLICE_DB, compute
+
+
+NODES = [
+    ("olt", "OLT", "OLT-1"),
+    ("cl1", "closure", "CL-1"),
+    ("spl", "splitter", "SPL-1"),
+    ("d1", "drop", "D-1"),
+    ("cl2", "closure", "CL-2"),
+    ("d2", "drop", "D-2"),
+]
+EDGES = [
+    ("olt", "cl1", "FDR-1", 1000.0),
+    ("cl1", "spl", "DST-1", None),
+    ("spl", "d1", "DST-1", None),
+    ("spl", "cl2", "DRP-1", 300.0),
+    ("d2", "cl2", "DRP-1", 50.0),
+]
+CLOSURES = {"CL-1": (12, 0.05, 0.08), "CL-2": (0, None, None)}
+
+
+def test_paths_add_fibre_splices_splitters_and_connectors():
+    paths = {p["drop"]: p for p in compute(NODES, EDGES, CLOSURES, {"SPL-1": "1:8"}, {"DST-1": 2000.0}, 1310)}
+    assert set(paths) == {"D-1", "D-2"}
+
+    d1 = paths["D-1"]
+    # 1000 m feeder + DST-1's 2000 m shared by its two unmeasured edges
+    assert d1["length_m"] == 3000.0
+    assert d1["fibre_db"] == pytest.approx(3.0 * 0.35)
+    assert d1["splitter_db"] == 10.5
+    assert (d1["splices"], d1["unmeasured_splices"]) == (1, 0)
+    assert d1["expected_db"] == pytest.approx(1.05 + 0.05 + 10.5 + 2 * CONNECTOR_DB, abs=0.01)
+    assert d1["worst_db"] == pytest.approx(1.05 + 0.08 + 10.5 + 2 * CONNECTOR_DB, abs=0.01)
+
+    d2 = paths["D-2"]
+    assert d2["length_m"] == 2350.0 and d2["hops"] == 4
+    assert (d2["splices"], d2["unmeasured_splices"]) == (2, 1)
+    assert d2["splice_db"] == pytest.approx(0.05 + SPLICE_DB)
+
+
+def test_wavelength_and_unknown_splitter_ratio():
+    paths = compute(NODES, EDGES, {}, {}, {"DST-1": 2000.0}, 1550)
+    d1 = next(p for p in paths if p["drop"] == "D-1")
+    assert d1["fibre_db"] == pytest.approx(3.0 * 0.22)
+    assert d1["splitter_db"] == loss_budget.SPLITTER_DB[loss_budget.DEFAULT_SPLIT]
+
+
+def test_full_pon_tree():
+    # OLT -> 16 closures -> 1:32 splitter each -> 32 drops
+    nodes = [("olt", "OLT", "OLT-1")]
+    edges = []
+    for c in range(16):
+        nodes += [(f"c{c}", "closure", f"CL-{c}"), (f"s{c}", "splitter", f"S-{c}")]
+        edges += [("olt", f"c{c}", "FDR", 500.0 + c), (f"c{c}", f"s{c}", None, 5.0)]
+        for d in range(32):
+            nodes.append((f"d{c}-{d}", "drop", f"D-{c}-{d}"))
+            edges.append((f"s{c}", f"d{c}-{d}", None, 80.0))
+    paths = compute(nodes, edges, {}, {f"S-{c}": "1:32" for c in range(16)}, {}, 1310)
+    assert len(paths) == 512
+    assert all(p["splitter_db"] == 17.1 and p["splices"] == 1 for p in paths)
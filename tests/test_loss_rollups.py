@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from app.services import loss_rollups
+
+
+def _crew(dim_id, n, passed, within, mean, p50, p90, p95, mx):
+    return {
+        "dim_id": dim_id, "n": n, "passed": passed, "within_budget": within, "sum_db": mean * n,
+        "sum_sq_db": (mean * mean + 0.01) * n, "p50": p50, "p90": p90, "p95": p95, "max": mx,
+    }
+
+
+def test_distributions_worst_first(fake_db):
+    crews = [
+        _crew("a", 40, 39, 40, 0.05, 3, 8, 9, 12),
+        _crew("b", 25, 18, 20, 0.12, 9, 24, 30, 41),
+        _crew("c", 60, 60, 60, 0.04, 2, 7, 8, 9),
+    ]
+    db = fake_db(lambda sql, params: crews)
+    out = loss_rollups.distributions(db, "tech", "splice", "splice_loss", min_n=20)
+    assert [x["dim_id"] for x in out] == ["b", "a", "c"]
+    b = out[0]
+    assert b["p90_db"] == 0.25 and b["max_db"] == 0.42
+    assert b["pass_rate"] == 0.72 and b["over_budget_rate"] == 0.2
+    assert b["mean_db"] == pytest.approx(0.12) and b["stddev_db"] == pytest.approx(0.1)
+    params = db.statements[0][1]
+    assert params["min_n"] == 20 and params["id"] is None
+
+    by_rate = loss_rollups.distributions(db, "tech", "splice", "splice_loss", order="fail_rate", limit=1)
+    assert [x["dim_id"] for x in by_rate] == ["b"]
+
+
+def test_overall_percentiles_from_histogram(fake_db):
+    # total loss buckets of 0.1 dB: 50 links at 1.0-1.1 dB, 40 at 1.5-1.6, 10 at 3.0-3.1
+    rows = [
+        SimpleNamespace(bucket=10, n=50, passed=50, within_budget=50, sum_db=52.5, sum_sq_db=55.2),
+        SimpleNamespace(bucket=15, n=40, passed=40, within_budget=38, sum_db=62.0, sum_sq_db=96.1),
+        SimpleNamespace(bucket=30, n=10, passed=4, within_budget=0, sum_db=30.5, sum_sq_db=93.1),
+    ]
+    out = loss_rollups.overall(fake_db(lambda sql, params: rows), "pon", "otdr", "total_loss")
+    assert out["n"] == 100
+    assert (out["p50_db"], out["p90_db"], out["p95_db"], out["max_db"]) == (1.1, 1.6, 3.1, 3.1)
+    assert out["pass_rate"] == 0.94 and out["within_budget_rate"] == 0.88
+    assert out["mean_db"] == pytest.approx(1.45)
+
+
+def test_overall_empty(fake_db):
+    assert loss_rollups.overall(fake_db(), "smme", "lspm", "total_loss") is None
+
+
+@pytest.mark.postgis
+def test_rebuild_holds_an_exclusive_lock(pg, monkeypatch):
+    monkeypatch.setattr(pg, "commit", lambda: None)  # inspect the lock before it is released
+    loss_rollups.rebuild(pg)
+    mode = pg.execute(
+        text(
+            "select mode from pg_locks where locktype = 'relation' and relation = 'test_loss_rollups'::regclass"
+            " and pid = pg_backend_pid() and mode = 'ExclusiveLock'"
+        )
+    ).scalar()
+    assert mode == "ExclusiveLock"
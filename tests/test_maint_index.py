@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.services.maint_index import MaintWindowIndex
+
+
+NOW = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _index(windows, ttl=30.0, clock=None):
+    calls = []
+
+    def loader(db, now):
+        calls.append(now)
+        return list(windows)
+
+    return MaintWindowIndex(loader=loader, ttl_sec=ttl, clock=clock or FakeClock()), calls
+
+
+def test_device_and_pon_windows():
+    dev, pon, other = uuid4(), uuid4(), uuid4()
+    idx, _ = _index(
+        [
+            ("Device", dev, NOW - timedelta(hours=1), NOW + timedelta(hours=1)),
+            ("PON", pon, NOW + timedelta(hours=1), NOW + timedelta(hours=2)),
+        ]
+    )
+    assert idx.is_suppressed(None, device_id=dev, now=NOW)
+    assert not idx.is_suppressed(None, device_id=other, now=NOW)
+    # Upcoming window becomes active without a reload
+    assert not idx.is_suppressed(None, pon_id=pon, now=NOW)
+    assert idx.is_suppressed(None, pon_id=pon, now=NOW + timedelta(minutes=90))
+
+
+def test_overlapping_windows_use_running_max_end():
+    dev = uuid4()
+    idx, _ = _index(
+        [
+            ("Device", dev, NOW - timedelta(hours=5), NOW + timedelta(hours=5)),
+            ("Device", dev, NOW - timedelta(hours=2), NOW - timedelta(hours=1)),
+        ]
+    )
+    assert idx.is_suppressed(None, device_id=dev, now=NOW)
+
+
+def test_global_window_suppresses_everything():
+    idx, _ = _index([("Global", None, NOW - timedelta(minutes=1), NOW + timedelta(minutes=1))])
+    assert idx.is_suppressed(None, now=NOW)
+    assert idx.is_suppressed(None, device_id=uuid4(), now=NOW)
+
+
+def test_ttl_and_invalidate_trigger_reload():
+    clock = FakeClock()
+    idx, calls = _index([], ttl=10.0, clock=clock)
+    idx.is_suppressed(None, now=NOW)
+    idx.is_suppressed(None, now=NOW)
+    assert len(calls) == 1
+    clock.t = 11.0
+    idx.is_suppressed(None, now=NOW)
+    assert len(calls) == 2
+    idx.invalidate()
+    idx.is_suppressed(None, now=NOW)
+    assert len(calls) == 3
+    stats = idx.stats()
+    assert stats["misses"] == 3 and stats["hits"] == 1 and stats["invalidations"] == 1
+
+
+def test_failed_refresh_serves_previous_index():
+    dev = uuid4()
+    clock = FakeClock()
+    windows = [("Device", dev, NOW - timedelta(hours=1), NOW + timedelta(hours=1))]
+    state = {"fail": False}
+
+    def loader(db, now):
+        if state["fail"]:
+            raise RuntimeError("db down")
+        return windows
+
+    idx = MaintWindowIndex(loader=loader, ttl_sec=5.0, clock=clock)
+    assert idx.is_suppressed(None, device_id=dev, now=NOW)
+    state["fail"] = True
+    clock.t = 6.0
+    assert idx.is_suppressed(None, device_id=dev, now=NOW)
+    assert idx.stats()["stale_served"] == 1
+
+
+def test_failed_refresh_rolls_back_and_backs_off(fake_db):
+    dev = uuid4()
+    clock = FakeClock()
+    windows = [("Device", dev, NOW - timedelta(hours=1), NOW + timedelta(hours=1))]
+    state = {"fail": False, "calls": 0}
+
+    def loader(db, now):
+        state["calls"] += 1
+        if state["fail"]:
+            raise RuntimeError("db down")
+        return windows
+
+    db = fake_db()
+    idx = MaintWindowIndex(loader=loader, ttl_sec=5.0, retry_sec=3.0, clock=clock)
+    assert idx.is_suppressed(db, device_id=dev, now=NOW)
+    state["fail"] = True
+    clock.t = 6.0
+    assert idx.is_suppressed(db, device_id=dev, now=NOW)
+    assert state["calls"] == 2 and db.rollbacks == 1
+
+    # No reload attempts until the retry interval has passed
+    clock.t = 8.0
+    assert idx.is_suppressed(db, device_id=dev, now=NOW)
+    assert state["calls"] == 2
+    clock.t = 9.5
+    state["fail"] = False
+    assert idx.is_suppressed(db, device_id=dev, now=NOW)
+    assert state["calls"] == 3 and db.rollbacks == 1
+    stats = idx.stats()
+    assert stats["refresh_errors"] == 1 and stats["stale_served"] == 2 and not stats["stale"]
+
+
+def test_first_refresh_failure_rolls_back_and_raises(fake_db):
+    def loader(db, now):
+        raise RuntimeError("db down")
+
+    db = fake_db()
+    idx = MaintWindowIndex(loader=loader, clock=FakeClock())
+    with pytest.raises(RuntimeError):
+        idx.is_suppressed(db, now=NOW)
+    assert db.rollbacks == 1
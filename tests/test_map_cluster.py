@@ -0,0 +1,25 @@
+import numpy as np
+
+from app.services.map_cluster import cell_size, cluster_points
+
+
+def test_points_in_one_cell_merge_with_breakdown():
+    lon = np.array([28.001, 28.002, 28.003, 28.5])
+    lat = np.array([-26.001, -26.002, -26.003, -26.5])
+    cats = np.array([0, 0, 2, 1])
+    c = cluster_points(lon, lat, cats, cell=0.01, k=4)
+    order = np.argsort(-c["count"])
+    assert list(c["count"][order]) == [3, 1]
+    assert list(c["breakdown"][order[0]]) == [2, 0, 1, 0]
+    assert np.isclose(c["x"][order[0]], 28.002) and np.isclose(c["y"][order[0]], -26.002)
+    assert c["first"][order[1]] == 3
+
+
+def test_empty_input():
+    c = cluster_points(np.zeros(0), np.zeros(0), np.zeros(0, np.int64), cell=0.01, k=4)
+    assert len(c["count"]) == 0 and c["breakdown"].shape == (0, 4)
+
+
+def test_cell_shrinks_with_zoom_and_follows_bbox():
+    assert cell_size(12) == cell_size(11) / 2
+    assert np.isclose(cell_size(None, [28.0, -26.5, 28.5, -26.0]), cell_size(np.log2(360.0 * 4 / 0.5)))
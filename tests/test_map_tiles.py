@@ -0,0 +1,159 @@
+import math
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.deps import get_db
+from app.routers import map as map_router
+from app.services import map_tiles
+
+
+def _tile_of(lat, lng, z):
+    n = 2**z
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    r = fakeredis.FakeRedis()
+    monkeypatch.setattr(map_tiles, "get_redis_binary", lambda: r)
+    return r
+
+
+@pytest.fixture
+def client(monkeypatch):
+    renders = []
+
+    def get_tile(db, layer, z, x, y):
+        renders.append((layer, z, x, y))
+        return b"tile", '"etag-1"'
+
+    monkeypatch.setattr(map_router, "get_tile", get_tile)
+    app = FastAPI()
+    app.include_router(map_router.router)
+    app.dependency_overrides[get_db] = lambda: None
+    c = TestClient(app, headers={"X-Role": "PM"})
+    c.renders = renders
+    return c
+
+
+def test_tile_sql_props_and_predicates_follow_zoom():
+    low, high = map_tiles.tile_sql("poles", 13), map_tiles.tile_sql("poles", 16)
+    assert "t.code" not in low and "t.code" in high
+    assert "from poles t" in high
+    assert "ST_SimplifyPreserveTopology" not in high
+
+    cables = map_tiles.tile_sql("cables", 12)
+    assert "from cable_register t" in cables
+    assert "ST_SimplifyPreserveTopology(ST_Transform(t.geom, 3857), :tol)" in cables
+
+    # Zoomed out incidents are thinned to open P1/P2; both predicates drop as the map zooms in
+    far, mid, near = (map_tiles.tile_sql("incidents", z) for z in (8, 10, 12))
+    assert "t.severity in ('P1', 'P2')" in far and "t.status not in ('Resolved', 'Closed')" in far
+    assert "t.severity in" not in mid and "t.status not in" in mid
+    assert "t.severity in" not in near and "t.status not in" not in near
+    assert "order by t.severity" in near
+
+    for sql in (low, cables, far):
+        # Tile address, limit and layer name are bound, never formatted in
+        for param in (":z", ":x", ":y", ":limit", ":layer"):
+            assert param in sql
+        assert f"margin => {map_tiles.MVT_BUFFER / map_tiles.MVT_EXTENT}" in sql
+
+
+def test_tile_sql_rejects_unknown_layers():
+    with pytest.raises(KeyError):
+        map_tiles.tile_sql("poles t; drop table poles; --", 14)
+
+
+def test_render_tile_binds_tile_bounds(fake_db):
+    db = fake_db(lambda sql, params: [(b"mvt",)])
+    assert map_tiles.render_tile(db, "cables", 14, 9000, 9400) == b"mvt"
+    assert map_tiles.render_tile(db, "cables", 15, 18000, 18800) == b"mvt"
+    (_, p14), (_, p15) = db.statements
+    assert {k: p14[k] for k in ("z", "x", "y", "layer", "limit")} == {
+        "z": 14,
+        "x": 9000,
+        "y": 9400,
+        "layer": "cables",
+        "limit": map_tiles.MVT_MAX_FEATURES,
+    }
+    # Simplification tolerance is a fixed fraction of a tile pixel
+    assert p14["tol"] == pytest.approx(map_tiles.WEB_MERCATOR_WIDTH_M / 2**14 / 256 * map_tiles.MVT_SIMPLIFY_PX)
+    assert p15["tol"] == pytest.approx(p14["tol"] / 2)
+
+
+def test_render_tile_skips_zooms_below_the_layer(fake_db):
+    db = fake_db()
+    assert map_tiles.render_tile(db, "poles", map_tiles.LAYERS["poles"].min_zoom - 1, 0, 0) == b""
+    assert map_tiles.render_tile(db, "poles", map_tiles.LAYERS["poles"].min_zoom, 0, 0) == b""
+    assert len(db.statements) == 1
+
+
+def test_tiles_are_cached_until_the_layer_is_bumped(monkeypatch, redis):
+    renders = []
+
+    def render(db, layer, z, x, y):
+        renders.append((layer, z, x, y))
+        return f"{layer}-{len(renders)}".encode()
+
+    monkeypatch.setattr(map_tiles, "render_tile", render)
+    tile, etag = map_tiles.get_tile(None, "poles", 16, 1, 2)
+    assert map_tiles.get_tile(None, "poles", 16, 1, 2) == (tile, etag)
+    map_tiles.get_tile(None, "closures", 16, 1, 2)
+    assert len(renders) == 2
+    assert redis.ttl("mvt:poles:0:16:1:2") == map_tiles.MVT_CACHE_TTL_SEC
+
+    map_tiles.bump_layers("poles")
+    tile2, etag2 = map_tiles.get_tile(None, "poles", 16, 1, 2)
+    assert tile2 == b"poles-3" and etag2 != etag
+    # Other layers keep their cached tiles
+    map_tiles.get_tile(None, "closures", 16, 1, 2)
+    assert len(renders) == 3
+
+
+def test_tiles_render_without_redis(monkeypatch):
+    def down():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(map_tiles, "get_redis_binary", down)
+    monkeypatch.setattr(map_tiles, "render_tile", lambda db, layer, z, x, y: b"mvt")
+    assert map_tiles.get_tile(None, "poles", 16, 1, 2) == (b"mvt", map_tiles.tile_etag(b"mvt"))
+    map_tiles.bump_layers("poles")
+
+
+def test_endpoint_only_serves_known_layers_and_tiles(client):
+    assert client.get("/map/tiles/wards/14/1/1.mvt").status_code == 404
+    assert client.get("/map/tiles/poles/23/0/0.mvt").status_code == 400
+    assert client.get("/map/tiles/poles/14/16384/0.mvt").status_code == 400
+    assert client.renders == []
+
+    res = client.get("/map/tiles/poles/14/9000/9400.mvt")
+    assert res.status_code == 200 and res.content == b"tile"
+    assert res.headers["etag"] == '"etag-1"'
+    assert client.get("/map/tiles/poles/14/9000/9400.mvt", headers={"If-None-Match": '"etag-1"'}).status_code == 304
+    assert client.renders == [("poles", 14, 9000, 9400)] * 2
+
+
+@pytest.mark.postgis
+def test_rendered_tile_holds_only_nearby_poles(pg):
+    lat, lng = -26.2041, 28.0473
+    pon = pg.execute(text("insert into pons (id) values (gen_random_uuid()) returning id")).scalar()
+    pg.execute(
+        text(
+            "insert into poles (id, pon_id, code, status, geom)"
+            " values (gen_random_uuid(), :pon, 'P-TILE-1', 'Planned', ST_SetSRID(ST_MakePoint(:lng, :lat), 4326))"
+        ),
+        {"pon": pon, "lat": lat, "lng": lng},
+    )
+    x, y = _tile_of(lat, lng, 16)
+    tile = map_tiles.render_tile(pg, "poles", 16, x, y)
+    assert b"P-TILE-1" in tile
+    assert b"P-TILE-1" not in map_tiles.render_tile(pg, "poles", 16, x + 2, y)
+    # Below the layer's zoom floor nothing is queried or returned
+    assert map_tiles.render_tile(pg, "poles", 12, *_tile_of(lat, lng, 12)) == b""
@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.otdr_snap import interpolate_polyline, polyline_lengths, snap_events
+
+
+# ~1 km east then ~1 km north near Soweto
+ROUTE = [[-26.25, 27.85], [-26.25, 27.86002], [-26.241017, 27.86002]]
+
+
+def test_cumulative_length():
+    pts = np.asarray(ROUTE)
+    cum = polyline_lengths(pts[:, 0], pts[:, 1])
+    assert cum[0] == 0.0
+    assert cum[1] == pytest.approx(1000.0, rel=2e-3)
+    assert cum[2] == pytest.approx(2000.0, rel=2e-3)
+
+
+def test_interpolates_between_vertices():
+    out = interpolate_polyline(ROUTE, np.array([0.0, 500.0, 1500.0, 2500.0, -10.0]))
+    np.testing.assert_allclose(out[0], ROUTE[0])
+    # half-way along the first leg, not snapped to a vertex
+    np.testing.assert_allclose(out[1], [-26.25, 27.85501], atol=2e-5)
+    np.testing.assert_allclose(out[2], [-26.2455, 27.86002], atol=2e-5)
+    # clamped to the route's ends
+    np.testing.assert_allclose(out[3], ROUTE[-1])
+    np.testing.assert_allclose(out[4], ROUTE[0])
+
+
+def test_registered_length_scales_distances():
+    # 4 km optical length (slack loops) on a 2 km drawn route: 2 km is half-way
+    out = interpolate_polyline(ROUTE, np.array([2000.0]), length_m=4000.0)
+    np.testing.assert_allclose(out[0], ROUTE[1], atol=2e-5)
+
+
+def test_degenerate_polylines():
+    assert interpolate_polyline([], np.array([1.0])) is None
+    np.testing.assert_allclose(interpolate_polyline([[-26.2, 28.0]], np.array([1.0, 2.0])), [[-26.2, 28.0]] * 2)
+
+
+def _cable_db(fake_db, cable):
+    """The route's cable row, then the event insert."""
+    return fake_db(lambda sql, params: [cable] if "has_geom" in sql else fake_db.Result(rowcount=len(params["d"])))
+
+
+def test_snap_events_single_insert_for_polyline(fake_db):
+    db = _cable_db(fake_db, {"id": "c1", "length_m": None, "has_geom": False, "polyline": json.dumps(ROUTE)})
+    events = [{"distance_m": float(d), "event_no": i} for i, d in enumerate(range(0, 2000, 20))] + [{"distance_m": float("nan")}]
+    assert snap_events(db, "r1", "tp1", events) == 100
+    assert len(db.statements) == 2
+    sql, params = db.statements[1]
+    assert "unnest(" in sql and len(params["lat"]) == 100 and params["no"][:3] == [0, 1, 2]
+
+
+def test_snap_events_geometry_in_one_statement(fake_db):
+    db = _cable_db(fake_db, {"id": "c1", "length_m": 1200, "has_geom": True, "polyline": None})
+    assert snap_events(db, "r1", "tp1", [{"distance_m": 10.0}, {"distance_m": 900.0}]) == 2
+    assert len(db.statements) == 2 and "ST_LineInterpolatePoint" in db.statements[1][0]
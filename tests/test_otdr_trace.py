@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from app.services import otdr_trace
+
+
+def _samples(n=100_000, seed=3):
+    rng = np.random.default_rng(seed)
+    return np.clip(np.arange(n) * 0.2 + rng.normal(0, 30, n) + 2000, 0, 65535).astype(np.uint16)
+
+
+def _store_in_memory(pts, res=0.5, scale=1.0):
+    blobs = {}
+    levels = otdr_trace.build_levels(pts)
+    for k, level in enumerate(levels):
+        blobs[("t", k)] = otdr_trace.encode_level(level)
+    meta = {"trace_key": "t", "trace_points": len(pts), "trace_levels": len(levels), "trace_resolution_m": res, "trace_scale": scale}
+    reads = []
+
+    def loader(key, level):
+        reads.append(level)
+        return otdr_trace.decode_level(blobs[(key, level)], level)
+
+    return meta, loader, reads
+
+
+def test_levels_keep_envelope():
+    pts = _samples(10_001)
+    levels = otdr_trace.build_levels(pts)
+    assert len(levels[0]) == 10_001
+    assert [len(lv) for lv in levels[1:]] == [1251, 157]
+    # every bucket brackets its samples, including the padded last one
+    assert levels[1][-1].tolist() == [pts[-1], pts[-1]]
+    assert levels[2][0, 0] == pts[:64].min() and levels[2][0, 1] == pts[:64].max()
+    assert otdr_trace.decode_level(otdr_trace.encode_level(levels[1]), 1).tolist() == levels[1].tolist()
+
+
+def test_zoomed_out_window_reads_preview_level():
+    pts = _samples()
+    meta, loader, reads = _store_in_memory(pts)
+    w = otdr_trace.window(meta, None, None, 500, loader)
+    assert reads == [2] and w["level"] == 2
+    assert len(w["min_db"]) <= 500
+    assert min(w["min_db"]) == pytest.approx(-int(pts.max()) / 1000.0)
+    assert max(w["max_db"]) == pytest.approx(-int(pts.min()) / 1000.0)
+    assert w["distance_m"][0] == 0.0 and w["to_m"] == pytest.approx((len(pts) - 1) * 0.5)
+
+
+def test_zoomed_in_window_returns_samples():
+    pts = _samples()
+    meta, loader, reads = _store_in_memory(pts, res=0.25, scale=1.5)
+    w = otdr_trace.window(meta, 1000.0, 1100.0, 1000, loader)
+    assert reads == [0]
+    assert w["from_m"] == 1000.0 and w["step_m"] == 0.25
+    i0 = 4000
+    assert w["distance_m"][:2] == [1000.0, 1000.25]
+    assert w["min_db"][:3] == pytest.approx((pts[i0:i0 + 3].astype(float) * -0.0015).tolist(), abs=1e-3)
+    assert w["min_db"] == w["max_db"]
+
+
+def test_window_rebuckets_to_requested_points():
+    pts = _samples()
+    meta, loader, _ = _store_in_memory(pts)
+    w = otdr_trace.window(meta, 5000.0, 15000.0, 300, loader)
+    assert len(w["distance_m"]) == 300
+    seg = pts[10000:30001]
+    assert min(w["min_db"]) == pytest.approx(-int(seg.max()) / 1000.0, abs=0.2)
+    assert np.all(np.diff(w["distance_m"]) > 0)
+
+
+def test_window_outside_trace_is_empty():
+    meta, loader, reads = _store_in_memory(_samples(1000))
+    assert otdr_trace.window(meta, 900.0, 1000.0, 100, loader)["distance_m"] == []
+    assert reads == []
+
+
+@pytest.mark.parametrize("won", [True, False])
+def test_first_view_backfill_records_one_trace(monkeypatch, fake_db, won):
+    from app.routers import tests_otdr
+
+    pts = _samples(5000)
+    ours = {"trace_key": "otdr/traces/ours", "trace_points": len(pts), "trace_levels": 2, "trace_resolution_m": 0.5,
+            "trace_scale": 1.0, "trace_bytes": 10}
+    theirs = {**ours, "trace_key": "otdr/traces/theirs"}
+    reads = iter([{"s3_key": "a.sor", **dict.fromkeys(ours)}, {"s3_key": "a.sor", **theirs}])
+
+    def respond(sql, params):
+        if sql.startswith("select"):
+            return [next(reads)]
+        # Conditional update: a concurrent first view may have recorded its trace already
+        assert "and trace_key is null" in sql
+        return [("id",)] if won else None
+
+    discarded = []
+    monkeypatch.setattr(tests_otdr.sor, "parse_object", lambda key, store_trace: {"s3_key": key, "trace": ours})
+    monkeypatch.setattr(tests_otdr.otdr_trace, "discard", discarded.append)
+    monkeypatch.setattr(tests_otdr.otdr_trace, "window", lambda meta, a, b, n: {"trace_key": meta["trace_key"]})
+    out = tests_otdr.otdr_trace_window("r1", None, None, 1000, fake_db(respond))
+    assert out["trace_key"] == ("otdr/traces/ours" if won else "otdr/traces/theirs")
+    assert discarded == ([] if won else [ours])
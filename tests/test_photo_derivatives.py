@@ -0,0 +1,129 @@
+import io
+
+import pytest
+from PIL import Image
+from sqlalchemy import text
+
+from app.services import photo_derivatives as pd
+
+
+def _photo(size=(4000, 3000), orientation=6):
+    ex = Image.Exif()
+    ex[0x0112] = orientation  # 6: stored landscape, shown rotated 90 degrees clockwise
+    ex[0x8825] = {1: "S", 2: (26.0, 12.0, 30.6), 3: "E", 4: (28.0, 2.0, 45.0)}
+    bio = io.BytesIO()
+    Image.new("RGB", size, (30, 120, 60)).save(bio, "JPEG", exif=ex.tobytes(), quality=90)
+    return bio.getvalue()
+
+
+def test_render_sizes_orientation_and_no_metadata():
+    out = pd.render(_photo(), "webp")
+    assert list(out) == ["preview", "thumb"]
+    preview = Image.open(io.BytesIO(out["preview"]))
+    thumb = Image.open(io.BytesIO(out["thumb"]))
+    assert preview.format == "WEBP"
+    # Portrait after applying the EXIF orientation
+    assert preview.size == (960, 1280) and thumb.size == (240, 320)
+    assert not preview.getexif()
+
+
+def test_render_jpeg_and_small_images():
+    out = pd.render(_photo(size=(200, 100), orientation=1), "jpeg")
+    assert Image.open(io.BytesIO(out["thumb"])).size == (200, 100)
+    assert Image.open(io.BytesIO(out["preview"])).format == "JPEG"
+
+
+def test_generate_stores_predictable_keys(monkeypatch, fake_db):
+    stored = {}
+
+    def put_bytes(key, content_type, data):
+        stored[key] = content_type
+        return f"https://s3/bucket/{key}"
+
+    monkeypatch.setattr(pd.s3, "get_object_bytes", lambda key: _photo(size=(800, 600)) if key == "ok.jpg" else b"not an image")
+    monkeypatch.setattr(pd.s3, "put_bytes", put_bytes)
+    monkeypatch.setattr(pd, "PHOTO_WORKERS", 0)
+    ok, bad = pd.generate_many([("p1", "ok.jpg"), ("p2", "bad.jpg")])
+    assert ok["thumb_url"] == "https://s3/bucket/" + pd.derivative_key("p1", "ok.jpg", "thumb")
+    token = pd.object_token("ok.jpg")
+    assert stored == {f"photos/p1/{token}/preview.webp": "image/webp", f"photos/p1/{token}/thumb.webp": "image/webp"}
+    assert "error" in bad
+    # Another object for the same photo renders under other keys
+    assert pd.derivative_key("p1", "ok-v2.jpg", "thumb") != pd.derivative_key("p1", "ok.jpg", "thumb")
+
+    assert isinstance(ok["phash"], int) and "phash" not in bad
+
+    db = fake_db(lambda sql, params: ["p1"])  # ids returned by the update
+    pd.save(db, [ok, bad])
+    # The test photo is a flat colour, too uniform for duplicate search
+    ((_, saved),) = db.statements
+    assert saved["keys"] == ["ok.jpg", "bad.jpg"]
+    assert saved["thumbs"] == [ok["thumb_url"], None] and saved["errors"][0] is None and saved["errors"][1]
+    assert saved["hashes"] == [ok["phash"], None] and saved["h0"][1] is None
+
+
+@pytest.mark.postgis
+def test_claims_and_saves_follow_the_current_object(pg):
+    ids = [
+        pg.execute(text("insert into photos (id, s3_key) values (gen_random_uuid(), :k) returning id::text"), {"k": k}).scalar()
+        for k in ("a.jpg", "b.jpg")
+    ]
+    params = {"ids": ids, "keys": ["a.jpg", "b.jpg"], "claim_sec": 900}
+    assert len(pg.execute(text(pd.CLAIM_SQL), params).all()) == 2
+    # Already claimed by the first worker, and not pending for the scheduler either
+    assert pg.execute(text(pd.CLAIM_SQL), params).all() == []
+    assert ids[0] not in {r.id for r in pg.execute(text(pd.CLAIM_PENDING_SQL), {"n": 1000, "claim_sec": 900})}
+
+    # b.jpg was replaced while it rendered: its result is dropped
+    pg.execute(text("update photos set s3_key = 'b2.jpg' where id = cast(:id as uuid)"), {"id": ids[1]})
+    pd.save(pg, [{"photo_id": i, "s3_key": k, "thumb_url": f"t/{k}", "preview_url": f"p/{k}"} for i, k in zip(ids, ["a.jpg", "b.jpg"])])
+    rows = pg.execute(text("select thumb_url from photos where id = any(cast(:ids as uuid[])) order by s3_key"), {"ids": ids}).scalars().all()
+    assert rows == ["t/a.jpg", None]
+
+
+@pytest.mark.postgis
+def test_failed_render_is_retried_once_its_claim_expires(pg, monkeypatch):
+    photo = pg.execute(text("insert into photos (id, s3_key) values (gen_random_uuid(), 'flaky.jpg') returning id::text")).scalar()
+    reads = []
+
+    def get_object_bytes(key):
+        reads.append(key)
+        if len(reads) == 1:
+            raise ConnectionError("s3 timeout")
+        return _photo(size=(800, 600))
+
+    monkeypatch.setattr(pd.s3, "get_object_bytes", get_object_bytes)
+    monkeypatch.setattr(pd.s3, "put_bytes", lambda key, content_type, data: f"https://s3/bucket/{key}")
+    monkeypatch.setattr(pd, "PHOTO_WORKERS", 0)
+
+    def state():
+        return pg.execute(
+            text("select derivatives_at, derivatives_error, thumb_url, phash from photos where id = cast(:id as uuid)"), {"id": photo}
+        ).one()
+
+    pd.run_pending(pg)
+    failed = state()
+    assert failed.derivatives_at is None and failed.derivatives_error == "s3 timeout"
+    # Still claimed: the scheduler backs off until the claim expires
+    pd.run_pending(pg)
+    assert reads == ["flaky.jpg"]
+
+    pg.execute(text("update photos set derivatives_claimed_at = now() - interval '1 hour' where id = cast(:id as uuid)"), {"id": photo})
+    pd.run_pending(pg)
+    done = state()
+    assert done.derivatives_at is not None and done.derivatives_error is None
+    assert done.thumb_url.endswith("/thumb.webp") and done.phash is not None
+
+
+@pytest.mark.postgis
+def test_registering_again_retries_a_failed_render_at_once(pg):
+    photo = pg.execute(
+        text(
+            "insert into photos (id, s3_key, derivatives_error, derivatives_claimed_at)"
+            " values (gen_random_uuid(), 'a.jpg', 's3 timeout', now()) returning id::text"
+        )
+    ).scalar()
+    params = {"ids": [photo], "keys": ["a.jpg"], "claim_sec": 900}
+    assert [r.id for r in pg.execute(text(pd.CLAIM_SQL), params)] == [photo]
+    # The claim clears the error, so a second registration waits for this render
+    assert pg.execute(text(pd.CLAIM_SQL), params).all() == []
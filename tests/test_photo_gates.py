@@ -0,0 +1,43 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.routers.certificate_acceptance import CertificateAcceptanceIn, create_certificate_acceptance
+
+
+def _photo(db, pon, **cols):
+    cols = {"exif_ok": True, "within_geofence": True, "s3_key": "p.jpg", **cols}
+    names = ", ".join(cols)
+    values = ", ".join(f":{c}" for c in cols)
+    return db.execute(
+        text(f"insert into photos (id, pon_id, {names}) values (gen_random_uuid(), cast(:pon as uuid), {values}) returning id::text"),
+        {"pon": pon, **cols},
+    ).scalar()
+
+
+@pytest.mark.postgis
+def test_acceptance_needs_a_hashed_photo_that_is_not_a_duplicate(pg, monkeypatch):
+    pon = pg.execute(text("insert into pons (id) values (gen_random_uuid()) returning id::text")).scalar()
+    payload = CertificateAcceptanceIn(pon_id=pon, pole_length_m=7.6, depth_m=1.15, tag_height_m=2.25)
+
+    original = _photo(pg, pon)  # registered, duplicate check still pending
+    with pytest.raises(HTTPException) as e:
+        create_certificate_acceptance(payload, pg)
+    assert e.value.status_code == 400
+
+    _photo(pg, pon, phash=12345, duplicate_of=original)
+    with pytest.raises(HTTPException):
+        create_certificate_acceptance(payload, pg)
+
+    pg.execute(text("update photos set phash = 67890 where id = cast(:id as uuid)"), {"id": original})
+    monkeypatch.setattr(pg, "add", lambda rec: None)  # only the gate is under test
+    assert create_certificate_acceptance(payload, pg)["ok"]
+
+
+@pytest.mark.postgis
+def test_photos_recorded_without_an_object_key_skip_the_hash_check(pg, monkeypatch):
+    pon = pg.execute(text("insert into pons (id) values (gen_random_uuid()) returning id::text")).scalar()
+    payload = CertificateAcceptanceIn(pon_id=pon, pole_length_m=7.6, depth_m=1.15, tag_height_m=2.25)
+    _photo(pg, pon, s3_key=None)  # recorded before s3_key was: can never be hashed
+    monkeypatch.setattr(pg, "add", lambda rec: None)
+    assert create_certificate_acceptance(payload, pg)["ok"]
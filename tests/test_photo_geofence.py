@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from app.services import photo_geofence
+
+
+T0 = datetime(2024, 6, 1, 18, 0, tzinfo=timezone.utc)
+
+
+def test_revalidate_batches_until_no_pon_is_dirty(fake_db):
+    batches = [[("p0", T0), ("p1", T0 - timedelta(hours=1))], [("p2", T0)], []]
+
+    def respond(sql, params):
+        if sql == "select now()":
+            return [T0]
+        if "from pons" in sql and "limit" in sql:
+            return [SimpleNamespace(id=i, changed_at=c) for i, c in batches.pop(0)]
+        if sql.lstrip().startswith("update photos"):
+            return fake_db.Result(rowcount=3 * len(params["pons"]))
+        return None
+
+    db = fake_db(respond)
+    assert photo_geofence.revalidate(db, batch=2) == {"pons": 3, "photos": 9}
+    assert [p for sql, p in db.statements if "limit" in sql] == [{"cutoff": T0, "n": 2}] * 3
+    stamps = [p for _, p in db.writes("update pons")]
+    assert stamps == [{"pons": ["p0", "p1"], "changed": [T0, T0 - timedelta(hours=1)]}, {"pons": ["p2"], "changed": [T0]}]
+    assert db.commits == 3
+
+
+def _pon(db, **cols):
+    names = "".join(f", {c}" for c in cols)
+    values = "".join(f", {v}" for v in cols.values())
+    return db.execute(text(f"insert into pons (id{names}) values (gen_random_uuid(){values}) returning id::text")).scalar()
+
+
+def _photo(db, pon, lat, within):
+    return db.execute(
+        text(
+            "insert into photos (id, pon_id, gps_lat, gps_lng, within_geofence)"
+            " values (gen_random_uuid(), cast(:pon as uuid), :lat, 28.04, :within) returning id::text"
+        ),
+        {"pon": pon, "lat": lat, "within": within},
+    ).scalar()
+
+
+@pytest.mark.postgis
+def test_check_point_uses_polygon_then_radius(pg):
+    # 0.01 deg square around (0.005, 0.005); the center would put (0.02, 0.02) well inside a 5 km radius
+    square = _pon(
+        pg, center_lat="0.005", center_lng="0.005", geofence_radius_m="5000",
+        geofence_geom="ST_GeomFromText('POLYGON((0 0, 0.01 0, 0.01 0.01, 0 0.01, 0 0))', 4326)",
+    )
+    radius = _pon(pg, center_lat="-26.2", center_lng="28.04", geofence_radius_m="200")
+    bare = _pon(pg)
+
+    assert photo_geofence.check_point(pg, square, 0.005, 0.005) == (True, True)
+    assert photo_geofence.check_point(pg, square, 0.02, 0.02) == (True, False)
+    assert photo_geofence.check_point(pg, radius, -26.2009, 28.04) == (True, True)  # ~100 m
+    assert photo_geofence.check_point(pg, radius, -26.203, 28.04) == (True, False)  # ~330 m
+    assert photo_geofence.check_point(pg, radius, None, 28.04) == (True, False)
+    assert photo_geofence.check_point(pg, bare, -26.2, 28.04) == (False, False)
+    assert photo_geofence.check_point(pg, None, -26.2, 28.04) == (False, False)
+
+
+@pytest.mark.postgis
+def test_revalidate_redoes_photos_of_edited_pons_only(pg):
+    # Inserts are not stamped by the trigger: all three start clean
+    fence = {"center_lat": "-26.2", "center_lng": "28.04", "geofence_radius_m": "200", "geofence_checked_at": "now() - interval '1 hour'"}
+    edited, untouched, later = (_pon(pg, **fence) for _ in range(3))
+    # Stale flags: ~100 m is inside the 200 m fence, ~330 m is outside
+    near, far = _photo(pg, edited, -26.2009, False), _photo(pg, edited, -26.203, True)
+    stale = _photo(pg, untouched, -26.203, True)
+    pending = _photo(pg, later, -26.203, True)
+
+    pg.execute(text("update pons set geofence_radius_m = 210 where id = cast(:id as uuid)"), {"id": edited})  # trigger stamps it
+    pg.execute(text("update pons set geofence_changed_at = now() + interval '1 minute' where id = cast(:id as uuid)"), {"id": later})
+
+    out = photo_geofence.revalidate(pg)
+    assert out["pons"] >= 1 and out["photos"] >= 2
+    within = dict(pg.execute(text("select id::text, within_geofence from photos where id::text in (:a, :b, :c, :d)"), {"a": near, "b": far, "c": stale, "d": pending}).all())
+    assert within == {near: True, far: False, stale: True, pending: True}
+    changed, checked = pg.execute(text("select geofence_changed_at, geofence_checked_at from pons where id = cast(:id as uuid)"), {"id": edited}).one()
+    assert changed is not None and checked == changed
+    # Nothing left for this PON on the next run
+    assert edited not in {r.id for r in pg.execute(text(photo_geofence.DIRTY_SQL), {"cutoff": changed, "n": 10000})}
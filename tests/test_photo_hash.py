@@ -0,0 +1,90 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageFilter
+from sqlalchemy import text
+
+from app.services import photo_hash as ph
+
+
+def _scene(seed):
+    rng = random.Random(seed)
+    img = Image.new("RGB", (640, 480), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(440)
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)))
+    return img.filter(ImageFilter.GaussianBlur(3))
+
+
+def _recompressed(img, size, quality):
+    bio = io.BytesIO()
+    img.resize(size).save(bio, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(bio.getvalue()))
+
+
+def test_dhash_survives_resize_and_recompression():
+    img = _scene(1)
+    h = ph.dhash(img)
+    assert -(1 << 63) <= h < (1 << 63)
+    assert ph.distance(h, ph.dhash(_recompressed(img, (320, 240), 60))) <= ph.PHASH_MAX_DISTANCE
+    assert min(ph.distance(h, ph.dhash(_scene(s))) for s in range(2, 12)) > ph.PHASH_MAX_DISTANCE
+
+
+def test_multi_index_probes_find_every_match():
+    rng = random.Random(3)
+    k = ph.PHASH_MAX_DISTANCE
+    base = [rng.getrandbits(64) for _ in range(200)]
+    # Near copies of some hashes with 0..k random bit flips, plus unrelated ones
+    stored = []
+    for b in base[:100]:
+        h = b
+        for bit in rng.sample(range(64), rng.randint(0, k)):
+            h ^= 1 << bit
+        stored.append(h)
+    stored += base[100:]
+    index = [dict() for _ in range(ph.CHUNKS)]
+    for i, h in enumerate(stored):
+        for j, c in enumerate(ph.chunks(h)):
+            index[j].setdefault(c, []).append(i)
+
+    for q in base:
+        p = ph.probes([("q", q)], k)
+        found = {i for j, c in zip(p["js"], p["cs"]) for i in index[j].get(c, ()) if ph.distance(q, stored[i]) <= k}
+        assert found == {i for i, h in enumerate(stored) if ph.distance(q, h) <= k}
+    assert len(p["cs"]) == ph.CHUNKS * (1 + 16)
+
+
+def test_flag_duplicates_skips_uniform_images(fake_db):
+    db = fake_db(lambda sql, params: [{"id": "b", "duplicate_of": "a", "distance": 2}] if "distinct on" in sql else None)
+    assert ph.flag_duplicates(db, [("blank", 0), ("white", -1)]) == []
+    assert db.statements == []
+
+    out = ph.flag_duplicates(db, [("b", 0x0F0F_F0F0_1234_5678)])
+    assert out == [{"id": "b", "duplicate_of": "a", "distance": 2}]
+    probe, flag = db.statements
+    assert set(probe[1]["ids"]) == {"b"} and probe[1]["k"] == ph.PHASH_MAX_DISTANCE
+    assert flag[1] == {"ids": ["b"], "dups": ["a"], "ds": [2]}
+
+
+@pytest.mark.postgis
+def test_matches_sql_flags_the_nearest_earlier_photo(pg):
+    def photo(h, earlier):
+        return pg.execute(
+            text(
+                "insert into photos (id, phash, phash_h0, phash_h1, phash_h2, phash_h3, derivatives_at)"
+                " values (gen_random_uuid(), :h, :c0, :c1, :c2, :c3, now() - :age * interval '1 hour') returning id::text"
+            ),
+            {"h": h, **{f"c{j}": c for j, c in enumerate(ph.chunks(h))}, "age": 1 if earlier else 0},
+        ).scalar()
+
+    h = ph.dhash(_scene(1))
+    original = photo(h, earlier=True)
+    photo(h ^ 0xFF, earlier=True)  # 8 bits away: too far
+    copy = photo(h ^ 0b101, earlier=False)
+    unrelated = photo(ph.dhash(_scene(2)), earlier=False)
+
+    out = ph.flag_duplicates(pg, [(copy, h ^ 0b101), (unrelated, ph.dhash(_scene(2)))])
+    assert out == [{"id": copy, "duplicate_of": original, "distance": 2}]
+    row = pg.execute(text("select duplicate_of::text, duplicate_distance from photos where id = cast(:id as uuid)"), {"id": copy}).one()
+    assert tuple(row) == (original, 2)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import text
+
+from app.routers import photos_upload_hook as hook
+from app.services import exif
+
+
+P1 = "00000000-0000-0000-0000-000000000001"
+P2 = "00000000-0000-0000-0000-000000000002"
+P3 = "00000000-0000-0000-0000-000000000003"
+
+
+def _photos_db(fake_db, photos):
+    def respond(sql, params):
+        if sql.startswith("select id::text"):
+            return [SimpleNamespace(id=i) for i in params["ids"] if i in photos]
+        # update ... returning: inside when the photo has a position, derivatives pending
+        return [
+            SimpleNamespace(id=i, within_geofence=lat is not None, thumb_url=None, preview_url=None, pending=True)
+            for i, lat in zip(params["ids"], params["lat"])
+        ]
+
+    return fake_db(respond)
+
+
+def test_register_bulk_reads_exif_and_updates_once(monkeypatch, fake_db):
+    now = datetime.now(timezone.utc)
+    metas = {
+        "a.jpg": {"taken_ts": now - timedelta(hours=2), "gps_lat": -26.2, "gps_lng": 28.0},
+        "b.jpg": {"taken_ts": now - timedelta(days=3), "gps_lat": None, "gps_lng": None},
+        "c.jpg": {"error": "S3 object not found"},
+    }
+    monkeypatch.setattr(hook, "fetch_many", lambda keys: [{"s3_key": k, **metas[k]} for k in keys])
+    db = _photos_db(fake_db, {P1, P2, P3})
+    payload = hook.RegisterBulkIn(
+        photos=[
+            {"photo_id": P1, "s3_key": "a.jpg"},
+            {"photo_id": P2, "s3_key": "b.jpg"},
+            {"photo_id": P3, "s3_key": "c.jpg"},
+            {"photo_id": P1, "s3_key": "a.jpg"},
+            {"photo_id": "00000000-0000-0000-0000-0000000000ff", "s3_key": "x.jpg"},
+            {"photo_id": "nope", "s3_key": "y.jpg"},
+        ]
+    )
+    background = BackgroundTasks()
+    out = hook.register_bulk(background, payload, db)
+    assert (out["registered"], out["failed"]) == (2, 4)
+    r = out["results"]
+    assert r[0]["ok"] and r[0]["exif_ok"] and r[0]["within_geofence"]
+    assert r[1]["ok"] and not r[1]["exif_ok"] and not r[1]["within_geofence"]
+    assert [x.get("error") for x in r[2:]] == ["S3 object not found", "Duplicate photo_id in request", "Photo not found", "Invalid photo_id"]
+
+    updates = db.writes("update")
+    assert len(updates) == 1 and db.commits == 1
+    assert updates[0][1]["ids"] == [P1, P2] and updates[0][1]["keys"] == ["a.jpg", "b.jpg"]
+    (task,) = background.tasks
+    assert task.args == ([(P1, "a.jpg"), (P2, "b.jpg")],)
+
+
+def test_register_bulk_limit(monkeypatch, fake_db):
+    monkeypatch.setattr(hook, "PHOTO_BULK_MAX", 1)
+    payload = hook.RegisterBulkIn(photos=[{"photo_id": P1, "s3_key": "a"}, {"photo_id": P2, "s3_key": "b"}])
+    with pytest.raises(HTTPException) as e:
+        hook.register_bulk(BackgroundTasks(), payload, _photos_db(fake_db, set()))
+    assert e.value.status_code == 413
+
+
+def test_fetch_many_checks_objects(monkeypatch):
+    heads = {"ok.jpg": ("image/jpeg", 1000), "big.jpg": ("image/jpeg", 10**9), "doc.pdf": ("application/pdf", 10)}
+
+    def head_object(key):
+        ctype, size = heads[key]
+        return {"ContentType": ctype, "ContentLength": size}
+
+    monkeypatch.setattr(exif.s3, "head_object", head_object)
+    monkeypatch.setattr(exif, "read_exif", lambda key, size: {"taken_ts": None, "gps_lat": 1.0, "gps_lng": 2.0})
+    out = exif.fetch_many(["ok.jpg", "big.jpg", "doc.pdf", "missing.jpg"])
+    assert out[0]["gps_lat"] == 1.0
+    assert [o.get("error") for o in out[1:]] == ["File too large", "Unsupported Content-Type: application/pdf", "S3 object not found"]
+
+
+@pytest.mark.postgis
+def test_bulk_update_sql_checks_geofences_and_resets_replaced_objects(pg, monkeypatch):
+    def insert(table, **cols):
+        names = "".join(f", {c}" for c in cols)
+        values = "".join(f", {v}" for v in cols.values())
+        return pg.execute(text(f"insert into {table} (id{names}) values (gen_random_uuid(){values}) returning id::text")).scalar()
+
+    square = insert("pons", geofence_geom="ST_GeomFromText('POLYGON((0 0, 0.01 0, 0.01 0.01, 0 0.01, 0 0))', 4326)")
+    circle = insert("pons", center_lat="-26.2", center_lng="28.04", geofence_radius_m="200")
+    kept = insert("photos", pon_id=f"'{circle}'", s3_key="'b.jpg'", thumb_url="'t/b'", phash="2", derivatives_at="now()")
+    replaced = insert(
+        "photos", pon_id=f"'{square}'", s3_key="'a.jpg'", thumb_url="'t/a'", phash="1", phash_h0="1",
+        duplicate_of=f"'{kept}'", duplicate_distance="3", derivatives_at="now()",
+    )
+
+    now = datetime.now(timezone.utc)
+    metas = {"a2.jpg": (0.005, 0.005), "b.jpg": (-26.203, 28.04)}  # inside the square; ~330 m from the center
+    monkeypatch.setattr(hook, "fetch_many", lambda keys: [{"taken_ts": now, "gps_lat": metas[k][0], "gps_lng": metas[k][1]} for k in keys])
+    background = BackgroundTasks()
+    payload = hook.RegisterBulkIn(photos=[{"photo_id": replaced, "s3_key": "a2.jpg"}, {"photo_id": kept, "s3_key": "b.jpg"}])
+    out = hook.register_bulk(background, payload, pg)
+    assert [(r["within_geofence"], r["thumb_url"]) for r in out["results"]] == [(True, None), (False, "t/b")]
+
+    rows = {
+        r.id: r
+        for r in pg.execute(
+            text("select id::text, thumb_url, phash, phash_h0, duplicate_of, duplicate_distance, derivatives_at from photos where id::text in (:a, :b)"),
+            {"a": replaced, "b": kept},
+        )
+    }
+    assert rows[replaced].thumb_url is None and rows[replaced].phash is None and rows[replaced].phash_h0 is None
+    assert rows[replaced].duplicate_of is None and rows[replaced].duplicate_distance is None and rows[replaced].derivatives_at is None
+    assert rows[kept].thumb_url == "t/b" and rows[kept].phash == 2
+    (task,) = background.tasks
+    assert task.args == ([(replaced, "a2.jpg")],)
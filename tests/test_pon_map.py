@@ -0,0 +1,37 @@
+import fakeredis
+
+from app.services import pon_map
+
+
+def test_payload_rendered_once_per_version(monkeypatch):
+    r = fakeredis.FakeRedis(decode_responses=True)
+    version = {"v": 3}
+    renders = []
+
+    def render(db, pon_id):
+        renders.append(pon_id)
+        return '{"type":"FeatureCollection","features":[]}'
+
+    monkeypatch.setattr(pon_map, "get_redis_sync", lambda: r)
+    monkeypatch.setattr(pon_map, "pon_version", lambda db, pon_id: version["v"])
+    monkeypatch.setattr(pon_map, "render_assets", render)
+
+    payload, etag = pon_map.get_assets(None, "p1")
+    assert pon_map.get_assets(None, "p1") == (payload, etag)
+    assert len(renders) == 1
+
+    # A write to the PON bumps its version: new ETag, fresh render
+    version["v"] = 4
+    _, etag2 = pon_map.get_assets(None, "p1")
+    assert etag2 != etag
+    assert len(renders) == 2
+
+
+def test_renders_without_redis(monkeypatch):
+    def down():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(pon_map, "get_redis_sync", down)
+    monkeypatch.setattr(pon_map, "pon_version", lambda db, pon_id: 0)
+    monkeypatch.setattr(pon_map, "render_assets", lambda db, pon_id: "{}")
+    assert pon_map.get_assets(None, "p1") == ("{}", '"pon-p1-0"')
@@ -0,0 +1,79 @@
+import struct
+
+import numpy as np
+import pytest
+
+from app.services import sor
+
+
+EVENTS = [
+    {"distance_m": 0.0, "reflectance_db": -45.0, "code": "1F9999", "loss_db": 0.5},
+    {"distance_m": 1520.5, "loss_db": 0.08, "code": "0F9999", "slope_db_km": 0.2},
+    {"distance_m": 3010.0, "loss_db": 0.21, "code": "0F9999", "slope_db_km": 0.2},
+    {"distance_m": 4250.0, "loss_db": 0.45, "reflectance_db": -52.3, "code": "1F9999", "slope_db_km": 0.2},
+    {"distance_m": 6000.0, "loss_db": 0.0, "reflectance_db": -14.1, "code": "2E9999", "slope_db_km": 0.2},
+]
+
+
+def _trace(n=12000):
+    return (np.arange(n) * 0.1 + 3000).astype(np.uint16)
+
+
+def test_parse_round_trip():
+    pts = _trace()
+    data = sor.build_sor(EVENTS, pts, wavelength_nm=1310.0, pulse_width_ns=30, end_to_end_loss_db=2.47, orl_db=38.2, supplier="EXFO")
+    p = sor.parse_sor(data)
+    assert p["format"] == 2
+    assert p["vendor"] == "EXFO"
+    assert p["wavelength_nm"] == 1310.0
+    assert p["pulse_width_ns"] == 30
+    assert p["resolution_m"] == pytest.approx(0.5, abs=1e-4)
+    assert [e["distance_m"] for e in p["events"]] == pytest.approx([e["distance_m"] for e in EVENTS], abs=0.02)
+    # zero-copy view over the file bytes
+    assert p["points"].base is not None and not p["points"].flags.writeable
+    np.testing.assert_array_equal(p["points"], pts)
+    assert sor.trace_db(p)[100] == pytest.approx(-int(pts[100]) / 1000.0)
+
+
+def test_summary():
+    s = sor.summarize(sor.parse_sor(sor.build_sor(EVENTS, _trace(), end_to_end_loss_db=2.47, orl_db=38.2)))
+    assert s["total_loss_db"] == 2.47
+    assert s["event_count"] == 5
+    # non-reflective events before the end of fibre
+    assert s["max_splice_loss_db"] == 0.21
+    # worst reflectance among reflective events, including the far-end connector
+    assert s["back_reflection_db"] == -14.1
+    assert s["orl_db"] == 38.2
+    assert s["fiber_length_m"] == pytest.approx(6000.0, abs=0.02)
+
+
+def test_total_loss_falls_back_to_events():
+    s = sor.summarize(sor.parse_sor(sor.build_sor(EVENTS, _trace())))
+    # event losses before the end of fibre + 6 km at 0.2 dB/km
+    assert s["total_loss_db"] == pytest.approx(0.5 + 0.08 + 0.21 + 0.45 + 0.2 * 6.0, abs=0.01)
+
+
+def test_rejects_damaged_files():
+    data = sor.build_sor(EVENTS, _trace())
+    with pytest.raises(sor.SorError):
+        sor.parse_sor(data[: len(data) // 2])
+    bad = data.replace(b"KeyEvents\0" + struct.pack("<H", 5), b"KeyEventX\0" + struct.pack("<H", 5), 1)
+    with pytest.raises(sor.SorError, match="KeyEvents"):
+        sor.parse_sor(bad)
+
+
+def test_key_from_url():
+    bucket = sor.s3.settings.S3_BUCKET
+    assert sor.key_from_url(f"https://minio:9000/{bucket}/otdr/a/b.sor") == "otdr/a/b.sor"
+    assert sor.key_from_url("otdr/a/b.sor") == "otdr/a/b.sor"
+
+
+def test_parse_many_keeps_order_and_errors(monkeypatch):
+    files = {f"k{i}": sor.build_sor(EVENTS[: i + 2], _trace(100)) for i in range(3)}
+    files["bad"] = b"not a sor file"
+    monkeypatch.setattr(sor.s3, "get_object_bytes", files.__getitem__)
+    monkeypatch.setattr(sor, "OTDR_WORKERS", 0)
+    out = sor.parse_many(["k2", "bad", "k0"])
+    assert [r["s3_key"] for r in out] == ["k2", "bad", "k0"]
+    assert [r.get("event_count") for r in out] == [4, None, 2]
+    assert "error" in out[1]
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers.splices import BulkIn, add_splices_bulk
+
+
+TRAY_A = "00000000-0000-0000-0000-00000000000a"
+TRAY_B = "00000000-0000-0000-0000-00000000000b"
+
+
+@pytest.fixture
+def tray_db(fake_db):
+    """Trays {id: (fiber_start, fiber_end)} and cores already recorded [(tray_id, core)]."""
+
+    def make(trays, recorded=()):
+        def respond(sql, params):
+            if "from splice_trays" in sql and "for update" in sql:
+                return [SimpleNamespace(id=t, fiber_start=fs, fiber_end=fe) for t, (fs, fe) in trays.items() if t in params["ids"]]
+            if sql.startswith("select tray_id"):
+                return [SimpleNamespace(tray_id=t, core=c) for t, c in recorded]
+            return None
+
+        return fake_db(respond)
+
+    return make
+
+
+def _payload(trays):
+    return BulkIn(trays=[{"tray_id": t, "tech_id": None, "splices": [{"core": c, "loss_db": 0.05} for c in cores]} for t, cores in trays])
+
+
+def test_bulk_inserts_all_cores_in_one_statement(tray_db):
+    db = tray_db({TRAY_A: (1, 12), TRAY_B: (13, 24)})
+    out = add_splices_bulk(_payload([(TRAY_A, range(1, 13)), (TRAY_B, range(13, 25))]), db)
+    assert out["inserted"] == 24 and out["trays"] == 2 and len(out["ids"]) == 24
+    writes = db.writes()
+    assert len(writes) == 2
+    insert, update = writes
+    assert "unnest(" in insert[0] and insert[1]["c"] == list(range(1, 25))
+    assert "splices_done" in update[0] and update[1]["t"].count(TRAY_B) == 12
+    assert db.commits == 1
+
+
+def test_bulk_rejects_whole_request_on_bad_cores(tray_db):
+    db = tray_db({TRAY_A: (1, 12)}, recorded=[(TRAY_A, 3)])
+    payload = BulkIn(trays=[{"tray_id": TRAY_A, "splices": [{"core": 2}, {"core": 2}, {"core": 3}, {"core": 13}]}])
+    with pytest.raises(HTTPException) as e:
+        add_splices_bulk(payload, db)
+    assert e.value.status_code == 422
+    assert [(x["core"], x["error"]) for x in e.value.detail["errors"]] == [
+        (2, "duplicate core in request"), (3, "core already recorded"), (13, "outside fibres 1-12"),
+    ]
+    assert db.rollbacks and not db.commits
+    assert not db.writes("insert")
+
+
+def test_bulk_unknown_tray(tray_db):
+    with pytest.raises(HTTPException) as e:
+        add_splices_bulk(_payload([(TRAY_B, [1])]), tray_db({TRAY_A: (None, None)}))
+    assert e.value.status_code == 404
+
+
+def test_bulk_accepts_tray_ids_in_any_case(tray_db):
+    db = tray_db({TRAY_A: (1, 12)}, recorded=[(TRAY_A, 3)])
+    with pytest.raises(HTTPException) as e:
+        add_splices_bulk(_payload([(TRAY_A.upper(), [3])]), db)
+    # Checked against the stored tray, not reported missing
+    assert e.value.status_code == 422 and e.value.detail["errors"][0]["tray_id"] == TRAY_A
+
+    out = add_splices_bulk(_payload([(TRAY_A.upper(), [1]), ("{%s}" % TRAY_A, [2])]), tray_db({TRAY_A: (1, 12)}))
+    assert out["trays"] == 1 and out["inserted"] == 2
+
+
+def test_bulk_invalid_tray_id(tray_db):
+    db = tray_db({TRAY_A: (1, 12)})
+    with pytest.raises(HTTPException) as e:
+        add_splices_bulk(_payload([(TRAY_A, [1]), ("tray-7", [1])]), db)
+    assert e.value.status_code == 422 and "tray-7" in e.value.detail
+    assert db.statements == []